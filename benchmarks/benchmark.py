@@ -0,0 +1,231 @@
+# Benchmark suite for the Portfolio hot paths
+#
+# Times signOff, rebalance, performanceSummary, the getHistorical* accessors and full
+# backtest loops (datadump on and off) on synthetic price panels of varying width, history
+# length and rebalance frequency, and records peak memory of the full loops.
+#
+#   python benchmarks/benchmark.py --output results.json
+#   python benchmarks/benchmark.py --assets 10,100 --years 1,5 --baseline baseline.json
+#
+# Comparing against a baseline reports per-case slowdowns and the change in the scaling
+# exponent of time against history length, so an O(N^2) regression shows up even when
+# small cases are still fast. Full loops are timed as the best of --repeat runs and exponents
+# are only fitted on at least three history lengths, with timings under --min-seconds left out
+# on both sides, so a tree compared against itself reports no regression.
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import quantbt
+from quantbt import Portfolio, performanceSummary
+
+rebalanceFrequencies = {
+    'daily'   : 1,
+    'weekly'  : 5,
+    'monthly' : 21
+}
+
+def makePrices(numAssets,numDays,seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range('1990-01-01',periods=numDays)
+    returns = rng.normal(0.0002,0.015,(numDays,numAssets))
+    return pd.DataFrame(100 * np.exp(np.cumsum(returns,axis=0)),index=dates,columns=[f'A{i}' for i in range(numAssets)])
+
+def makeWeights(numAssets,numDays,seed=1):
+    rng = np.random.default_rng(seed)
+    return rng.normal(1/numAssets,0.5/numAssets,(numDays,numAssets))
+
+def makePortfolio(assets,folder,datadump=False,datadumpFormat='json'):
+    port = Portfolio({},1_000_000.0,name='benchmark',datadump=datadump,backtestFolderName=folder)
+    port.setAssetUniverse(assets)
+    port.setFixedTransactionCosts({asset:0.0001 for asset in assets})
+    port.setBorrowCosts({asset:0.004 for asset in assets})
+    port.setAnnualManagementFee(0.01)
+    if datadump:
+        port.setDatadumpFormat(datadumpFormat)
+    return port
+
+def runLoop(port,dates,priceRows,weightRows,every):
+    for i,date in enumerate(dates):
+        if i % every == 0:
+            port.rebalance(weightRows[i],priceRows[i],date)
+        port.signOff(date,priceRows[i])
+    port.closeJournal()
+    return port
+
+def timeCall(function,repeat=5):
+    # Best of several runs, to keep scheduler noise out of short timings
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def timeLoop(makePort,dates,priceRows,weightRows,every,repeat):
+    # Peak memory from one traced run, time as the best of repeat untraced runs
+    tracemalloc.start()
+    runLoop(makePort(),dates,priceRows,weightRows,every)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    timings = []
+    for _ in range(repeat):
+        port = makePort()
+        start = time.perf_counter()
+        runLoop(port,dates,priceRows,weightRows,every)
+        timings.append(time.perf_counter() - start)
+    return [port,min(timings),peak]
+
+def benchmarkCase(numAssets,years,frequency,folder,datadumpFormats,repeat=3):
+    numDays = int(years * 260)
+    every = rebalanceFrequencies[frequency]
+
+    prices = makePrices(numAssets,numDays)
+    assets = list(prices.columns)
+    dates = list(prices.index)
+    priceRows = prices.to_numpy()
+    weightRows = makeWeights(numAssets,numDays)
+
+    case = {'assets' : numAssets,'years' : years,'days' : numDays,'frequency' : frequency}
+    results = []
+
+    def record(entry,seconds,peakBytes=None,calls=1):
+        results.append({**case,'entry' : entry,'seconds' : seconds,'perCall' : seconds / calls,'calls' : calls,'peakBytes' : peakBytes})
+
+    # Full loop with datadump off
+    port,elapsed,peak = timeLoop(lambda: makePortfolio(assets,folder),dates,priceRows,weightRows,every,repeat)
+    record('backtest',elapsed,peak)
+
+    # Full loop with datadump on, one run per format
+    for datadumpFormat in datadumpFormats:
+        _,elapsed,peak = timeLoop(lambda: makePortfolio(assets,folder,True,datadumpFormat),dates,priceRows,weightRows,every,repeat)
+        record(f'backtest[datadump={datadumpFormat}]',elapsed,peak)
+
+    # Individual entry points on the finished portfolio, so that any per-call cost
+    # that grows with the history length shows up in the scaling curve
+    calls = 50
+    extraDates = pd.bdate_range(dates[-1] + pd.offsets.BDay(),periods=calls)
+    start = time.perf_counter()
+    for i in range(calls):
+        port.rebalance(weightRows[i],priceRows[-1],extraDates[i])
+    record('rebalance',time.perf_counter() - start,calls=calls)
+
+    start = time.perf_counter()
+    for i in range(calls):
+        port.signOff(extraDates[i],priceRows[-1])
+    record('signOff',time.perf_counter() - start,calls=calls)
+
+    record('performanceSummary',timeCall(lambda: performanceSummary(
+        port.historicalNAV,
+        port.historicalWeights,
+        port.historicalPositions,
+        port.historicalTCosts,
+        port.historicalSlippageCosts)))
+
+    for accessor in ['getHistoricalNAV','getHistoricalPositions','getHistoricalWeights','getHistoricalCash']:
+        record(accessor,timeCall(getattr(port,accessor)))
+
+    return results
+
+def scalingExponents(results,minSeconds=0.0,minLengths=3):
+    # Slope of log(time) against log(history length) per entry, width and frequency
+    # Timings below minSeconds are left out as noise, and a slope needs minLengths history lengths
+    groups = dict()
+    for result in results:
+        key = (result['entry'],result['assets'],result['frequency'])
+        groups.setdefault(key,[]).append((result['days'],result['seconds']))
+
+    exponents = dict()
+    for key,points in groups.items():
+        points = [(days,seconds) for days,seconds in points if seconds > 0 and seconds >= minSeconds]
+        if len(set(days for days,_ in points)) >= minLengths:
+            x,y = np.log([p[0] for p in points]),np.log([p[1] for p in points])
+            exponents[key] = float(np.polyfit(x,y,1)[0])
+    return exponents
+
+def compareToBaseline(results,baseline,slowdown,exponentDrift,minSeconds):
+    regressions = []
+
+    def caseKey(result):
+        return (result['entry'],result['assets'],result['years'],result['frequency'])
+
+    baselineResults = {caseKey(result) : result for result in baseline['results']}
+    for result in results:
+        old = baselineResults.get(caseKey(result))
+        # Timings below the noise floor are too short to compare
+        if old is None or max(old['seconds'],result['seconds']) < minSeconds:
+            continue
+        if old['seconds'] > 0 and result['seconds'] / old['seconds'] > slowdown:
+            regressions.append(f'{caseKey(result)}: {old["seconds"]:.4f}s -> {result["seconds"]:.4f}s')
+
+    oldExponents = scalingExponents(baseline['results'],minSeconds)
+    for key,exponent in scalingExponents(results,minSeconds).items():
+        if key in oldExponents and exponent - oldExponents[key] > exponentDrift:
+            regressions.append(f'{key}: scaling exponent {oldExponents[key]:.2f} -> {exponent:.2f}')
+
+    return regressions
+
+def parseList(text,cast):
+    return [cast(value) for value in text.split(',') if value != '']
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the quantbt Portfolio hot paths')
+    parser.add_argument('--assets',default='10,100,1000,5000',help='comma separated panel widths')
+    parser.add_argument('--years',default='1,5,10,30',help='comma separated history lengths in years of daily bars')
+    parser.add_argument('--frequencies',default='daily,weekly,monthly',help=f'rebalance frequencies from {",".join(rebalanceFrequencies)}')
+    parser.add_argument('--datadump',default='json,jsonl',help='datadump formats to benchmark, empty to skip')
+    parser.add_argument('--output',default='benchmark-results.json')
+    parser.add_argument('--baseline',default=None,help='results file to compare against')
+    parser.add_argument('--slowdown',type=float,default=1.5,help='per case slowdown ratio reported as a regression')
+    parser.add_argument('--exponent-drift',type=float,default=0.3,help='scaling exponent increase reported as a regression')
+    parser.add_argument('--min-seconds',type=float,default=0.01,help='timings below this are not compared')
+    parser.add_argument('--repeat',type=int,default=3,help='full backtest loops are timed as the best of this many runs')
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        for numAssets in parseList(args.assets,int):
+            for years in parseList(args.years,float):
+                for frequency in parseList(args.frequencies,str):
+                    caseResults = benchmarkCase(numAssets,years,frequency,folder,parseList(args.datadump,str),args.repeat)
+                    results.extend(caseResults)
+                    print(f'assets={numAssets} years={years:g} rebalance={frequency}: backtest {caseResults[0]["seconds"]:.3f}s, peak {caseResults[0]["peakBytes"] / 1e6:.1f}MB')
+
+    output = {
+        'meta' : {
+            'python'   : platform.python_version(),
+            'numpy'    : np.__version__,
+            'pandas'   : pd.__version__,
+            'platform' : platform.platform(),
+            'created'  : time.strftime('%Y-%m-%dT%H:%M:%S')
+        },
+        'results'   : results,
+        'exponents' : [{'entry' : key[0],'assets' : key[1],'frequency' : key[2],'exponent' : value} for key,value in scalingExponents(results,args.min_seconds).items()]
+    }
+
+    with open(args.output,'w') as fd:
+        json.dump(output,fd,indent=2)
+    print(f'Results written to {args.output}')
+
+    if args.baseline is not None:
+        with open(args.baseline) as fd:
+            regressions = compareToBaseline(results,json.load(fd),args.slowdown,args.exponent_drift,args.min_seconds)
+
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if len(regressions) > 0:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+# Import time benchmark
+#
+# Times `import quantbt` in fresh interpreters, next to a bare `import numpy, pandas` baseline,
+# and checks that the optional plotting and data vendor dependencies are not loaded at import.
+#
+#   python benchmarks/import_time.py --output import-results.json
+#   python benchmarks/import_time.py --baseline import-results.json
+#
+# Exits with status 1 when a deferred dependency is imported eagerly, or when the quantbt
+# overhead on top of numpy and pandas grows past the allowed slowdown of the baseline.
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+
+import numpy as np
+import pandas as pd
+
+repoFolder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Prints the import wall time and which of the given modules ended up loaded
+timingScript = '''
+import sys,time,json
+start = time.perf_counter()
+import {modules}
+seconds = time.perf_counter() - start
+print(json.dumps({{'seconds' : seconds,'loaded' : sorted(m for m in {deferred!r} if m in sys.modules)}}))
+'''
+
+def timeImport(modules,deferred):
+    script = timingScript.format(modules=modules,deferred=deferred)
+    env = dict(os.environ,PYTHONPATH=repoFolder + os.pathsep + os.environ.get('PYTHONPATH',''))
+    output = subprocess.run([sys.executable,'-c',script],capture_output=True,text=True,check=True,env=env,cwd=repoFolder)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+def benchmarkImports(repeat,deferred):
+    # Medians over several fresh interpreters, the first run also warms the bytecode cache
+    timeImport('quantbt',deferred)
+
+    baseline = [timeImport('numpy,pandas',deferred)['seconds'] for _ in range(repeat)]
+    runs = [timeImport('quantbt',deferred) for _ in range(repeat)]
+    seconds = [run['seconds'] for run in runs]
+
+    return {
+        'baselineSeconds' : float(np.median(baseline)),
+        'quantbtSeconds'  : float(np.median(seconds)),
+        'overheadSeconds' : float(np.median(seconds) - np.median(baseline)),
+        'loaded'          : sorted(set(module for run in runs for module in run['loaded']))
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the import time of quantbt')
+    parser.add_argument('--repeat',type=int,default=7,help='fresh interpreters per measurement')
+    parser.add_argument('--deferred',default='matplotlib,yfinance,requests',help='comma separated modules that must not load on import')
+    parser.add_argument('--output',default='import-results.json')
+    parser.add_argument('--baseline',default=None,help='results file to compare against')
+    parser.add_argument('--slowdown',type=float,default=1.5,help='overhead ratio reported as a regression')
+    parser.add_argument('--min-seconds',type=float,default=0.05,help='overheads below this are not compared')
+    args = parser.parse_args()
+
+    deferred = [module for module in args.deferred.split(',') if module != '']
+    result = benchmarkImports(args.repeat,deferred)
+
+    print(f'import numpy,pandas {result["baselineSeconds"]:.3f}s, import quantbt {result["quantbtSeconds"]:.3f}s (overhead {result["overheadSeconds"]:.3f}s)')
+
+    output = {
+        'meta' : {
+            'python'   : platform.python_version(),
+            'numpy'    : np.__version__,
+            'pandas'   : pd.__version__,
+            'platform' : platform.platform(),
+            'created'  : time.strftime('%Y-%m-%dT%H:%M:%S')
+        },
+        'result' : result
+    }
+
+    with open(args.output,'w') as fd:
+        json.dump(output,fd,indent=2)
+    print(f'Results written to {args.output}')
+
+    regressions = [f'{module} is imported by import quantbt' for module in result['loaded']]
+
+    if args.baseline is not None:
+        with open(args.baseline) as fd:
+            old = json.load(fd)['result']
+
+        # Overheads below the noise floor are too short to compare
+        if max(old['overheadSeconds'],result['overheadSeconds']) >= args.min_seconds and result['overheadSeconds'] > args.slowdown * max(old['overheadSeconds'],0.0):
+            regressions.append(f'import overhead {old["overheadSeconds"]:.3f}s -> {result["overheadSeconds"]:.3f}s')
+
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+    if len(regressions) > 0:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
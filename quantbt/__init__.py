@@ -1,3 +1,17 @@
 from .portfolio import *
 from .analytics import *
-from .data import *
\ No newline at end of file
+from .data import *
+from .engine import *
+from .sweep import *
+from .signals import *
+from .schedule import *
+from .book import *
+from .costs import *
+from .checkpoint import *
+from .loader import *
+from .resampling import *
+from .plotting import *
+from .streaming import *
+from .ledger import *
+from .catalog import *
+from .memo import *
\ No newline at end of file
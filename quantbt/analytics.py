@@ -1,6 +1,48 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
+
+from .history import *
+from .plotting import *
+
+# Per-asset history as a (dates x assets) array, NaN where an asset is not held
+# Accepts a MatrixView (read straight from its store), a DataFrame, a {date : {asset : value}}
+# dictionary or an array; columns reorders DataFrames and dictionaries to a given asset list
+def historyToMatrix(history,columns=None):
+    if isinstance(history,MatrixView):
+        return [list(history.store.assets),history.store.getMatrix(history.name)]
+    elif isinstance(history,np.ndarray):
+        return [columns,history.astype(np.float64)]
+
+    if not isinstance(history,pd.DataFrame):
+        history = pd.DataFrame.from_dict(dict(history),orient='index')
+    if columns is not None:
+        history = history.reindex(columns=columns)
+    return [list(history.columns),history.to_numpy(dtype=np.float64)]
+
+# One-way turnover traded on every date, as a fraction of NAV (the first date is 0)
+# With positions, the traded value is read from the change in units, so price drift between two
+# dates is not counted as trading: |w_t * (q_t - q_t-1) / q_t|, or the previous weight for an
+# asset sold out. Without positions it falls back to |w_t - w_t-1|.
+# Do not account for funding the portfolio: dates following an empty portfolio are 0.
+def turnoverSeries(weights,positions=None):
+    weights = np.nan_to_num(np.atleast_2d(weights))
+    previousWeights = np.vstack([np.zeros((1,weights.shape[1])),weights[:-1]])
+
+    if positions is None:
+        traded = np.abs(weights - previousWeights)
+    else:
+        positions = np.nan_to_num(np.atleast_2d(positions))
+        previousPositions = np.vstack([np.zeros((1,positions.shape[1])),positions[:-1]])
+        held = positions != 0
+        with np.errstate(invalid='ignore',divide='ignore'):
+            traded = np.where(held,np.abs(weights * (positions - previousPositions) / np.where(held,positions,1.0)),np.abs(previousWeights))
+
+    funded = np.abs(previousWeights).sum(axis=1) > 0
+    return np.where(funded,0.5 * traded.sum(axis=1),0.0)
+
+# Sum of absolute weights on every date
+def grossLeverageSeries(weights):
+    return np.abs(np.nan_to_num(np.atleast_2d(weights))).sum(axis=1)
 
 def performanceSummary(
     historicalNAV,
@@ -66,9 +108,18 @@ def performanceSummary(
     # Latest Cumulative Transaction Costs
     cumulativeTCost = list(historicalTCosts.values())[-1]
     
-    # Turnover
+    if len(historicalWeights) > 0:
+        assets,weights = historyToMatrix(historicalWeights)
+        positions = historyToMatrix(historicalPositions,assets)[1] if len(historicalPositions) > 0 else None
+
+        # Turnover, annualized one-way traded fraction of NAV
+        turnover = turnoverSeries(weights,positions).sum() / yearFraction
 
-    # Gross Leverage
+        # Gross Leverage, average sum of absolute weights
+        grossLeverage = grossLeverageSeries(weights).mean()
+    else:
+        turnover = np.nan
+        grossLeverage = np.nan
 
     stats = {
         'Annual Returns'           : annReturns,
@@ -78,19 +129,383 @@ def performanceSummary(
         'Maximum Drawdown'         : maxdrawdown,
         'Sortino Ratio'            : sortinoRatio,
         'Calmar Ratio'             : calmarRatio,
-        'Total Transaction Costs'  : cumulativeTCost
+        'Total Transaction Costs'  : cumulativeTCost,
+        'Turnover'                 : turnover,
+        'Gross Leverage'           : grossLeverage
     }
 
     return stats
 
-def getNAVPlot(port):
-    nav = port.getHistoricalNAV()
-    name = port.getPortfolioName()
-    fig = nav.plot(figsize=(7.5,5),title=name)
-    return fig
+# performanceSummary computed column-wise over many NAV paths at once
+# navPaths is a (paths x dates) matrix sharing the given dates; returns {statistic : array over paths}
+# Transaction costs are not part of a NAV path and are left out
+def pathPerformanceSummary(navPaths,dates):
+    navPaths = np.asarray(navPaths,dtype=np.float64)
+    numPaths,numDates = navPaths.shape
+    returns = np.diff(navPaths,axis=1) / navPaths[:,:-1]
+
+    # Annualized Volatility
+    if returns.shape[1] > 1:
+        annVolatility = returns.std(axis=1) * np.sqrt(260)
+    else:
+        annVolatility = np.full(numPaths,np.nan)
+
+    # Year Fraction (Add a tiny number to prevent divide by zero error)
+    yearFraction = (pd.Timestamp(dates[-1]) - pd.Timestamp(dates[0])).days / 365 + np.finfo(float).eps
+
+    # Annualized and Cumulative Returns
+    annReturns = (navPaths[:,-1] / navPaths[:,0]) ** (1/yearFraction) - 1
+    cumReturns = (navPaths[:,-1] / navPaths[:,0]) - 1
+
+    # Annualized Sharpe Ratio
+    annSharpe = annReturns / ( annVolatility + np.finfo(float).eps )
+
+    # Maximum Drawdown, measured from the running peak at the first deepest (absolute) drawdown
+    peaks = np.maximum.accumulate(navPaths,axis=1)
+    maxdrawdownEnd = np.argmax(peaks - navPaths,axis=1)
+    rows = np.arange(numPaths)
+    maxdrawdown = navPaths[rows,maxdrawdownEnd] / peaks[rows,maxdrawdownEnd] - 1
+
+    # Downside volatility, population standard deviation of the negative returns only
+    isDownside = returns < 0
+    downsideCount = isDownside.sum(axis=1)
+    with np.errstate(invalid='ignore',divide='ignore'):
+        downsideMean = np.where(isDownside,returns,0.0).sum(axis=1) / downsideCount
+        downsideVariance = np.where(isDownside,(returns - downsideMean[:,None]) ** 2,0.0).sum(axis=1) / downsideCount
+    downsideVolatility = np.where(downsideCount > 0,np.sqrt(downsideVariance) * np.sqrt(260),np.nan)
+
+    # Sortino and Calmar Ratios
+    sortinoRatio = annReturns / (downsideVolatility + np.finfo(float).eps)
+    calmarRatio = annReturns / (maxdrawdown + np.finfo(float).eps)
+
+    return {
+        'Annual Returns'           : annReturns,
+        'Annual Volatility'        : annVolatility,
+        'Sharpe Ratio'             : annSharpe,
+        'Cumulative Return'        : cumReturns,
+        'Maximum Drawdown'         : maxdrawdown,
+        'Sortino Ratio'            : sortinoRatio,
+        'Calmar Ratio'             : calmarRatio
+    }
+
+# Expanding or rolling performanceSummary statistics over a (dates x portfolios) NAV panel
+# nav is a DataFrame, or a 2-D array with its dates (without dates a year is 260 rows).
+# window=None gives expanding statistics, the last row of which is performanceSummary of each
+# column; an integer window gives the statistics of the trailing window NAV observations.
+# Moments come from cumulative sums of (column centered) returns and squared returns, drawdowns
+# from running maxima, so every column and date is computed at once.
+# Returns {statistic : (dates x portfolios) DataFrame}. NAV columns are expected to be complete.
+def rollingPerformance(nav,window=None,dates=None):
+    if isinstance(nav,pd.DataFrame):
+        dates,columns,values = nav.index,nav.columns,nav.to_numpy(dtype=np.float64)
+    else:
+        values = np.asarray(nav,dtype=np.float64)
+        values = values[:,None] if values.ndim == 1 else values
+        columns = pd.RangeIndex(values.shape[1])
+
+    numDates = values.shape[0]
+    if window is not None and (window < 2 or window > numDates):
+        raise Exception('ERROR: Rolling window must span between 2 and the number of NAV observations')
+
+    # Window start row of every date
+    rows = np.arange(numDates)
+    starts = np.zeros(numDates,dtype=np.int64) if window is None else np.maximum(rows - window + 1,0)
+
+    # Year Fraction (Add a tiny number to prevent divide by zero error)
+    if dates is not None:
+        nanoseconds = pd.DatetimeIndex(dates).as_unit('ns').asi8
+        yearFraction = ((nanoseconds - nanoseconds[starts]) // (86_400 * 10**9)) / 365 + np.finfo(float).eps
+    else:
+        yearFraction = (rows - starts) / 260 + np.finfo(float).eps
+    yearFraction = yearFraction[:,None]
+
+    # Annualized and Cumulative Returns
+    firstNAV = values[starts]
+    annReturns = (values / firstNAV) ** (1/yearFraction) - 1
+    cumReturns = (values / firstNAV) - 1
+
+    # Running return and downside moments, windows are differences of cumulative sums
+    # Returns are centered on their column mean first to keep the variance well conditioned
+    # The return into the first row of a window belongs to the previous NAV and is left out
+    returns = np.zeros_like(values)
+    returns[1:] = np.diff(values,axis=0) / values[:-1]
+    returnMask = np.broadcast_to(rows[:,None] > 0,values.shape)
+    isDownside = returns < 0
+
+    def windowSums(x):
+        sums = np.cumsum(x,axis=0)
+        return sums - sums[starts]
+
+    def windowVariance(mask,count):
+        center = (returns * mask).sum(axis=0) / np.maximum(mask.sum(axis=0),1)
+        centered = np.where(mask,returns - center,0.0)
+        with np.errstate(invalid='ignore',divide='ignore'):
+            return np.maximum(windowSums(centered ** 2) / count - (windowSums(centered) / count) ** 2,0.0)
+
+    returnCount = np.broadcast_to((rows - starts)[:,None],values.shape)
+    downsideCount = windowSums(isDownside.astype(np.float64))
+
+    annVolatility = np.where(returnCount > 1,np.sqrt(windowVariance(returnMask,returnCount)) * np.sqrt(260),np.nan)
+    downsideVolatility = np.where(downsideCount > 0,np.sqrt(windowVariance(isDownside,downsideCount)) * np.sqrt(260),np.nan)
+
+    # Annualized Sharpe and Sortino Ratios
+    annSharpe = annReturns / ( annVolatility + np.finfo(float).eps )
+    sortinoRatio = annReturns / (downsideVolatility + np.finfo(float).eps)
+
+    # Drawdown from the running peak and Maximum Drawdown, measured at the first deepest
+    # (absolute) drawdown as in performanceSummary
+    if window is None:
+        peaks = np.maximum.accumulate(values,axis=0)
+        drawdown = values / peaks - 1
+        absoluteDrawdown = peaks - values
+        deepest = np.maximum.accumulate(absoluteDrawdown,axis=0)
+        isDeeper = np.zeros(values.shape,dtype=bool)
+        isDeeper[1:] = absoluteDrawdown[1:] > deepest[:-1]
+        deepestRow = np.maximum.accumulate(np.where(isDeeper,rows[:,None],0),axis=0)
+        maxdrawdown = np.take_along_axis(drawdown,deepestRow,axis=0)
+    else:
+        drawdown = np.full(values.shape,np.nan)
+        maxdrawdown = np.full(values.shape,np.nan)
+        windows = np.lib.stride_tricks.sliding_window_view(values,window,axis=0)
+
+        # Bounded (windows x portfolios x window) chunks
+        chunkSize = max(1,2**22 // (window * values.shape[1]))
+        for start in range(0,len(windows),chunkSize):
+            chunk = windows[start:start + chunkSize]
+            peaks = np.maximum.accumulate(chunk,axis=2)
+            deepestRow = np.argmax(peaks - chunk,axis=2)[:,:,None]
+            end = start + window - 1
+            maxdrawdown[end:end + len(chunk)] = (np.take_along_axis(chunk,deepestRow,axis=2) / np.take_along_axis(peaks,deepestRow,axis=2))[:,:,0] - 1
+            drawdown[end:end + len(chunk)] = chunk[:,:,-1] / peaks[:,:,-1] - 1
+
+    # Calmar Ratio
+    calmarRatio = annReturns / (maxdrawdown + np.finfo(float).eps)
+
+    stats = {
+        'Annual Returns'           : annReturns,
+        'Annual Volatility'        : annVolatility,
+        'Sharpe Ratio'             : annSharpe,
+        'Cumulative Return'        : cumReturns,
+        'Drawdown'                 : drawdown,
+        'Maximum Drawdown'         : maxdrawdown,
+        'Sortino Ratio'            : sortinoRatio,
+        'Calmar Ratio'             : calmarRatio
+    }
+
+    # Dates before the first full window are left undefined
+    if window is not None:
+        for name in stats:
+            stats[name][:window - 1] = np.nan
+
+    index = dates if dates is not None else pd.RangeIndex(numDates)
+    return {name : pd.DataFrame(value,index=index,columns=columns) for name,value in stats.items()}
+
+def expandingPerformance(nav,dates=None):
+    return rollingPerformance(nav,None,dates)
+
+# Chan et al. merge of running (count, mean, M2) moments with a batch of new observations
+def mergeMoments(count,mean,M2,values):
+    if len(values) == 0:
+        return count,mean,M2
+
+    batchMean = values.mean()
+    batchM2 = ((values - batchMean) ** 2).sum()
+    total = count + len(values)
+    delta = batchMean - mean
+
+    return total,mean + delta * len(values) / total,M2 + batchM2 + delta * delta * count * len(values) / total
+
+# Incremental version of performanceSummary, updated in constant time per observation
+class PerformanceAccumulator:
+    def __init__(self):
+        self.count = 0
+        self.firstDate = None
+        self.lastDate = None
+        self.firstNAV = np.nan
+        self.lastNAV = np.nan
+
+        # Welford running moments of daily returns
+        self.returnCount = 0
+        self.returnMean = 0.0
+        self.returnM2 = 0.0
+
+        # Welford running moments of negative daily returns
+        self.downsideCount = 0
+        self.downsideMean = 0.0
+        self.downsideM2 = 0.0
+
+        # Running peak and maximum (absolute) drawdown window
+        self.peakNAV = np.nan
+        self.maxDrawdownValue = 0.0
+        self.maxDrawdownStartNAV = np.nan
+        self.maxDrawdownEndNAV = np.nan
+
+        # Latest cumulative transaction costs
+        self.cumulativeTCost = 0.0
+
+        # Running turnover and gross leverage sums, with the latest weights and positions to
+        # measure the next trade against
+        self.turnoverSum = 0.0
+        self.grossLeverageSum = 0.0
+        self.leverageCount = 0
+        self.lastWeights = None
+        self.lastPositions = None
+
+    def updateTrading(self,weights,positions=None):
+        # weights and positions are (dates x assets) blocks, the universe may have grown since the last block
+        weights = np.atleast_2d(weights)
+        numAssets = weights.shape[1]
+
+        def previousRow(last):
+            row = np.full((1,numAssets),np.nan)
+            if last is not None:
+                row[0,:len(last)] = last
+            return row
+
+        if positions is not None:
+            positions = np.atleast_2d(positions)
+            positions = np.vstack([previousRow(self.lastPositions),positions])
+
+        self.turnoverSum += float(turnoverSeries(np.vstack([previousRow(self.lastWeights),weights]),positions)[1:].sum())
+        self.grossLeverageSum += float(grossLeverageSeries(weights).sum())
+        self.leverageCount += len(weights)
+
+        self.lastWeights = weights[-1].copy()
+        self.lastPositions = positions[-1].copy() if positions is not None else None
+
+    def update(self,date,nav,cumulativeTCost):
+        if self.count == 0:
+            self.firstDate = date
+            self.firstNAV = nav
+            self.peakNAV = nav
+            self.maxDrawdownStartNAV = nav
+            self.maxDrawdownEndNAV = nav
+        else:
+            ret = (nav - self.lastNAV) / self.lastNAV
+
+            self.returnCount += 1
+            delta = ret - self.returnMean
+            self.returnMean += delta / self.returnCount
+            self.returnM2 += delta * (ret - self.returnMean)
+
+            if ret < 0:
+                self.downsideCount += 1
+                delta = ret - self.downsideMean
+                self.downsideMean += delta / self.downsideCount
+                self.downsideM2 += delta * (ret - self.downsideMean)
+
+            # Strict comparisons keep the first occurrence, as np.argmax does
+            if nav > self.peakNAV:
+                self.peakNAV = nav
+
+            drawdown = self.peakNAV - nav
+            if drawdown > self.maxDrawdownValue:
+                self.maxDrawdownValue = drawdown
+                self.maxDrawdownStartNAV = self.peakNAV
+                self.maxDrawdownEndNAV = nav
+
+        self.count += 1
+        self.lastDate = date
+        self.lastNAV = nav
+        self.cumulativeTCost = cumulativeTCost
+
+    def updateBlock(self,dates,navs,cumulativeTCosts):
+        # Same state as calling update once per row, with the block folded in using array operations
+        navs = np.asarray(navs,dtype=np.float64)
+        if len(navs) == 0:
+            return
+
+        if self.count == 0:
+            self.update(dates[0],float(navs[0]),cumulativeTCosts[0])
+            dates,navs,cumulativeTCosts = dates[1:],navs[1:],cumulativeTCosts[1:]
+            if len(navs) == 0:
+                return
+
+        previous = np.concatenate([[self.lastNAV],navs[:-1]])
+        returns = (navs - previous) / previous
+
+        self.returnCount,self.returnMean,self.returnM2 = mergeMoments(self.returnCount,self.returnMean,self.returnM2,returns)
+        self.downsideCount,self.downsideMean,self.downsideM2 = mergeMoments(self.downsideCount,self.downsideMean,self.downsideM2,returns[returns < 0])
+
+        peaks = np.maximum.accumulate(np.concatenate([[self.peakNAV],navs]))[1:]
+        drawdowns = peaks - navs
+        worst = np.argmax(drawdowns)
+        if drawdowns[worst] > self.maxDrawdownValue:
+            self.maxDrawdownValue = float(drawdowns[worst])
+            self.maxDrawdownStartNAV = float(peaks[worst])
+            self.maxDrawdownEndNAV = float(navs[worst])
+        self.peakNAV = float(peaks[-1])
+
+        self.count += len(navs)
+        self.lastDate = dates[-1]
+        self.lastNAV = float(navs[-1])
+        self.cumulativeTCost = cumulativeTCosts[-1]
+
+    def getStatistics(self):
+        # Annualized Volatility
+        if self.returnCount > 1:
+            annVolatility = np.sqrt(self.returnM2 / self.returnCount) * np.sqrt(260)
+        else:
+            annVolatility = np.nan
+
+        # Year Fraction (Add a tiny number to prevent divide by zero error)
+        yearFraction = (self.lastDate - self.firstDate).days / 365 + np.finfo(float).eps
+
+        # Annualized Returns
+        annReturns = (self.lastNAV / self.firstNAV) ** (1/yearFraction) - 1
+
+        # Cumulative Returns
+        cumReturns = (self.lastNAV / self.firstNAV) - 1
+
+        # Annualized Sharpe Ratio (Add a tiny number to prevent divide by zero error)
+        annSharpe = annReturns / ( annVolatility + np.finfo(float).eps )
+
+        # Maximum Drawdown
+        maxdrawdown = self.maxDrawdownEndNAV / self.maxDrawdownStartNAV - 1
+
+        # Downside volatility
+        if self.downsideCount > 0:
+            downsideVolatility = np.sqrt(self.downsideM2 / self.downsideCount) * np.sqrt(260)
+        else:
+            downsideVolatility = np.nan
+
+        # Sortino Ratio
+        sortinoRatio = annReturns / (downsideVolatility + np.finfo(float).eps)
+
+        # Calmar Ratio
+        calmarRatio = annReturns / (maxdrawdown + np.finfo(float).eps)
+
+        # Turnover and Gross Leverage
+        if self.leverageCount > 0:
+            turnover = self.turnoverSum / yearFraction
+            grossLeverage = self.grossLeverageSum / self.leverageCount
+        else:
+            turnover = np.nan
+            grossLeverage = np.nan
+
+        stats = {
+            'Annual Returns'           : annReturns,
+            'Annual Volatility'        : annVolatility,
+            'Sharpe Ratio'             : annSharpe,
+            'Cumulative Return'        : cumReturns,
+            'Maximum Drawdown'         : maxdrawdown,
+            'Sortino Ratio'            : sortinoRatio,
+            'Calmar Ratio'             : calmarRatio,
+            'Total Transaction Costs'  : self.cumulativeTCost,
+            'Turnover'                 : turnover,
+            'Gross Leverage'           : grossLeverage
+        }
+
+        return stats
+
+# Plots are drawn from the history store arrays, downsampled to the figure width (see plotting)
+# Weight plots show the top assets by average absolute weight, the rest summed as Other
+def getNAVPlot(port,points=None,method='minmax',figsize=(7.5,5)):
+    history = port.history
+    return plotHistory(history.getDateIndex('Dates'),history.getSeries('NAV'),[port.getPortfolioName()],port.getPortfolioName(),points,method,figsize)
 
-def getWeightsPlot(port):
-    wgt = port.getHistoricalWeights()
+def getWeightsPlot(port,top=10,points=None,method='minmax',figsize=(7.5,5)):
+    history = port.history
     name = port.getPortfolioName()
-    fig = wgt.plot(figsize=(7.5,5),title=f'{name} Weights')
-    return fig
\ No newline at end of file
+    weights,assets = topWeights(history.getMatrix('Weights'),history.assets,top)
+    return plotHistory(history.getDateIndex('Dates'),weights,assets,f'{name} Weights',points,method,figsize)
\ No newline at end of file
@@ -0,0 +1,298 @@
+import numpy as np
+import pandas as pd
+
+from .analytics import *
+from .history import *
+from .instrumentation import *
+
+# Drives many Portfolio objects over one shared asset universe
+# The positions, held masks and borrow rates of every portfolio are rows of (portfolios x assets)
+# matrices owned by the book, so one signOff marks the whole book to market against a single
+# price vector. Daily snapshots are buffered and written to each portfolio's history and
+# performance statistics in blocks of flushInterval bars.
+#
+# Portfolios keep their own rebalance logic and can be traded directly or through the book.
+# Call flush (done by every book getter) before reading a portfolio's history mid-backtest.
+# A statistics frequency of 'end' on the portfolios lets whole blocks be folded in at once.
+# Portfolio checkpoint frequencies are honoured, each checkpoint flushing the book first.
+# Members are signed off by the book rather than by Portfolio.signOff, so their phases are timed
+# by the book's instrumentation (setInstrumentation) and members cannot have their own.
+class PortfolioBook:
+    def __init__(self,portfolios,assets=None,flushInterval=64):
+        self.portfolios = list(portfolios)
+        self.names = [portfolio.getPortfolioName() for portfolio in self.portfolios]
+        self.flushInterval = flushInterval
+        self.instrumentation = None
+
+        if len(set(self.names)) != len(self.names):
+            raise Exception('ERROR: Portfolio names in a book must be unique')
+
+        for portfolio in self.portfolios:
+            if portfolio.datadump == True:
+                raise Exception('ERROR: Portfolios in a book cannot serialize daily data, disable datadump')
+            portfolio.book = self
+
+        self.assets = []
+        self.syncUniverse(assets if assets is not None else [])
+
+        # Book level NAV and cash history, one column per portfolio
+        self.history = HistoryStore([],['NAV','Cash'])
+        self.history.addAssets(self.names)
+
+        self.resetBuffer()
+
+    def __len__(self):
+        return len(self.portfolios)
+
+    def __iter__(self):
+        return iter(self.portfolios)
+
+    def setInstrumentation(self,instrumentation):
+        self.instrumentation = instrumentation
+
+    # Universe and matrix methods
+    def syncUniverse(self,assets=()):
+        # Extends every portfolio to the union of their universes, in one shared order
+        universe = list(dict.fromkeys(list(self.assets) + list(assets) + [asset for portfolio in self.portfolios for asset in portfolio.getAssetUniverse()]))
+
+        for portfolio in self.portfolios:
+            portfolio.setAssetUniverse(universe)
+            if portfolio.getAssetUniverse() != universe:
+                raise Exception(f'ERROR: Portfolio {portfolio.getPortfolioName()} orders its assets differently from the book')
+
+        self.assets = universe
+        self.assetIndex = {asset : i for i,asset in enumerate(universe)}
+
+        # Rebind each portfolio's arrays as rows of the book matrices
+        numPortfolios,numAssets = len(self.portfolios),len(universe)
+        self.positionMatrix = np.zeros((numPortfolios,numAssets))
+        self.heldMatrix = np.zeros((numPortfolios,numAssets),dtype=bool)
+        self.borrowRateMatrix = np.zeros((numPortfolios,numAssets))
+        self.boundRows = []
+
+        for k,portfolio in enumerate(self.portfolios):
+            self.positionMatrix[k] = portfolio.positionArray
+            self.heldMatrix[k] = portfolio.heldMask
+            self.borrowRateMatrix[k] = portfolio.dailyBorrowRateArray
+
+            portfolio.positionArray = self.positionMatrix[k]
+            portfolio.heldMask = self.heldMatrix[k]
+            portfolio.dailyBorrowRateArray = self.borrowRateMatrix[k]
+            self.boundRows.append((portfolio.positionArray,portfolio.heldMask,portfolio.dailyBorrowRateArray))
+
+    def isSynced(self):
+        # Portfolios replace their arrays when they add assets or change borrow costs
+        for portfolio,(positionRow,heldRow,borrowRateRow) in zip(self.portfolios,self.boundRows):
+            if portfolio.positionArray is not positionRow or portfolio.heldMask is not heldRow or portfolio.dailyBorrowRateArray is not borrowRateRow:
+                return False
+        return True
+
+    def resetBuffer(self):
+        numPortfolios,numAssets = len(self.portfolios),len(self.assets)
+
+        self.bufferDates = []
+        self.bufferNAV = np.empty((self.flushInterval,numPortfolios))
+        self.bufferCash = np.empty((self.flushInterval,numPortfolios))
+        self.bufferTCosts = np.empty((self.flushInterval,numPortfolios))
+        self.bufferSlippageCosts = np.empty((self.flushInterval,numPortfolios))
+        self.bufferBorrowCosts = np.empty((self.flushInterval,numPortfolios))
+        self.bufferPositions = np.empty((self.flushInterval,numPortfolios,numAssets))
+        self.bufferWeights = np.empty((self.flushInterval,numPortfolios,numAssets))
+
+    def getPriceVector(self,lastPriceMap):
+        # Price rows given as arrays must already be aligned to the book universe
+        if isinstance(lastPriceMap,np.ndarray):
+            return lastPriceMap
+        else:
+            heldAny = self.heldMatrix.any(axis=0)
+            return np.array([lastPriceMap[asset] if heldAny[i] else lastPriceMap.get(asset,np.nan) for i,asset in enumerate(self.assets)],dtype=np.float64)
+
+    # Get Methods
+    def profile(self,name):
+        return profile(self.instrumentation,name)
+
+    def getPortfolios(self):
+        return self.portfolios
+
+    def getPortfolio(self,name):
+        return self.portfolios[self.names.index(name)]
+
+    def getPortfolioNames(self):
+        return self.names
+
+    def getAssetUniverse(self):
+        return self.assets
+
+    def getPositionMatrix(self):
+        return self.positionMatrix
+
+    def getHistoricalNAV(self):
+        self.flush()
+        return pd.DataFrame(self.history.getMatrix('NAV'),index=self.history.getDateIndex('Dates'),columns=self.names,copy=False)
+
+    def getHistoricalCash(self):
+        self.flush()
+        return pd.DataFrame(self.history.getMatrix('Cash'),index=self.history.getDateIndex('Dates'),columns=self.names,copy=False)
+
+    def getPerformanceStatistics(self):
+        # Latest statistics of every portfolio, one row each
+        self.flush()
+        perfStats = pd.concat([portfolio.getPerformanceStatistics() for portfolio in self.portfolios])
+        perfStats.index = pd.Index(self.names,name='Portfolio')
+        return perfStats
+
+    def getRollingPerformance(self,window=None):
+        # Expanding (window=None) or rolling statistics of every portfolio, {statistic : (dates x portfolios)}
+        return rollingPerformance(self.getHistoricalNAV(),window)
+
+    def plotNAV(self,points=None,method='minmax',figsize=(7.5,5)):
+        self.flush()
+        return plotHistory(self.history.getDateIndex('Dates'),self.history.getMatrix('NAV'),self.names,'Portfolio Book NAV',points,method,figsize)
+
+    def getReturnCorrelation(self):
+        nav = self.getHistoricalNAV().to_numpy()
+        returns = np.diff(nav,axis=0) / nav[:-1]
+        return pd.DataFrame(np.corrcoef(returns,rowvar=False).reshape(len(self.names),len(self.names)),index=self.names,columns=self.names)
+
+    def getComparativeStatistics(self,benchmark=None):
+        # Performance statistics of the whole book, plus active statistics against a benchmark portfolio
+        perfStats = self.getPerformanceStatistics()
+        if benchmark is None:
+            return perfStats
+
+        nav = self.getHistoricalNAV().to_numpy()
+        returns = np.diff(nav,axis=0) / nav[:-1]
+        activeReturns = returns - returns[:,[self.names.index(benchmark)]]
+        benchmarkReturns = returns[:,self.names.index(benchmark)]
+
+        # Annualized on 260 days, as the performance statistics
+        trackingError = activeReturns.std(axis=0) * np.sqrt(260)
+        excessReturns = (perfStats['Annual Returns'] - perfStats.loc[benchmark,'Annual Returns']).to_numpy()
+
+        returnsDeviation = returns - returns.mean(axis=0)
+        benchmarkDeviation = benchmarkReturns - benchmarkReturns.mean()
+        beta = (returnsDeviation * benchmarkDeviation[:,None]).mean(axis=0) / (benchmarkDeviation ** 2).mean()
+
+        perfStats['Excess Annual Returns'] = excessReturns
+        perfStats['Tracking Error'] = trackingError
+        perfStats['Information Ratio'] = excessReturns / (trackingError + np.finfo(float).eps)
+        perfStats['Beta'] = beta
+        perfStats['Correlation'] = self.getReturnCorrelation()[benchmark].to_numpy()
+
+        return perfStats
+
+    # Book Methods
+    def rebalance(self,name,targetWeights,lastPriceMap,date):
+        self.getPortfolio(name).rebalance(targetWeights,lastPriceMap,date)
+
+    @instrumented('PortfolioBook.signOff')
+    def signOff(self,date,lastPriceMap):
+        if not self.isSynced():
+            self.flush()
+            self.syncUniverse()
+            self.resetBuffer()
+
+        # Members are signed off here, not through Portfolio.signOff
+        checkpointing = []
+        for portfolio in self.portfolios:
+            if portfolio.instrumentation is not None:
+                raise Exception(f'ERROR: Portfolio {portfolio.getPortfolioName()} is signed off by its book, enable instrumentation on the book instead')
+            if portfolio.checkpointFrequency is not None:
+                checkpointing.append(portfolio)
+
+        with self.profile('PortfolioBook.signOff.fees'):
+            prices,positionValues,nav,cash,borrowCosts = self.chargeFees(lastPriceMap)
+
+        # Buffer the snapshots, written to the portfolios every flushInterval bars
+        with self.profile('PortfolioBook.signOff.buffer'):
+            positions = self.positionMatrix
+            held = self.heldMatrix
+
+            row = len(self.bufferDates)
+            self.bufferDates.append(date)
+            self.bufferNAV[row] = nav
+            self.bufferCash[row] = cash
+            self.bufferTCosts[row] = [portfolio.transactionCosts for portfolio in self.portfolios]
+            self.bufferSlippageCosts[row] = [portfolio.slippageCosts for portfolio in self.portfolios]
+            self.bufferBorrowCosts[row] = borrowCosts
+            self.bufferPositions[row] = np.where(held,positions,np.nan)
+            self.bufferWeights[row] = np.where(held,positionValues / nav[:,None],np.nan)
+
+        if len(self.bufferDates) == self.flushInterval:
+            self.flush()
+
+        # Checkpoints on the portfolios' own schedules, counting the buffered days
+        for portfolio in checkpointing:
+            if (portfolio.performanceAccumulator.count + len(self.bufferDates)) % portfolio.checkpointFrequency == 0:
+                with self.profile('PortfolioBook.signOff.checkpoint'):
+                    portfolio.saveCheckpoint()
+
+    def chargeFees(self,lastPriceMap):
+        prices = self.getPriceVector(lastPriceMap)
+        positions = self.positionMatrix
+        held = self.heldMatrix
+
+        cash = np.fromiter((portfolio.cash for portfolio in self.portfolios),dtype=np.float64,count=len(self.portfolios))
+        feeRates = np.fromiter(((1 + portfolio.annualManagementFee) ** (1/260) - 1 for portfolio in self.portfolios),dtype=np.float64,count=len(self.portfolios))
+
+        # Management fees and borrow costs of every portfolio at once
+        positionValues = np.where(held,positions * prices,0.0)
+        managementFees = (positionValues.sum(axis=1) + cash) * feeRates
+        borrowCosts = np.abs(np.where(held & (positions < 0),positions * prices * self.borrowRateMatrix,0.0)).sum(axis=1)
+
+        cash = cash - managementFees - borrowCosts
+        for portfolio,portfolioCash in zip(self.portfolios,cash.tolist()):
+            portfolio.cash = portfolioCash
+
+        nav = positionValues.sum(axis=1) + cash
+        return [prices,positionValues,nav,cash,borrowCosts]
+
+    @instrumented('PortfolioBook.flush')
+    def flush(self):
+        numRows = len(self.bufferDates)
+        if numRows == 0:
+            return
+
+        dates = self.bufferDates
+        columns = slice(0,len(self.assets))
+
+        self.history.appendBlock(dates,{},slice(0,len(self.names)),{'NAV' : self.bufferNAV[:numRows],'Cash' : self.bufferCash[:numRows]})
+
+        for k,portfolio in enumerate(self.portfolios):
+            if len(portfolio.history.assets) < len(self.assets):
+                portfolio.history.addAssets(self.assets[len(portfolio.history.assets):])
+
+            portfolio.history.appendBlock(
+                dates,
+                {
+                    'NAV'           : self.bufferNAV[:numRows,k],
+                    'TCosts'        : self.bufferTCosts[:numRows,k],
+                    'SlippageCosts' : self.bufferSlippageCosts[:numRows,k],
+                    'BorrowCosts'   : self.bufferBorrowCosts[:numRows,k],
+                    'Cash'          : self.bufferCash[:numRows,k]
+                },
+                columns,
+                {
+                    'Positions'     : self.bufferPositions[:numRows,k],
+                    'Weights'       : self.bufferWeights[:numRows,k]
+                })
+
+            self.updatePerformance(portfolio,dates,self.bufferNAV[:numRows,k],self.bufferTCosts[:numRows,k].tolist())
+
+        self.bufferDates = []
+
+    def updatePerformance(self,portfolio,dates,navs,cumulativeTCosts):
+        accumulator = portfolio.performanceAccumulator
+        frequency = portfolio.statisticsFrequency
+
+        if frequency == 'end':
+            accumulator.updateBlock(dates,navs,cumulativeTCosts)
+            return
+
+        # Split the block at the sign offs where the portfolio records its statistics
+        start = 0
+        for end in range(frequency - accumulator.count % frequency,len(dates) + 1,frequency):
+            accumulator.updateBlock(dates[start:end],navs[start:end],cumulativeTCosts[start:end])
+            portfolio.performanceStatistics[dates[end-1]] = portfolio.getAccumulatedStatistics()
+            start = end
+        accumulator.updateBlock(dates[start:],navs[start:],cumulativeTCosts[start:])
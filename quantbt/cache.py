@@ -0,0 +1,156 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+# Default downloader, pulls daily bars from Yahoo Finance
+def yahooDownloader(tickers,startDate,endDate):
+    import yfinance as yf
+    return yf.download(tickers,startDate,endDate)
+
+def mergeIntervals(intervals):
+    merged = []
+    for start,end,fetchedAt in sorted(intervals):
+        if len(merged) > 0 and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0],max(merged[-1][1],end),min(merged[-1][2],fetchedAt))
+        else:
+            merged.append((start,end,fetchedAt))
+    return merged
+
+def missingIntervals(intervals,start,end):
+    # Parts of [start,end) not covered by any of the (sorted, merged) intervals
+    missing = []
+    cursor = start
+    for coveredStart,coveredEnd,_ in intervals:
+        if coveredEnd <= cursor or coveredStart >= end:
+            continue
+        if coveredStart > cursor:
+            missing.append((cursor,coveredStart))
+        cursor = max(cursor,coveredEnd)
+    if cursor < end:
+        missing.append((cursor,end))
+    return missing
+
+# Persistent local cache of downloaded price history
+# Each (ticker, column) pair is stored as its own columnar .npz file holding the dates,
+# the values and the date ranges already fetched. Requests are served from the cache
+# and only the date ranges not yet covered are downloaded.
+class LocalPriceCache:
+    def __init__(self,cacheFolder=os.path.join(os.getcwd(),'data','cache'),ttl=None,downloader=yahooDownloader):
+        self.cacheFolder = cacheFolder
+        # Seconds after which a fetched date range is downloaded again, None to keep forever
+        self.ttl = ttl
+        self.downloader = downloader
+
+    def getCacheFolder(self):
+        return self.cacheFolder
+
+    def getKey(self,ticker,column):
+        return f'{ticker}__{column}'.replace(os.sep,'_').replace(' ','_')
+
+    def getPath(self,ticker,column):
+        return os.path.join(self.cacheFolder,self.getKey(ticker,column) + '.npz')
+
+    def load(self,ticker,column):
+        path = self.getPath(ticker,column)
+        if not os.path.exists(path):
+            return [pd.Series(dtype=np.float64,index=pd.DatetimeIndex([])),[]]
+
+        with np.load(path) as stored:
+            series = pd.Series(stored['values'],index=pd.DatetimeIndex(stored['dates'].view('datetime64[ns]')))
+            intervals = [(int(start),int(end),float(fetchedAt)) for start,end,fetchedAt in zip(stored['starts'],stored['ends'],stored['fetchedAt'])]
+
+        return [series,intervals]
+
+    def save(self,ticker,column,series,intervals):
+        if not os.path.exists(self.cacheFolder):
+            os.makedirs(self.cacheFolder)
+
+        path = self.getPath(ticker,column)
+        tempPath = path + '.tmp.npz'
+        np.savez(
+            tempPath,
+            dates=series.index.as_unit('ns').asi8,
+            values=series.to_numpy(dtype=np.float64),
+            starts=np.array([interval[0] for interval in intervals],dtype=np.int64),
+            ends=np.array([interval[1] for interval in intervals],dtype=np.int64),
+            fetchedAt=np.array([interval[2] for interval in intervals],dtype=np.float64))
+
+        # Atomic replace so concurrent readers never see a partial file
+        os.replace(tempPath,path)
+
+    def invalidate(self,tickers=None,columns=None):
+        # Drop the cached history of the given tickers and columns, or of everything
+        if not os.path.exists(self.cacheFolder):
+            return
+
+        for fileName in os.listdir(self.cacheFolder):
+            if not fileName.endswith('.npz'):
+                continue
+
+            ticker,column = fileName[:-len('.npz')].split('__',1)
+            if tickers is not None and ticker not in [self.getKey(t,'').split('__')[0] for t in tickers]:
+                continue
+            if columns is not None and column not in [self.getKey('',c).split('__')[1] for c in columns]:
+                continue
+
+            os.remove(os.path.join(self.cacheFolder,fileName))
+
+    def getData(self,tickers,startDate,endDate,columns):
+        start = pd.Timestamp(startDate).value
+        end = pd.Timestamp(endDate).value
+        now = time.time()
+
+        # Never mark today or the future as covered, the latest bars may still change
+        coveredEnd = min(end,pd.Timestamp(now,unit='s').normalize().value)
+
+        stored = dict()
+        missingByRange = dict()
+
+        for ticker in tickers:
+            for column in columns:
+                series,intervals = self.load(ticker,column)
+
+                if self.ttl is not None:
+                    intervals = [interval for interval in intervals if now - interval[2] <= self.ttl]
+
+                stored[(ticker,column)] = [series,intervals]
+
+                for missing in missingIntervals(intervals,start,end):
+                    missingByRange.setdefault(missing,set()).add(ticker)
+
+        # Download each missing date range once for all tickers that lack it
+        for (missingStart,missingEnd),missingTickers in missingByRange.items():
+            missingTickers = [ticker for ticker in tickers if ticker in missingTickers]
+            data = self.downloader(missingTickers,pd.Timestamp(missingStart),pd.Timestamp(missingEnd))
+
+            for ticker in missingTickers:
+                for column in columns:
+                    if isinstance(data.columns,pd.MultiIndex):
+                        fetched = data[(column,ticker)] if (column,ticker) in data.columns else pd.Series(dtype=np.float64,index=pd.DatetimeIndex([]))
+                    else:
+                        fetched = data[column] if column in data.columns else pd.Series(dtype=np.float64,index=pd.DatetimeIndex([]))
+
+                    fetched = fetched.astype(np.float64)
+                    fetched.index = pd.DatetimeIndex(fetched.index).tz_localize(None)
+
+                    series,intervals = stored[(ticker,column)]
+                    series = pd.concat([series,fetched]) if len(series) > 0 else fetched
+                    series = series[~series.index.duplicated(keep='last')].sort_index()
+
+                    if missingStart < coveredEnd:
+                        intervals = intervals + [(missingStart,min(missingEnd,coveredEnd),now)]
+
+                    stored[(ticker,column)] = [series,mergeIntervals(intervals)]
+                    self.save(ticker,column,series,stored[(ticker,column)][1])
+
+        # Assemble the requested window as (column, ticker) columns, like yf.download
+        window = dict()
+        for (ticker,column),(series,_) in stored.items():
+            window[(column,ticker)] = series[(series.index >= pd.Timestamp(start)) & (series.index < pd.Timestamp(end))]
+
+        data = pd.DataFrame(window)
+        data.columns = pd.MultiIndex.from_tuples(list(window.keys()),names=['Price','Ticker'])
+
+        return data.sort_index()
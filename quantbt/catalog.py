@@ -0,0 +1,346 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+from contextlib import closing
+
+import numpy as np
+import pandas as pd
+
+from .journal import *
+
+# Indexed catalog of backtest results
+# A catalog is a folder holding an SQLite index (catalog.sqlite) and one .npz blob per run with
+# its daily history columns. The index keeps every run's name, parameters, date range, cost
+# settings and final performance statistics, so runs can be filtered and ranked with indexed
+# queries without opening any blob; histories are only read when asked for.
+# The folder is created with the first recorded run. SQLite serializes concurrent writers, so
+# several processes can record into the same catalog.
+
+catalogSchema = '''
+CREATE TABLE IF NOT EXISTS runs (
+    runId     INTEGER PRIMARY KEY AUTOINCREMENT,
+    name      TEXT NOT NULL,
+    created   REAL NOT NULL,
+    startDate INTEGER,
+    endDate   INTEGER,
+    tz        TEXT,
+    numDates  INTEGER NOT NULL,
+    costs     TEXT NOT NULL,
+    blob      TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS params (
+    runId INTEGER NOT NULL REFERENCES runs(runId) ON DELETE CASCADE,
+    name  TEXT NOT NULL,
+    value,
+    type  TEXT NOT NULL DEFAULT 'float',
+    PRIMARY KEY (runId,name)
+);
+CREATE TABLE IF NOT EXISTS statistics (
+    runId INTEGER NOT NULL REFERENCES runs(runId) ON DELETE CASCADE,
+    name  TEXT NOT NULL,
+    value REAL,
+    PRIMARY KEY (runId,name)
+);
+CREATE INDEX IF NOT EXISTS runsByName ON runs(name);
+CREATE INDEX IF NOT EXISTS runsByDates ON runs(startDate,endDate);
+CREATE INDEX IF NOT EXISTS paramsByValue ON params(name,value);
+CREATE INDEX IF NOT EXISTS statisticsByValue ON statistics(name,value);
+'''
+
+comparisonOperators = ['=','!=','<','<=','>','>=']
+
+# Parameter values are stored as SQLite numbers or text, anything else as its JSON text
+# Their Python type is stored alongside, so they are read back as they were recorded
+def toSQLValue(value):
+    if isinstance(value,np.generic):
+        value = value.item()
+    if isinstance(value,bool):
+        return int(value)
+    elif isinstance(value,(int,float,str)) or value is None:
+        return value
+    else:
+        return json.dumps(value,cls=JournalEncoder)
+
+def getParamType(value):
+    if isinstance(value,np.generic):
+        value = value.item()
+    if isinstance(value,bool):
+        return 'bool'
+    elif isinstance(value,int):
+        return 'int'
+    elif isinstance(value,float):
+        return 'float'
+    elif isinstance(value,str):
+        return 'str'
+    elif value is None:
+        return 'none'
+    else:
+        return 'json'
+
+def fromSQLValue(value,paramType):
+    if value is None:
+        return None
+    elif paramType == 'bool':
+        return bool(value)
+    elif paramType == 'int':
+        return int(value)
+    elif paramType == 'float':
+        return float(value)
+    elif paramType == 'json':
+        return json.loads(value)
+    else:
+        return value
+
+def paramColumn(values,paramTypes,index):
+    # Columns of a single numeric or boolean type keep their dtype when every run has the parameter
+    column = pd.Series(values,dtype=object).reindex(index)
+    types = set(paramTypes.values())
+    if len(column) > 0 and column.notna().all() and len(types) == 1 and types <= {'int','float','bool'}:
+        return column.astype({'int' : np.int64,'float' : np.float64,'bool' : bool}[types.pop()])
+    elif types == {'float'}:
+        return column.astype(np.float64)
+    return column
+
+def portfolioCosts(portfolio):
+    return {
+        'FixedTransactionCosts' : {str(asset) : cost for asset,cost in portfolio.fixedTransactionCosts.items()},
+        'BorrowCosts'           : {str(asset) : cost for asset,cost in portfolio.borrowCosts.items()},
+        'AnnualManagementFee'   : portfolio.annualManagementFee,
+        'SlippageModel'         : portfolio.slippageModel,
+        'ImpactParams'          : {str(asset) : params for asset,params in portfolio.impactParams.items()}
+    }
+
+class ResultsCatalog:
+    def __init__(self,path='BackTestResults',timeout=30.0):
+        self.path = path
+        self.databasePath = os.path.join(path,'catalog.sqlite')
+        self.timeout = timeout
+
+    def connect(self,create=False):
+        if not os.path.exists(self.databasePath):
+            if not create:
+                return None
+            os.makedirs(os.path.join(self.path,'runs'),exist_ok=True)
+
+        connection = sqlite3.connect(self.databasePath,timeout=self.timeout)
+        try:
+            connection.execute('PRAGMA foreign_keys = ON')
+            if create:
+                connection.executescript(catalogSchema)
+
+            # Catalogs recorded before parameter types were kept read their parameters as floats
+            if 'type' not in [column[1] for column in connection.execute('PRAGMA table_info(params)')]:
+                with connection:
+                    connection.execute("ALTER TABLE params ADD COLUMN type TEXT NOT NULL DEFAULT 'float'")
+        except Exception:
+            connection.close()
+            raise
+        return connection
+
+    def fetch(self,sql,values=()):
+        # All rows of a read query, no rows when the catalog does not exist yet
+        connection = self.connect()
+        if connection is None:
+            return []
+        with closing(connection),connection:
+            return connection.execute(sql,values).fetchall()
+
+    def __len__(self):
+        rows = self.fetch('SELECT COUNT(*) FROM runs')
+        return rows[0][0] if len(rows) > 0 else 0
+
+    # Recording
+    def recordRun(self,name,params,statistics,history,costs=None):
+        # history is a DataFrame (or Series) of daily columns indexed by date, NAV first
+        if isinstance(history,pd.Series):
+            history = history.to_frame('NAV')
+
+        dates = pd.DatetimeIndex(history.index)
+        tz = str(dates.tz) if dates.tz is not None else None
+        nanoseconds = dates.as_unit('ns').asi8
+
+        # The blob is in place before the run is indexed, a failed write leaves no dangling entry
+        os.makedirs(os.path.join(self.path,'runs'),exist_ok=True)
+        blob = os.path.join('runs',uuid.uuid4().hex + '.npz')
+        blobPath = os.path.join(self.path,blob)
+        arrays = {'dates' : nanoseconds,'columns' : np.array([str(column) for column in history.columns])}
+        for i,column in enumerate(history.columns):
+            arrays[f'column{i}'] = history[column].to_numpy(dtype=np.float64)
+        np.savez(blobPath + '.tmp.npz',**arrays)
+        os.replace(blobPath + '.tmp.npz',blobPath)
+
+        # A failed insert is rolled back, the connection closed and the blob removed
+        try:
+            with closing(self.connect(create=True)) as connection,connection:
+                cursor = connection.execute(
+                    'INSERT INTO runs (name,created,startDate,endDate,tz,numDates,costs,blob) VALUES (?,?,?,?,?,?,?,?)',
+                    (name,time.time(),
+                     int(nanoseconds[0]) if len(nanoseconds) > 0 else None,
+                     int(nanoseconds[-1]) if len(nanoseconds) > 0 else None,
+                     tz,len(nanoseconds),json.dumps(costs if costs is not None else dict(),cls=JournalEncoder),blob))
+                runId = cursor.lastrowid
+
+                connection.executemany('INSERT INTO params (runId,name,value,type) VALUES (?,?,?,?)',
+                    [(runId,str(param),toSQLValue(value),getParamType(value)) for param,value in (params if params is not None else dict()).items()])
+                connection.executemany('INSERT INTO statistics (runId,name,value) VALUES (?,?,?)',
+                    [(runId,str(stat),None if value is None or np.isnan(value) else float(value)) for stat,value in statistics.items()])
+        except Exception:
+            os.remove(blobPath)
+            raise
+
+        return runId
+
+    def record(self,portfolio,params=None,name=None):
+        # Indexes a Portfolio with its latest statistics and its NAV, cost and cash history
+        history = portfolio.history
+        historyFrame = pd.DataFrame({
+            'NAV'           : history.getSeries('NAV'),
+            'TCosts'        : history.getSeries('TCosts'),
+            'SlippageCosts' : history.getSeries('SlippageCosts'),
+            'BorrowCosts'   : history.getSeries('BorrowCosts'),
+            'Cash'          : history.getSeries('Cash')
+        },index=history.getDateIndex('Dates'))
+
+        statistics = portfolio.getPerformanceStatistics().iloc[0].to_dict() if len(history) > 0 else dict()
+        return self.recordRun(name if name is not None else portfolio.getPortfolioName(),params,statistics,historyFrame,portfolioCosts(portfolio))
+
+    # Queries
+    def query(self,name=None,params=None,statistics=None,startDate=None,endDate=None,orderBy=None,ascending=False,limit=None):
+        # Runs with their parameters and statistics, one row each, without reading any history
+        #   params     : {parameter : value} equality filters
+        #   statistics : {statistic : (operator,value)} filters, operator one of = != < <= > >=
+        #   startDate  : runs starting on or after the date, endDate : runs ending on or before
+        #   orderBy    : statistic to rank by, descending unless ascending=True; limit keeps the top rows
+        # Every filter on a parameter or statistic is one join on its (name, value) index
+        joins,joinValues,conditions,conditionValues = [],[],[],[]
+
+        if name is not None:
+            conditions.append('runs.name = ?')
+            conditionValues.append(name)
+        if startDate is not None:
+            conditions.append('runs.startDate >= ?')
+            conditionValues.append(pd.Timestamp(startDate).value)
+        if endDate is not None:
+            conditions.append('runs.endDate <= ?')
+            conditionValues.append(pd.Timestamp(endDate).value)
+
+        for i,(param,value) in enumerate((params if params is not None else dict()).items()):
+            joins.append(f'JOIN params p{i} ON p{i}.runId = runs.runId AND p{i}.name = ?')
+            joinValues.append(str(param))
+            conditions.append(f'p{i}.value = ?')
+            conditionValues.append(toSQLValue(value))
+
+        for i,(stat,(operator,value)) in enumerate((statistics if statistics is not None else dict()).items()):
+            if operator not in comparisonOperators:
+                raise Exception(f'ERROR: Choose from {",".join(comparisonOperators)}')
+            joins.append(f'JOIN statistics s{i} ON s{i}.runId = runs.runId AND s{i}.name = ?')
+            joinValues.append(str(stat))
+            conditions.append(f's{i}.value {operator} ?')
+            conditionValues.append(float(value))
+
+        order = 'runs.runId'
+        if orderBy is not None:
+            joins.append('JOIN statistics ranked ON ranked.runId = runs.runId AND ranked.name = ?')
+            joinValues.append(str(orderBy))
+            conditions.append('ranked.value IS NOT NULL')
+            order = f'ranked.value {"ASC" if ascending else "DESC"},runs.runId'
+
+        sql = 'SELECT runs.runId,runs.name,runs.startDate,runs.endDate,runs.tz,runs.numDates FROM runs ' + ' '.join(joins)
+        if len(conditions) > 0:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += f' ORDER BY {order}'
+        if limit is not None:
+            sql += f' LIMIT {int(limit)}'
+
+        connection = self.connect()
+        if connection is None:
+            return pd.DataFrame(index=pd.Index([],name='Run'))
+
+        with closing(connection),connection:
+            rows = connection.execute(sql,joinValues + conditionValues).fetchall()
+            runIds = [row[0] for row in rows]
+
+            # In chunks below the SQLite bound variable limit
+            paramRows,statRows = [],[]
+            for start in range(0,len(runIds),900):
+                chunk = runIds[start:start + 900]
+                placeholders = ','.join('?' * len(chunk))
+                paramRows += connection.execute(f'SELECT runId,name,value,type FROM params WHERE runId IN ({placeholders})',chunk).fetchall()
+                statRows += connection.execute(f'SELECT runId,name,value FROM statistics WHERE runId IN ({placeholders})',chunk).fetchall()
+
+        def toDate(value,tz):
+            if value is None:
+                return pd.NaT
+            return pd.Timestamp(value,tz='UTC').tz_convert(tz) if tz is not None else pd.Timestamp(value)
+
+        runs = pd.DataFrame({
+            'Name'       : [row[1] for row in rows],
+            'Start Date' : [toDate(row[2],row[4]) for row in rows],
+            'End Date'   : [toDate(row[3],row[4]) for row in rows],
+            'Dates'      : [row[5] for row in rows]
+        },index=pd.Index(runIds,name='Run'))
+
+        # Parameters with their recorded types, then statistics, as columns in order of first appearance
+        params,paramTypes = dict(),dict()
+        for runId,column,value,paramType in paramRows:
+            params.setdefault(column,dict())[runId] = fromSQLValue(value,paramType)
+            paramTypes.setdefault(column,dict())[runId] = paramType
+        for column,columnValues in params.items():
+            runs[column] = paramColumn(columnValues,paramTypes[column],runs.index)
+
+        statistics = dict()
+        for runId,column,value in statRows:
+            statistics.setdefault(column,dict())[runId] = value
+        for column,columnValues in statistics.items():
+            runs[column] = pd.Series(columnValues,dtype=np.float64).reindex(runs.index)
+
+        return runs
+
+    def top(self,statistic,n=10,ascending=False,**filters):
+        # The n best runs by a statistic, with the filters of query
+        return self.query(orderBy=statistic,ascending=ascending,limit=n,**filters)
+
+    def getCosts(self,runId):
+        rows = self.fetch('SELECT costs FROM runs WHERE runId = ?',(int(runId),))
+        if len(rows) == 0:
+            raise Exception(f'ERROR: No run {runId} in the catalog')
+        return json.loads(rows[0][0])
+
+    # Histories, read from the blobs on demand
+    def getHistory(self,runId):
+        rows = self.fetch('SELECT blob,tz FROM runs WHERE runId = ?',(int(runId),))
+        if len(rows) == 0:
+            raise Exception(f'ERROR: No run {runId} in the catalog')
+
+        blob,tz = rows[0]
+        with np.load(os.path.join(self.path,blob)) as stored:
+            index = pd.DatetimeIndex(stored['dates'].view('datetime64[ns]'),name='Dates')
+            if tz is not None:
+                index = index.tz_localize('UTC').tz_convert(tz)
+            return pd.DataFrame({str(column) : stored[f'column{i}'] for i,column in enumerate(stored['columns'])},index=index)
+
+    def getNAV(self,runId):
+        return self.getHistory(runId)['NAV']
+
+    def getNAVs(self,runIds):
+        # NAV of several runs side by side, one column per run
+        navs = pd.DataFrame({runId : self.getNAV(runId) for runId in runIds})
+        navs.columns.name = 'Run'
+        return navs
+
+    def delete(self,runId):
+        connection = self.connect()
+        row = None
+        if connection is not None:
+            with closing(connection),connection:
+                row = connection.execute('SELECT blob FROM runs WHERE runId = ?',(int(runId),)).fetchone()
+                if row is not None:
+                    connection.execute('DELETE FROM runs WHERE runId = ?',(int(runId),))
+        if row is None:
+            raise Exception(f'ERROR: No run {runId} in the catalog')
+
+        blobPath = os.path.join(self.path,row[0])
+        if os.path.exists(blobPath):
+            os.remove(blobPath)
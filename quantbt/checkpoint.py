@@ -0,0 +1,227 @@
+import os
+import json
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from .analytics import *
+from .history import *
+from .journal import *
+from .ledger import *
+
+# Binary checkpoints of the full Portfolio state
+# A checkpoint is a single .npz file: the live arrays and the history store buffers are saved
+# as arrays, scalar settings and accumulator state as one JSON document, and the configured
+# objects (slippage model, rebalance schedule) and user supplied data (impact parameters, custom
+# data) as pickled bytes, so they come back as the same objects. Files are written to a temporary
+# path and moved into place, so a crash mid-write leaves the previous checkpoint intact.
+#
+# Assets must be JSON serializable (strings or integers).
+
+accumulatorFields = [
+    'count','firstNAV','lastNAV','returnCount','returnMean','returnM2','downsideCount','downsideMean','downsideM2',
+    'peakNAV','maxDrawdownValue','maxDrawdownStartNAV','maxDrawdownEndNAV','cumulativeTCost',
+    'turnoverSum','grossLeverageSum','leverageCount']
+
+# Dates are kept as [nanoseconds since epoch (UTC), time zone name] to round trip exactly
+def encodeDate(date):
+    if date is None or isinstance(date,str):
+        return None
+    timestamp = pd.Timestamp(date)
+    return [timestamp.value,str(timestamp.tz) if timestamp.tz is not None else None]
+
+def decodeDate(date,default=None):
+    if date is None:
+        return default
+    value,tz = date
+    return pd.Timestamp(value,tz='UTC').tz_convert(tz) if tz is not None else pd.Timestamp(value)
+
+def encodeObject(obj):
+    return np.frombuffer(pickle.dumps(obj),dtype=np.uint8)
+
+def decodeObject(array):
+    return pickle.loads(array.tobytes())
+
+def saveCheckpoint(portfolio,path):
+    # A portfolio in a PortfolioBook gets the book's buffered days first
+    if portfolio.book is not None:
+        portfolio.book.flush()
+
+    # Buffered journal days are written first so the journal and the checkpoint agree
+    journalState = portfolio.journal.checkpoint() if portfolio.journal is not None else {'rows' : 0,'bytes' : 0,'parts' : 0}
+
+    history = portfolio.history
+    accumulator = portfolio.performanceAccumulator
+
+    # Performance statistics as a (dates x statistics) matrix
+    statisticsDates = list(portfolio.performanceStatistics.keys())
+    statisticsNames = list(portfolio.performanceStatistics[statisticsDates[0]].keys()) if len(statisticsDates) > 0 else []
+    statisticsValues = np.array([[stats[name] for name in statisticsNames] for stats in portfolio.performanceStatistics.values()],dtype=np.float64).reshape(len(statisticsDates),len(statisticsNames))
+
+    state = {
+        'name'                        : portfolio.name,
+        'cash'                        : portfolio.cash,
+        'assets'                      : portfolio.assets,
+        'fixedTransactionCosts'       : list(portfolio.fixedTransactionCosts.items()),
+        'borrowCosts'                 : list(portfolio.borrowCosts.items()),
+        'datadump'                    : portfolio.datadump,
+        'datadumpFormat'              : portfolio.datadumpFormat,
+        'journalFlushInterval'        : portfolio.journalFlushInterval,
+        'journal'                     : journalState,
+        'annualManagementFee'         : portfolio.annualManagementFee,
+        'slippageModel'               : portfolio.slippageModel,
+        'ownsSlippageEngine'          : portfolio.ownsSlippageEngine,
+        'unwindUndefinedAssetWeights' : portfolio.unwindUndefinedAssetWeights,
+        'transactionCosts'            : portfolio.transactionCosts,
+        'slippageCosts'               : portfolio.slippageCosts,
+        'firstRebalanceDate'          : encodeDate(portfolio.FirstRebalanceDate),
+        'lastRebalanceDate'           : encodeDate(portfolio.LastRebalanceDate),
+        'statisticsFrequency'         : portfolio.statisticsFrequency,
+        'checkpointFrequency'         : portfolio.checkpointFrequency,
+        'checkpointPath'              : portfolio.checkpointPath,
+        'timestamp'                   : portfolio.timestamp,
+        'backtestFolderName'          : portfolio.backtestFolderName,
+        'historyAssets'               : history.assets,
+        'historyTz'                   : str(history.tz) if history.tz is not None else None,
+        'ledgerTz'                    : str(portfolio.tradeLedger.tz) if portfolio.tradeLedger.tz is not None else None,
+        'statisticsNames'             : statisticsNames,
+        'accumulator'                 : {field : getattr(accumulator,field) for field in accumulatorFields},
+        'accumulatorFirstDate'        : encodeDate(accumulator.firstDate),
+        'accumulatorLastDate'         : encodeDate(accumulator.lastDate)
+    }
+
+    arrays = {
+        'state'            : np.array(json.dumps(state,cls=JournalEncoder)),
+        'positionArray'    : portfolio.positionArray,
+        'heldMask'         : portfolio.heldMask,
+        'historyDates'     : history.getDates(),
+        'statisticsDates'  : np.array([pd.Timestamp(date).value for date in statisticsDates],dtype=np.int64),
+        'statisticsValues' : statisticsValues,
+        'slippageEngine'   : encodeObject(portfolio.slippageEngine),
+        'rebalanceSchedule': encodeObject(portfolio.rebalanceSchedule),
+        'impactParams'     : encodeObject(dict(portfolio.impactParams)),
+        'customData'       : encodeObject(dict(portfolio.customData))
+    }
+    for name in ledgerColumns:
+        arrays['ledger_' + name] = portfolio.tradeLedger.getColumn(name)
+    if accumulator.lastWeights is not None:
+        arrays['accumulatorLastWeights'] = accumulator.lastWeights
+    if accumulator.lastPositions is not None:
+        arrays['accumulatorLastPositions'] = accumulator.lastPositions
+    for name in history.series:
+        arrays['series_' + name] = history.getSeries(name)
+    for name in history.matrices:
+        arrays['matrix_' + name] = history.getMatrix(name)
+
+    folder = os.path.dirname(path)
+    if folder != '' and not os.path.exists(folder):
+        os.makedirs(folder)
+
+    tempPath = path + '.tmp.npz'
+    np.savez(tempPath,**arrays)
+    os.replace(tempPath,path)
+
+def toDateKeys(dates,tz):
+    index = pd.DatetimeIndex(dates.view('datetime64[ns]'))
+    if tz is not None:
+        index = index.tz_localize('UTC').tz_convert(tz)
+    return list(index)
+
+def restoreCheckpoint(portfolio,path):
+    with np.load(path) as stored:
+        arrays = {name : stored[name] for name in stored.files}
+
+    state = json.loads(str(arrays['state']))
+
+    # Live state
+    portfolio.name = state['name']
+    portfolio.assets = list(state['assets'])
+    portfolio.assetIndex = {asset : i for i,asset in enumerate(portfolio.assets)}
+    portfolio.positionArray = arrays['positionArray'].astype(np.float64)
+    portfolio.heldMask = arrays['heldMask'].astype(bool)
+    portfolio.fixedTransactionCosts = dict((asset,cost) for asset,cost in state['fixedTransactionCosts'])
+    portfolio.borrowCosts = dict((asset,cost) for asset,cost in state['borrowCosts'])
+    # Impact parameters and custom data may hold any objects (frames, arrays, dates), they are pickled
+    # Checkpoints saved before that kept them as JSON in the state
+    if 'impactParams' in arrays:
+        portfolio.impactParams = decodeObject(arrays['impactParams'])
+    else:
+        portfolio.impactParams = dict((asset,params) for asset,params in state['impactParams'])
+    portfolio.updateCostArrays()
+
+    portfolio.cash = state['cash']
+    portfolio.datadump = state['datadump']
+    portfolio.datadumpFormat = state['datadumpFormat']
+    portfolio.journalFlushInterval = state['journalFlushInterval']
+    portfolio.annualManagementFee = state['annualManagementFee']
+    portfolio.slippageModel = state['slippageModel']
+    portfolio.slippageEngine = decodeObject(arrays['slippageEngine'])
+    portfolio.ownsSlippageEngine = state.get('ownsSlippageEngine',portfolio.slippageEngine is not None)
+    portfolio.rebalanceSchedule = decodeObject(arrays['rebalanceSchedule'])
+    portfolio.unwindUndefinedAssetWeights = state['unwindUndefinedAssetWeights']
+    portfolio.transactionCosts = state['transactionCosts']
+    portfolio.slippageCosts = state['slippageCosts']
+    portfolio.FirstRebalanceDate = decodeDate(state['firstRebalanceDate'],'N/A')
+    portfolio.LastRebalanceDate = decodeDate(state['lastRebalanceDate'],'N/A')
+    portfolio.statisticsFrequency = state['statisticsFrequency']
+    portfolio.checkpointFrequency = state['checkpointFrequency']
+    portfolio.checkpointPath = state['checkpointPath']
+    portfolio.timestamp = state['timestamp']
+    portfolio.backtestFolderName = state['backtestFolderName']
+
+    # History buffers, sized to the next power of two as if grown in place
+    history = HistoryStore(list(portfolio.history.series.keys()),list(portfolio.history.matrices.keys()))
+    numRows = len(arrays['historyDates'])
+    while history.rowCapacity < numRows:
+        history.growRows()
+    history.addAssets(state['historyAssets'])
+
+    history.tz = state['historyTz']
+    history.numRows = numRows
+    history.dates[:numRows] = arrays['historyDates']
+    history.dateIndex = {date : row for row,date in enumerate(toDateKeys(arrays['historyDates'],history.tz))}
+    for name in history.series:
+        history.series[name][:numRows] = arrays['series_' + name]
+    for name in history.matrices:
+        history.matrices[name][:numRows,:len(history.assets)] = arrays['matrix_' + name]
+    portfolio.history = history
+
+    # Trade ledger, empty for checkpoints saved before trades were recorded
+    ledger = TradeLedger()
+    numFills = len(arrays['ledger_Date']) if 'ledger_Date' in arrays else 0
+    if numFills > ledger.capacity:
+        ledger.grow(numFills)
+    for name in ledgerColumns:
+        if numFills > 0:
+            ledger.columns[name][:numFills] = arrays['ledger_' + name]
+    ledger.numRows = numFills
+    ledger.tz = state.get('ledgerTz')
+    portfolio.tradeLedger = ledger
+
+    # Performance statistics and accumulator
+    accumulator = PerformanceAccumulator()
+    for field,value in state['accumulator'].items():
+        setattr(accumulator,field,value)
+    accumulator.firstDate = decodeDate(state['accumulatorFirstDate'])
+    accumulator.lastDate = decodeDate(state['accumulatorLastDate'])
+    accumulator.lastWeights = arrays.get('accumulatorLastWeights')
+    accumulator.lastPositions = arrays.get('accumulatorLastPositions')
+    portfolio.performanceAccumulator = accumulator
+
+    statisticsDates = toDateKeys(arrays['statisticsDates'],history.tz)
+    portfolio.performanceStatistics = {
+        date : dict(zip(state['statisticsNames'],values.tolist())) for date,values in zip(statisticsDates,arrays['statisticsValues'])}
+
+    if 'customData' in arrays:
+        portfolio.customData = decodeObject(arrays['customData'])
+    else:
+        portfolio.customData = {decodeDate(date) : data for date,data in state['customData']}
+
+    # A resumed run carries on from the journal as it was at the checkpoint, days written after it are dropped
+    # Checkpoints saved before the journal state was recorded append to the existing journal
+    portfolio.journal = None
+    if 'journal' in state and portfolio.datadump == True and portfolio.datadumpFormat in journalFormats:
+        portfolio.openJournal(state['journal'])
+
+    return portfolio
@@ -0,0 +1,130 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+# Pluggable slippage models
+# A model turns a whole rebalance trade vector into per-asset slippage costs in one vectorized
+# call. Its parameters are resolved once into arrays aligned to the portfolio's asset universe and
+# can be given per field as
+#   - a scalar shared by every asset
+#   - a {asset : value} dictionary or a pandas Series indexed by asset
+#   - a NumPy array already aligned to the asset universe
+#   - a (dates x assets) DataFrame for time-varying parameters, the latest row on or before the
+#     rebalance date is used
+# The nested {asset : {field : value}} dictionaries of setImpactParams are accepted as well.
+# A field left out altogether takes its default. A field that is given must cover every traded
+# asset, trading an asset it leaves out (or leaves as NaN) raises rather than costing nothing.
+class SlippageModel:
+    name = ''
+    defaults = dict()
+
+    def __init__(self,params=None):
+        self.setParams(params if params is not None else dict())
+
+    def setParams(self,params):
+        if not isinstance(params,dict):
+            raise Exception('ERROR: Slippage model parameters must be a dictionary')
+
+        # Nested {asset : {field : value}} dictionaries are transposed to {field : {asset : value}}
+        if len(params) > 0 and not set(params.keys()) <= set(self.defaults.keys()):
+            fieldParams = {field : dict() for field in self.defaults}
+            for asset,assetParams in params.items():
+                for field,value in assetParams.items():
+                    if field in fieldParams:
+                        fieldParams[field][asset] = value
+            params = fieldParams
+
+        self.params = params
+        self.alignedUniverse = None
+        self.alignedParams = dict()
+
+    def getParams(self):
+        return self.params
+
+    def alignField(self,field,assets):
+        # Assets missing from a given field are left as NaN, getCosts raises when one of them trades
+        if field not in self.params:
+            return np.full(len(assets),float(self.defaults[field]))
+        source = self.params[field]
+
+        if isinstance(source,pd.DataFrame):
+            dates = pd.DatetimeIndex(source.index).as_unit('ns').asi8
+            return [dates,source.reindex(columns=assets).to_numpy(dtype=np.float64)]
+        elif isinstance(source,pd.Series):
+            return source.reindex(assets).to_numpy(dtype=np.float64)
+        elif isinstance(source,dict):
+            return np.array([source.get(asset,np.nan) for asset in assets],dtype=np.float64)
+        elif isinstance(source,np.ndarray):
+            if source.shape != (len(assets),):
+                raise Exception(f'ERROR: {field} array is not aligned to the asset universe')
+            return source.astype(np.float64)
+        else:
+            return np.full(len(assets),float(source))
+
+    def getAlignedParams(self,assets,date=None):
+        # Alignment is cached per universe, keyed on its contents as one model may serve several portfolios
+        universe = tuple(assets)
+        if universe != self.alignedUniverse:
+            self.alignedParams = {field : self.alignField(field,assets) for field in self.defaults}
+            self.alignedUniverse = universe
+
+        params = dict()
+        for field,aligned in self.alignedParams.items():
+            if isinstance(aligned,list):
+                dates,values = aligned
+                row = np.searchsorted(dates,pd.Timestamp(date).value,side='right') - 1 if date is not None else len(dates) - 1
+                params[field] = values[row] if row >= 0 else np.full(len(assets),np.nan)
+            else:
+                params[field] = aligned
+        return params
+
+    def getSlippageRates(self,tradeUnits,positions,params):
+        raise Exception(f'ERROR: {type(self).__name__} does not define getSlippageRates')
+
+    def getCosts(self,assets,date,index,tradeValue,tradeUnits,positions):
+        # Per-asset slippage costs of the traded assets at the given universe indices
+        params = {field : values[index] for field,values in self.getAlignedParams(assets,date).items()}
+        for field,values in params.items():
+            missing = np.isnan(values) & (tradeValue != 0)
+            if missing.any():
+                missingAssets = [str(assets[i]) for i in index[missing]]
+                raise Exception(f'ERROR: Missing impact parameters for {",".join(missingAssets)} ({field})')
+        with np.errstate(invalid='ignore'):
+            return np.where(tradeValue != 0,tradeValue * self.getSlippageRates(tradeUnits,positions,params),0.0)
+
+# Square root market impact on top of half the bid ask spread
+# As in the original model, participation is measured on the resulting position size
+class SquareRootImpact(SlippageModel):
+    name = 'squarerootimpact'
+    defaults = {'ADV' : np.inf,'Volatility' : 0.0,'BidAskSpread' : 0.0,'ScalingFactor' : 0.0}
+
+    def getSlippageRates(self,tradeUnits,positions,params):
+        return params['BidAskSpread'] + params['ScalingFactor']*(1/math.sqrt(252))*params['Volatility']*np.sqrt(np.abs(positions)/params['ADV'])
+
+# Impact linear in the traded fraction of average daily volume
+class LinearImpact(SlippageModel):
+    name = 'linearimpact'
+    defaults = {'ADV' : np.inf,'BidAskSpread' : 0.0,'ImpactCoefficient' : 0.0}
+
+    def getSlippageRates(self,tradeUnits,positions,params):
+        return params['BidAskSpread'] + params['ImpactCoefficient'] * np.abs(tradeUnits) / params['ADV']
+
+# Constant cost in basis points of traded value
+class FixedBps(SlippageModel):
+    name = 'fixedbps'
+    defaults = {'Bps' : 0.0}
+
+    def getSlippageRates(self,tradeUnits,positions,params):
+        return params['Bps'] / 10_000
+
+slippageModels = {model.name : model for model in [SquareRootImpact,LinearImpact,FixedBps]}
+
+def createSlippageModel(slippageModel,params=None):
+    # Accepts a model name, configured with params, or an already configured model
+    if isinstance(slippageModel,SlippageModel):
+        return slippageModel
+    elif slippageModel in slippageModels:
+        return slippageModels[slippageModel](params)
+    else:
+        raise Exception(f'ERROR: Choose from {",".join(slippageModels.keys())} or pass a SlippageModel')
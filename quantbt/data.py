@@ -1,29 +1,58 @@
 import os
-import sys
-import time
-import json
-import math
-import copy
-import base64
-import getpass
-import warnings
-import requests
-import logging
 
 import numpy  as np
 import pandas as pd
-import yfinance as yf
-from datetime import datetime
+
+from .cache import *
+from .store import *
+from .instrumentation import *
+from .loader import *
 
 class csvDataHandler:
-    def __init__(self,datasources):
+    def __init__(self,datasources,dataFolder='data',storeFolder=None,useStore=True):
         # Initialize a map of file strings to pull csv data from
         self.datasources = datasources
+        self.dataFolder = dataFolder
+
+        # CSVs are converted once into memory-mapped binary stores and reloaded from there
+        self.storeFolder = storeFolder if storeFolder is not None else os.path.join(dataFolder,'store')
+        self.useStore = useStore
+        self.instrumentation = None
+        self.loadErrors = dict()
+
+    def setInstrumentation(self,instrumentation):
+        self.instrumentation = instrumentation
+
+    def getStore(self,source):
+        sourceName = self.datasources[source]
+        csvPath = os.path.join(self.dataFolder,sourceName)
+        storePath = os.path.join(self.storeFolder,sourceName)
+
+        # Re-convert whenever the CSV changed since the store was built
+        if not MemoryMappedPriceStore.isCurrent(storePath,csvPath):
+            convertCSVToStore(csvPath,storePath)
+
+        return MemoryMappedPriceStore(storePath)
     
-    def getDataFromSource(self,source,formatOut='dataframe'):
+    @instrumented('csvDataHandler.getDataFromSource')
+    def getDataFromSource(self,source,formatOut='dataframe',columns=None,startDate=None,endDate=None):
         sourceName = self.datasources[source]
         try:
-            data = pd.read_csv(f'data/{sourceName}',index_col=[0],parse_dates=True)
+            if self.useStore == True:
+                store = self.getStore(source)
+
+                # Stream rows lazily instead of building the nested dictionary up front
+                if formatOut.lower() == 'stream':
+                    rows = store.getRowSlice(startDate,endDate)
+                    return [list(store.getDateIndex(rows)),store.iterRows(columns,startDate,endDate)]
+
+                data = store.getFrame(columns,startDate,endDate)
+            else:
+                data = pd.read_csv(os.path.join(self.dataFolder,sourceName),index_col=[0],parse_dates=True)
+                if columns is not None:
+                    data = data[columns]
+                data = data.loc[startDate:endDate]
+
             dates = list(data.index)
             
             if formatOut.lower() == 'dataframe':
@@ -37,13 +66,90 @@ class csvDataHandler:
         except:
             raise Exception(f'ERROR: Cannot read source {sourceName}')
 
+    @instrumented('csvDataHandler.getBulkDataFromSources')
+    def getBulkDataFromSources(self,sources=None,formatOut='dataframe',column=None,startDate=None,endDate=None,maxWorkers=8,retries=2,timeout=None,skipErrors=False):
+        # Parses many sources (e.g. one file per symbol) concurrently into one dates x sources panel
+        # column picks one field of multi column files, failed sources are dropped when skipErrors is set
+        sources = list(self.datasources.keys()) if sources is None else list(sources)
+        columns = [column] if column is not None else None
+
+        tasks = {source : (lambda source=source: self.getDataFromSource(source,'dataframe',columns,startDate,endDate)[1]) for source in sources}
+        frames,self.loadErrors = loadConcurrently(tasks,maxWorkers,retries,timeout)
+
+        if len(self.loadErrors) > 0 and skipErrors == False:
+            raise Exception(f'ERROR: Cannot read sources {",".join(str(source) for source in self.loadErrors)}')
+
+        data = alignPanel({source : frames[source] for source in sources if source in frames})
+        dates = list(data.index)
+
+        if formatOut.lower() == 'dataframe':
+            return [dates,data]
+
+        elif formatOut.lower() == 'dictionary':
+            return [dates,data.to_dict(orient='index')]
+
+        else:
+            raise Exception('ERROR: Invalid Output Format')
+
 class yfDataHandler:
-    def __init__(self,tickers):
+    def __init__(self,tickers,cache=None,downloader=yahooDownloader):
         self.tickers = tickers
+        # Optional LocalPriceCache, only missing date ranges are then downloaded
+        self.cache = cache
+        self.downloader = downloader
+        self.instrumentation = None
+        self.loadErrors = dict()
+
+    def setInstrumentation(self,instrumentation):
+        self.instrumentation = instrumentation
     
+    @instrumented('yfDataHandler.getDataFromSource')
     def getDataFromSource(self, startDate, endDate, columns = ['Adj Close'],formatOut='dataframe'):
 
-        data = yf.download(self.tickers, startDate, endDate)
+        if self.cache is not None:
+            data = self.cache.getData(self.tickers, startDate, endDate, columns)
+        else:
+            data = self.downloader(self.tickers, startDate, endDate)
+
+        # Only use the CA Adjusted Close columns
+        data = data[columns]; data.columns = data.columns.droplevel()
+
+        dates = data.index
+
+        if formatOut.lower() == 'dataframe':
+            return [dates,data]
+        else:
+            return [dates,data.to_dict(orient='index')]
+
+    def downloadBatch(self,tickers,startDate,endDate,columns):
+        if self.cache is not None:
+            data = self.cache.getData(tickers,startDate,endDate,columns)
+        else:
+            data = self.downloader(tickers,startDate,endDate)
+
+        # Single ticker downloads may come back without the ticker column level
+        if not isinstance(data.columns,pd.MultiIndex):
+            data.columns = pd.MultiIndex.from_product([data.columns,tickers])
+
+        return data[columns]
+
+    @instrumented('yfDataHandler.getBulkDataFromSources')
+    def getBulkDataFromSources(self,startDate,endDate,columns = ['Adj Close'],formatOut='dataframe',batchSize=50,maxWorkers=4,retries=2,timeout=None,skipErrors=False):
+        # Downloads the tickers in batches on a bounded thread pool, failed batches are retried
+        # and dropped when skipErrors is set
+        batches = [self.tickers[i:i + batchSize] for i in range(0,len(self.tickers),batchSize)]
+        tasks = {i : (lambda batch=batch: self.downloadBatch(batch,startDate,endDate,columns)) for i,batch in enumerate(batches)}
+        frames,errors = loadConcurrently(tasks,maxWorkers,retries,timeout)
+
+        self.loadErrors = {tuple(batches[i]) : error for i,error in errors.items()}
+        if len(errors) > 0 and skipErrors == False:
+            raise Exception(f'ERROR: Cannot download tickers {",".join(ticker for i in errors for ticker in batches[i])}')
+
+        if len(frames) == 0:
+            raise Exception('ERROR: No tickers could be downloaded')
+
+        # One concatenation of every batch, in ticker order
+        data = pd.concat([frames[i] for i in range(len(batches)) if i in frames],axis=1,sort=True)
 
         # Only use the CA Adjusted Close columns
         data = data[columns]; data.columns = data.columns.droplevel()
@@ -53,4 +159,4 @@ class yfDataHandler:
         if formatOut.lower() == 'dataframe':
             return [dates,data]
         else:
-            return [dates,data.to_dict(orient='index')]
\ No newline at end of file
+            return [dates,data.to_dict(orient='index')]
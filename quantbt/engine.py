@@ -0,0 +1,239 @@
+import numpy as np
+import pandas as pd
+
+from .analytics import *
+from .schedule import *
+from .costs import *
+
+# Vectorized whole-history backtest for strategies with precomputed target weights
+# Mirrors the accounting of Portfolio.rebalance and Portfolio.signOff, but holds the
+# full history as (dates x assets) NumPy arrays and processes each holding period
+# between two rebalances in a single pass
+class VectorizedPortfolio:
+    def __init__(self,positions,cash,name=''):
+
+        # Portfolio Parameters
+        self.name = name
+        self.initialPositions = positions
+        self.initialCash = cash
+        self.fixedTransactionCosts = dict()
+        self.borrowCosts = dict()
+        self.annualManagementFee = 0.0
+        self.slippageModel = ''
+        self.slippageEngine = None
+        self.ownsSlippageEngine = False
+        self.impactParams = dict()
+        self.unwindUndefinedAssetWeights = True
+
+        # Time Series Data (populated by run)
+        self.dates = None
+        self.assets = []
+        self.nav = None
+        self.positions = None
+        self.weights = None
+        self.cash = None
+        self.tCosts = None
+        self.slippageCosts = None
+        self.borrowCostsPaid = None
+
+    # Get Methods
+    def getPortfolioName(self):
+        return self.name
+
+    def getAllFixedTransactionCosts(self):
+        return self.fixedTransactionCosts
+
+    def getAllBorrowCosts(self):
+        return self.borrowCosts
+
+    def getAnnualManagementFee(self):
+        return self.annualManagementFee
+
+    def getSlippageModel(self):
+        return self.slippageModel
+
+    def getImpactParams(self):
+        return self.impactParams
+
+    def getHistoricalNAV(self):
+        return pd.DataFrame(self.nav,index=self.dates,columns=['Historical NAV'])
+
+    def getHistoricalPositions(self):
+        return pd.DataFrame(self.positions,index=self.dates,columns=self.assets)
+
+    def getHistoricalWeights(self):
+        return pd.DataFrame(self.weights,index=self.dates,columns=self.assets)
+
+    def getHistoricalTCosts(self):
+        return pd.DataFrame(self.tCosts,index=self.dates,columns=['Cumulative Transaction Costs'])
+
+    def getHistoricalSlippageCosts(self):
+        return pd.DataFrame(self.slippageCosts,index=self.dates,columns=['Cumulative Slippage Costs'])
+
+    def getHistoricalBorrowCosts(self):
+        return pd.DataFrame(self.borrowCostsPaid,index=self.dates,columns=['Daily Borrow Costs'])
+
+    def getHistoricalCash(self):
+        return pd.DataFrame(self.cash,index=self.dates,columns=['Historical Cash Account'])
+
+    def getPerformanceStatistics(self):
+        stats = performanceSummary(
+            dict(zip(self.dates,self.nav)),
+            self.weights,
+            self.positions,
+            dict(zip(self.dates,self.tCosts)),
+            dict(zip(self.dates,self.slippageCosts)))
+
+        return pd.DataFrame.from_dict({self.dates[-1] : stats},orient='index')
+
+    # Set Methods
+    def setFixedTransactionCosts(self,fixedTransactionCosts):
+        if isinstance(fixedTransactionCosts,dict):
+            self.fixedTransactionCosts = fixedTransactionCosts
+        else:
+            raise Exception('ERROR: Transaction costs must be a dictionary of asset names and costs')
+
+    def setBorrowCosts(self,fixedBorrowCosts):
+        if isinstance(fixedBorrowCosts,dict):
+            self.borrowCosts = fixedBorrowCosts
+        else:
+            raise Exception('ERROR: Borrow costs must be a dictionary of asset names and annualized costs')
+
+    def setSlippageModel(self,slippageModel):
+        # A SlippageModel object keeps its own parameters, setImpactParams never changes them
+        self.slippageEngine = createSlippageModel(slippageModel,self.impactParams)
+        self.slippageModel = self.slippageEngine.name
+        self.ownsSlippageEngine = not isinstance(slippageModel,SlippageModel)
+
+    def setImpactParams(self,impactParams):
+        if isinstance(impactParams,dict):
+            self.impactParams = impactParams
+            if self.ownsSlippageEngine:
+                self.slippageEngine.setParams(impactParams)
+        else:
+            raise Exception('ERROR: Impact Parameters must be a dictionary')
+
+    def setAnnualManagementFee(self,annualManagementFee):
+        self.annualManagementFee = annualManagementFee
+
+    def setUnwindUndefinedAssetWeights(self,unwindUndefinedAssetWeights):
+        self.unwindUndefinedAssetWeights = unwindUndefinedAssetWeights
+
+    # Aligned parameter vectors
+    def assetVector(self,parameters,default=0.0):
+        return np.array([parameters.get(asset,default) for asset in self.assets],dtype=np.float64)
+
+    # Backtest Methods
+    def run(self,prices,weights,rebalanceMask=None):
+        # Target weights are aligned to the price universe, NaN means the asset is not in the target
+        weights = weights.reindex(index=prices.index,columns=prices.columns)
+
+        self.dates = prices.index
+        self.assets = list(prices.columns)
+
+        priceMatrix = prices.to_numpy(dtype=np.float64)
+        weightMatrix = weights.to_numpy(dtype=np.float64)
+        numDates,numAssets = priceMatrix.shape
+
+        # Rebalance on every date with at least one target weight unless told otherwise
+        if rebalanceMask is None:
+            rebalanceMask = ~np.isnan(weightMatrix).all(axis=1)
+        elif isinstance(rebalanceMask,RebalanceSchedule):
+            rebalanceMask = rebalanceMask.getMask(prices.index)
+        else:
+            rebalanceMask = np.asarray(rebalanceMask,dtype=bool)
+
+        rebalanceIndex = np.flatnonzero(rebalanceMask)
+
+        # Cost parameters as aligned vectors
+        fixedTCosts = self.assetVector(self.fixedTransactionCosts)
+        dailyBorrowRates = (1 + self.assetVector(self.borrowCosts)) ** (1/260) - 1
+        dailyFeeRate = (1 + self.annualManagementFee) ** (1/260) - 1
+
+        # History arrays
+        self.nav = np.empty(numDates)
+        self.positions = np.full((numDates,numAssets),np.nan)
+        self.weights = np.full((numDates,numAssets),np.nan)
+        self.cash = np.empty(numDates)
+        self.tCosts = np.empty(numDates)
+        self.slippageCosts = np.empty(numDates)
+        self.borrowCostsPaid = np.empty(numDates)
+
+        # Live state
+        positions = self.assetVector(self.initialPositions)
+        held = np.array([asset in self.initialPositions for asset in self.assets],dtype=bool)
+        cash = float(self.initialCash)
+        cumulativeTCosts = 0.0
+        cumulativeSlippageCosts = 0.0
+
+        # Each holding period starts at a rebalance date and runs until the next one
+        boundaries = np.concatenate([[0],rebalanceIndex[rebalanceIndex > 0],[numDates]])
+
+        for start,end in zip(boundaries[:-1],boundaries[1:]):
+
+            if rebalanceMask[start]:
+                price = priceMatrix[start]
+                target = weightMatrix[start]
+                inTarget = ~np.isnan(target)
+
+                # Current NAV is the mark to market using latest positions, current close prices and cash account
+                currentNAV = np.where(held,positions * price,0.0).sum() + cash
+
+                # Unwind assets not in the target weights
+                if self.unwindUndefinedAssetWeights:
+                    positions = np.where(held & ~inTarget,0.0,positions)
+
+                targetUnits = np.where(inTarget,target * currentNAV / price,positions)
+                unitsToTrade = np.where(inTarget,targetUnits - positions,0.0)
+
+                positions = targetUnits
+                held = held | inTarget
+
+                # Fixed transaction costs
+                tradeValue = np.abs(unitsToTrade[inTarget]) * price[inTarget]
+                tCosts = (tradeValue * fixedTCosts[inTarget]).sum()
+
+                # Slippage costs, not accounting for the impact of funding the portfolio
+                if self.slippageEngine is not None and start != rebalanceIndex[0]:
+                    traded = np.flatnonzero(inTarget)
+                    slippageCosts = self.slippageEngine.getCosts(self.assets,self.dates[start],traded,tradeValue,unitsToTrade[traded],positions[traded]).sum()
+                else:
+                    slippageCosts = 0.0
+
+                cumulativeTCosts += tCosts
+                cumulativeSlippageCosts += slippageCosts
+
+                # Short proceeds and excess cash net out to the unallocated fraction of NAV
+                cash = (1.0 - target[inTarget].sum()) * currentNAV - tCosts - slippageCosts
+
+            # Mark to market the holding period with fixed positions
+            priceBlock = priceMatrix[start:end]
+            positionValue = np.where(held,positions * priceBlock,0.0)
+            marketValue = positionValue.sum(axis=1)
+
+            # Only short positions incur borrow costs (annualized)
+            isShort = held & (positions < 0)
+            borrowCosts = np.abs(positionValue[:,isShort] * dailyBorrowRates[isShort]).sum(axis=1)
+
+            # Management fees are charged on the NAV before fees, so cash follows
+            # cash[t] = (1 - fee) * cash[t-1] - fee * marketValue[t] - borrowCosts[t]
+            outflows = dailyFeeRate * marketValue + borrowCosts
+            if dailyFeeRate == 0.0:
+                cashPath = cash - np.cumsum(outflows)
+            else:
+                decay = (1 - dailyFeeRate) ** np.arange(1,end - start + 1)
+                cashPath = decay * (cash - np.cumsum(outflows / decay))
+
+            nav = marketValue + cashPath
+
+            self.nav[start:end] = nav
+            self.cash[start:end] = cashPath
+            self.positions[start:end] = np.where(held,positions,np.nan)
+            self.weights[start:end] = np.where(held,positionValue,np.nan) / nav[:,None]
+            self.tCosts[start:end] = cumulativeTCosts
+            self.slippageCosts[start:end] = cumulativeSlippageCosts
+            self.borrowCostsPaid[start:end] = borrowCosts
+
+            cash = cashPath[-1]
+
+        return self
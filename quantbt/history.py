@@ -0,0 +1,304 @@
+import itertools
+from collections.abc import Mapping
+
+import numpy as np
+import pandas as pd
+
+# Columnar, append-only store for daily portfolio history
+# Scalar series (NAV, cash, costs) are held as growable float64 vectors and per-asset
+# snapshots (positions, weights) as growable float64 (dates x assets) matrices, with
+# capacity doubled whenever a row or an asset column runs out
+#
+# A forked store shares the first baseRows rows of a base store instead of copying them, and only
+# holds the rows appended after the fork in its own buffers. The base must not be appended to
+# once forked (Portfolio.fork moves the parent onto a fork of its own); overwriting a shared date
+# copies the shared rows into the fork first.
+class HistoryStore:
+    def __init__(self,seriesNames,matrixNames,rowCapacity=256,assetCapacity=16):
+        # Shared prefix, numRows and the buffers only count the rows after it
+        self.base = None
+        self.baseRows = 0
+
+        self.numRows = 0
+        self.rowCapacity = rowCapacity
+        self.assetCapacity = assetCapacity
+
+        # Date index: nanosecond timestamps plus a lookup of the original date keys
+        self.tz = None
+        self.dates = np.empty(rowCapacity,dtype=np.int64)
+        self.dateIndex = dict()
+
+        # Asset to column map
+        self.assets = []
+        self.assetIndex = dict()
+
+        self.series = {name : np.full(rowCapacity,np.nan) for name in seriesNames}
+        self.matrices = {name : np.full((rowCapacity,assetCapacity),np.nan) for name in matrixNames}
+
+    def __len__(self):
+        return self.baseRows + self.numRows
+
+    def fork(self):
+        # A store forked from one without rows of its own shares that store's base directly
+        if self.numRows == 0 and self.base is not None:
+            base,baseRows = self.base,self.baseRows
+        else:
+            base,baseRows = self,len(self)
+
+        assetCapacity = 16
+        while assetCapacity < len(self.assets):
+            assetCapacity *= 2
+
+        forked = HistoryStore(list(self.series.keys()),list(self.matrices.keys()),rowCapacity=4,assetCapacity=assetCapacity)
+        forked.base = base
+        forked.baseRows = baseRows
+        forked.tz = self.tz
+        forked.addAssets(self.assets)
+        return forked
+
+    def detach(self):
+        # Copies the shared rows into the store's own buffers
+        if self.base is None:
+            return
+
+        dates,dateKeys = self.getDates(),list(self.iterDates())
+        series = {name : self.getSeries(name).copy() for name in self.series}
+        matrices = {name : self.getMatrix(name).copy() for name in self.matrices}
+
+        self.base = None
+        self.baseRows = 0
+        self.numRows = 0
+        self.dateIndex = dict()
+        while self.rowCapacity < len(dates):
+            self.growRows()
+
+        self.numRows = len(dates)
+        self.dates[:self.numRows] = dates
+        self.dateIndex = {date : row for row,date in enumerate(dateKeys)}
+        for name,values in series.items():
+            self.series[name][:self.numRows] = values
+        for name,values in matrices.items():
+            self.matrices[name][:self.numRows,:len(self.assets)] = values
+
+    def getRow(self,date):
+        # Row of a date counting the shared rows, None for unknown dates
+        if date in self.dateIndex:
+            return self.baseRows + self.dateIndex[date]
+        elif self.base is not None:
+            row = self.base.getRow(date)
+            if row is not None and row < self.baseRows:
+                return row
+        return None
+
+    def hasDate(self,date):
+        return self.getRow(date) is not None
+
+    def iterDates(self):
+        # Date keys in row order
+        if self.base is not None:
+            yield from itertools.islice(self.base.iterDates(),self.baseRows)
+        yield from self.dateIndex
+
+    def growRows(self):
+        newCapacity = 2 * self.rowCapacity
+
+        dates = np.empty(newCapacity,dtype=np.int64)
+        dates[:self.numRows] = self.dates[:self.numRows]
+        self.dates = dates
+
+        for name,values in self.series.items():
+            grown = np.full(newCapacity,np.nan)
+            grown[:self.numRows] = values[:self.numRows]
+            self.series[name] = grown
+
+        for name,values in self.matrices.items():
+            grown = np.full((newCapacity,self.assetCapacity),np.nan)
+            grown[:self.numRows] = values[:self.numRows]
+            self.matrices[name] = grown
+
+        self.rowCapacity = newCapacity
+
+    def growAssets(self,numAssets):
+        newCapacity = self.assetCapacity
+        while newCapacity < numAssets:
+            newCapacity *= 2
+
+        for name,values in self.matrices.items():
+            grown = np.full((self.rowCapacity,newCapacity),np.nan)
+            grown[:self.numRows,:len(self.assets)] = values[:self.numRows,:len(self.assets)]
+            self.matrices[name] = grown
+
+        self.assetCapacity = newCapacity
+
+    def addAssets(self,assets):
+        # Returns the column of each asset, assigning new columns to unseen assets
+        newAssets = [asset for asset in assets if asset not in self.assetIndex]
+
+        if len(newAssets) > 0:
+            if len(self.assets) + len(newAssets) > self.assetCapacity:
+                self.growAssets(len(self.assets) + len(newAssets))
+
+            for asset in newAssets:
+                self.assetIndex[asset] = len(self.assets)
+                self.assets.append(asset)
+
+        return np.fromiter((self.assetIndex[asset] for asset in assets),dtype=np.intp,count=len(assets))
+
+    def append(self,date,scalars,columns=None,matrixRows=None):
+        # Signing off the same date twice overwrites the earlier snapshot
+        if self.hasDate(date):
+            if date not in self.dateIndex:
+                self.detach()
+            row = self.dateIndex[date]
+            for values in self.matrices.values():
+                values[row] = np.nan
+        else:
+            if self.numRows == self.rowCapacity:
+                self.growRows()
+
+            timestamp = pd.Timestamp(date)
+            if len(self) == 0:
+                self.tz = timestamp.tz
+
+            row = self.numRows
+            self.dates[row] = timestamp.value
+            self.dateIndex[date] = row
+            self.numRows += 1
+
+        for name,value in scalars.items():
+            self.series[name][row] = value
+
+        if matrixRows is not None:
+            for name,values in matrixRows.items():
+                self.matrices[name][row,columns] = values
+
+    def appendBlock(self,dates,scalars,columns=None,matrixBlocks=None):
+        # Appends several new dates at once, dates already in the store go through append
+        if len(set(dates)) < len(dates) or any(self.hasDate(date) for date in dates):
+            for i,date in enumerate(dates):
+                self.append(
+                    date,
+                    {name : values[i] for name,values in scalars.items()},
+                    columns,
+                    {name : values[i] for name,values in matrixBlocks.items()} if matrixBlocks is not None else None)
+            return
+
+        while self.numRows + len(dates) > self.rowCapacity:
+            self.growRows()
+
+        timestamps = pd.DatetimeIndex(dates)
+        if len(self) == 0 and len(dates) > 0:
+            self.tz = timestamps.tz
+
+        rows = slice(self.numRows,self.numRows + len(dates))
+        self.dates[rows] = timestamps.as_unit('ns').asi8
+        for i,date in enumerate(dates):
+            self.dateIndex[date] = self.numRows + i
+        self.numRows += len(dates)
+
+        for name,values in scalars.items():
+            self.series[name][rows] = values
+
+        if matrixBlocks is not None:
+            for name,values in matrixBlocks.items():
+                self.matrices[name][rows,columns] = values
+
+    # Zero-copy views over the filled part of the buffers, forked stores concatenate the shared rows
+    def getDates(self):
+        if self.base is None:
+            return self.dates[:self.numRows]
+        return np.concatenate([self.base.getDates()[:self.baseRows],self.dates[:self.numRows]])
+
+    def getDateIndex(self,name=None):
+        index = pd.DatetimeIndex(self.getDates().view('datetime64[ns]'),name=name)
+        if self.tz is not None:
+            index = index.tz_localize('UTC').tz_convert(self.tz)
+        return index
+
+    def getSeries(self,name):
+        if self.base is None:
+            return self.series[name][:self.numRows]
+        return np.concatenate([self.base.getSeries(name)[:self.baseRows],self.series[name][:self.numRows]])
+
+    def getMatrix(self,name):
+        return self.getMatrixRows(name,0,len(self))
+
+    def getMatrixRows(self,name,start,stop):
+        # Rows start to stop, only the part before the fork is read from the base
+        own = self.matrices[name][max(start - self.baseRows,0):max(stop - self.baseRows,0),:len(self.assets)]
+        if self.base is None or start >= self.baseRows:
+            return own
+
+        shared = self.base.getMatrixRows(name,start,min(stop,self.baseRows))
+        padded = np.full((len(shared),len(self.assets)),np.nan)
+        padded[:,:shared.shape[1]] = shared
+        return np.concatenate([padded,own])
+
+    def getValue(self,name,row):
+        if row < self.baseRows:
+            return self.base.getValue(name,row)
+        return float(self.series[name][row - self.baseRows])
+
+    def getMatrixRow(self,name,row):
+        if row < self.baseRows:
+            shared = self.base.getMatrixRow(name,row)
+            padded = np.full(len(self.assets),np.nan)
+            padded[:len(shared)] = shared
+            return padded
+        return self.matrices[name][row - self.baseRows,:len(self.assets)]
+
+    def getSeriesFrame(self,name,column):
+        return pd.DataFrame(self.getSeries(name)[:,None],index=self.getDateIndex(),columns=[column],copy=False)
+
+    def getMatrixFrame(self,name):
+        return pd.DataFrame(self.getMatrix(name),index=self.getDateIndex('Dates'),columns=list(self.assets),copy=False)
+
+    def getSeriesView(self,name):
+        return SeriesView(self,name)
+
+    def getMatrixView(self,name):
+        return MatrixView(self,name)
+
+# Lazy {date : value} view over a scalar history series
+class SeriesView(Mapping):
+    def __init__(self,store,name):
+        self.store = store
+        self.name = name
+
+    def __getitem__(self,date):
+        row = self.store.getRow(date)
+        if row is None:
+            raise KeyError(date)
+        return self.store.getValue(self.name,row)
+
+    def __iter__(self):
+        return self.store.iterDates()
+
+    def __len__(self):
+        return len(self.store)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+# Lazy {date : {asset : value}} view over a per-asset history matrix
+# Assets not yet held on a date are left out, as in the original snapshots
+class MatrixView(Mapping):
+    def __init__(self,store,name):
+        self.store = store
+        self.name = name
+
+    def __getitem__(self,date):
+        row = self.store.getRow(date)
+        if row is None:
+            raise KeyError(date)
+        values = self.store.getMatrixRow(self.name,row)
+        return {asset : float(value) for asset,value in zip(self.store.assets,values) if not np.isnan(value)}
+
+    def __iter__(self):
+        return self.store.iterDates()
+
+    def __len__(self):
+        return len(self.store)
+
+    def __repr__(self):
+        return repr(dict(self))
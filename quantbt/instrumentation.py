@@ -0,0 +1,116 @@
+import time
+import functools
+import threading
+
+import pandas as pd
+
+# Shared do-nothing context manager used whenever instrumentation is disabled
+class NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,excType,excValue,traceback):
+        return False
+
+nullTimer = NullTimer()
+
+class PhaseTimer:
+    __slots__ = ('instrumentation','name','start')
+
+    def __init__(self,instrumentation,name):
+        self.instrumentation = instrumentation
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self,excType,excValue,traceback):
+        self.instrumentation.record(self.name,time.perf_counter() - self.start)
+        return False
+
+# Collects call counts and wall-clock timings of named hot-path phases
+# Hooks are callables hook(name,seconds) invoked on every recorded call, for
+# forwarding the metrics to an external collector
+# Calls may be recorded from several threads (the bulk loaders' workers), the counters are updated under a lock
+class Instrumentation:
+    def __init__(self,hooks=None):
+        self.hooks = list(hooks) if hooks is not None else []
+        self.lock = threading.Lock()
+        self.reset()
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['lock']
+        return state
+
+    def __setstate__(self,state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def reset(self):
+        with self.lock:
+            self.counts = dict()
+            self.totals = dict()
+            self.maxima = dict()
+
+    def addHook(self,hook):
+        self.hooks.append(hook)
+
+    def removeHook(self,hook):
+        self.hooks.remove(hook)
+
+    def timer(self,name):
+        return PhaseTimer(self,name)
+
+    def record(self,name,seconds):
+        with self.lock:
+            if name in self.counts:
+                self.counts[name] += 1
+                self.totals[name] += seconds
+                if seconds > self.maxima[name]:
+                    self.maxima[name] = seconds
+            else:
+                self.counts[name] = 1
+                self.totals[name] = seconds
+                self.maxima[name] = seconds
+
+        for hook in self.hooks:
+            hook(name,seconds)
+
+    def getSummary(self):
+        with self.lock:
+            counts,totals,maxima = dict(self.counts),dict(self.totals),dict(self.maxima)
+
+        summary = pd.DataFrame({
+            'Calls'         : pd.Series(counts,dtype='int64'),
+            'Total Seconds' : pd.Series(totals,dtype='float64'),
+            'Mean Seconds'  : pd.Series(totals,dtype='float64') / pd.Series(counts,dtype='float64'),
+            'Max Seconds'   : pd.Series(maxima,dtype='float64')
+        })
+        summary.index.name = 'Phase'
+        return summary.sort_values('Total Seconds',ascending=False)
+
+    def printSummary(self):
+        print(self.getSummary().to_string())
+
+def profile(instrumentation,name):
+    if instrumentation is None:
+        return nullTimer
+    else:
+        return instrumentation.timer(name)
+
+# Times a whole method when its object has instrumentation enabled
+def instrumented(name):
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self,*args,**kwargs):
+            if self.instrumentation is None:
+                return method(self,*args,**kwargs)
+
+            with self.instrumentation.timer(name):
+                return method(self,*args,**kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,334 @@
+import io
+import os
+import json
+import struct
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+from .history import *
+
+# Scalar fields of a daily node, mapped to the history series they are read back into
+journalSeries = {
+    'NAV'             : 'NAV',
+    'TransactionCosts': 'TCosts',
+    'SlippageCosts'   : 'SlippageCosts',
+    'DailyBorrowCost' : 'BorrowCosts',
+    'Cash'            : 'Cash'
+}
+
+# Fields of a daily node kept as (JSON encoded) text in the columnar formats
+journalText = ['FirstRebalanceDate','LastRebalanceDate','SlippageModel','FixedTransactionCosts','CustomData']
+
+journalFormats = {
+    'jsonl'   : 'journal.jsonl',
+    'npz'     : 'journal.npzs',
+    'parquet' : 'journal.parquet'
+}
+
+# Serialize dates as ISO strings and NumPy values as native Python values
+# Anything else that JSON cannot represent falls back to its string form
+class JournalEncoder(json.JSONEncoder):
+    def default(self,obj):
+        if isinstance(obj,(datetime,date)):
+            return obj.isoformat()
+        elif isinstance(obj,np.generic):
+            return obj.item()
+        elif isinstance(obj,np.ndarray):
+            return obj.tolist()
+        else:
+            return str(obj)
+
+def getJournalPartPath(path,part):
+    # Part 0 is the journal path itself, parquet journals resumed from a checkpoint continue in journal.partN.parquet
+    if part == 0:
+        return path
+    stem,extension = os.path.splitext(path)
+    return f'{stem}.part{part}{extension}'
+
+def getJournalPartPaths(path):
+    paths = []
+    while os.path.exists(getJournalPartPath(path,len(paths))):
+        paths.append(getJournalPartPath(path,len(paths)))
+    return paths
+
+def nodesToColumns(nodes):
+    # Union of assets across the batch, in order of first appearance
+    assetIndex = dict()
+    for node in nodes:
+        for asset in node['Positions']:
+            assetIndex.setdefault(asset,len(assetIndex))
+
+    performanceKeys = list(nodes[0]['Performance'].keys())
+
+    columns = {
+        'Date'        : np.array([pd.Timestamp(node['Date']).value for node in nodes],dtype=np.int64),
+        'Assets'      : np.array([str(asset) for asset in assetIndex],dtype=str),
+        'Positions'   : np.full((len(nodes),len(assetIndex)),np.nan),
+        'Weights'     : np.full((len(nodes),len(assetIndex)),np.nan),
+        'PerformanceKeys' : np.array(performanceKeys,dtype=str),
+        'Performance' : np.array([[node['Performance'].get(key,np.nan) for key in performanceKeys] for node in nodes],dtype=np.float64)
+    }
+
+    for field in journalSeries:
+        columns[field] = np.array([node[field] for node in nodes],dtype=np.float64)
+
+    for field in journalText:
+        columns[field] = np.array([json.dumps(node[field],cls=JournalEncoder) for node in nodes],dtype=str)
+
+    for row,node in enumerate(nodes):
+        for asset,position in node['Positions'].items():
+            columns['Positions'][row,assetIndex[asset]] = position
+        for asset,weight in node['Weights'].items():
+            columns['Weights'][row,assetIndex[asset]] = weight
+
+    return columns
+
+# Append-only journal of daily backtest nodes
+# Nodes are buffered in memory and written in batches to a single file:
+#   jsonl   : one JSON document per line
+#   npz     : a stream of length-prefixed .npz batches, one per flush
+#   parquet : one row group per flush (requires pyarrow)
+# A checkpoint records how much of the journal it covers (see checkpoint), and a journal resumed
+# with that state first drops what was written after the checkpoint: jsonl and npz files are
+# truncated back to their size at the checkpoint, parquet parts written after it are deleted.
+# Parquet files cannot be appended to, so each checkpoint closes the current part file and the
+# following days go to a new part; JournalReader reads the parts in order.
+class BacktestJournal:
+    def __init__(self,path,formatOut='jsonl',flushInterval=250,state=None):
+        if formatOut not in journalFormats:
+            raise Exception(f'ERROR: Choose from {",".join(journalFormats)}')
+
+        self.path = path
+        self.formatOut = formatOut
+        self.flushInterval = flushInterval
+        self.buffer = []
+        self.parquetWriter = None
+        self.rowsWritten = 0
+        self.part = 0
+
+        if state is not None:
+            self.resume(state)
+
+    def getPath(self):
+        return self.path
+
+    def record(self,node):
+        self.buffer.append(node)
+
+        if len(self.buffer) >= self.flushInterval:
+            self.flush()
+
+    def flush(self):
+        if len(self.buffer) == 0:
+            return
+
+        if self.formatOut == 'jsonl':
+            lines = [json.dumps(node,cls=JournalEncoder) for node in self.buffer]
+            with open(self.path,'a') as fd:
+                fd.write('\n'.join(lines) + '\n')
+
+        elif self.formatOut == 'npz':
+            blob = io.BytesIO()
+            np.savez(blob,**nodesToColumns(self.buffer))
+            with open(self.path,'ab') as fd:
+                fd.write(struct.pack('<Q',blob.getbuffer().nbytes))
+                fd.write(blob.getbuffer())
+
+        elif self.formatOut == 'parquet':
+            self.writeParquet(nodesToColumns(self.buffer))
+
+        self.rowsWritten += len(self.buffer)
+        self.buffer = []
+
+    def checkpoint(self):
+        # Flushes the buffered days and returns the state a resumed journal starts from
+        self.flush()
+
+        if self.parquetWriter is not None:
+            self.parquetWriter.close()
+            self.parquetWriter = None
+            self.part += 1
+
+        return {
+            'rows'  : self.rowsWritten,
+            'bytes' : os.path.getsize(self.path) if self.formatOut != 'parquet' and os.path.exists(self.path) else 0,
+            'parts' : self.part
+        }
+
+    def resume(self,state):
+        self.rowsWritten = state['rows']
+
+        if self.formatOut == 'parquet':
+            self.part = state['parts']
+            for partPath in getJournalPartPaths(self.path)[self.part:]:
+                os.remove(partPath)
+        elif os.path.exists(self.path) and os.path.getsize(self.path) > state['bytes']:
+            with open(self.path,'r+b') as fd:
+                fd.truncate(state['bytes'])
+
+    def writeParquet(self,columns):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise Exception('ERROR: pyarrow is required for the parquet journal format')
+
+        assets = list(columns['Assets'])
+        data = {
+            'Date'      : pa.array(columns['Date'].view('datetime64[ns]')),
+            'Assets'    : pa.array([assets] * len(columns['Date']),type=pa.list_(pa.string())),
+            'Positions' : pa.array(list(columns['Positions']),type=pa.list_(pa.float64())),
+            'Weights'   : pa.array(list(columns['Weights']),type=pa.list_(pa.float64()))
+        }
+        for field in journalSeries:
+            data[field] = pa.array(columns[field])
+        for field in journalText:
+            data[field] = pa.array(columns[field].tolist(),type=pa.string())
+        for i,key in enumerate(columns['PerformanceKeys']):
+            data[f'Performance.{key}'] = pa.array(columns['Performance'][:,i])
+
+        table = pa.table(data)
+
+        if self.parquetWriter is None:
+            self.parquetWriter = pq.ParquetWriter(getJournalPartPath(self.path,self.part),table.schema)
+        self.parquetWriter.write_table(table)
+
+    def close(self):
+        self.flush()
+
+        if self.parquetWriter is not None:
+            self.parquetWriter.close()
+            self.parquetWriter = None
+
+# Reads a journal back into the same history layout as a Portfolio
+class JournalReader:
+    def __init__(self,path):
+        self.path = path
+        self.history = HistoryStore(list(journalSeries.values()),['Positions','Weights'])
+        self.performanceStatistics = dict()
+        self.customData = dict()
+
+        if path.endswith(journalFormats['jsonl']):
+            self.readJSONL()
+        elif path.endswith(journalFormats['npz']):
+            self.readNPZ()
+        elif path.endswith(journalFormats['parquet']):
+            self.readParquet()
+        else:
+            raise Exception(f'ERROR: Cannot infer journal format of {path}')
+
+    def appendRow(self,date,scalars,assets,positions,weights,performance,customData):
+        self.history.append(date,scalars,self.history.addAssets(assets),{'Positions' : positions,'Weights' : weights})
+        self.performanceStatistics[date] = performance
+        if len(customData) > 0:
+            self.customData[date] = customData
+
+    def readJSONL(self):
+        with open(self.path) as fd:
+            for line in fd:
+                if line.strip() == '':
+                    continue
+
+                node = json.loads(line)
+                assets = list(node['Positions'].keys())
+                self.appendRow(
+                    pd.Timestamp(node['Date']),
+                    {series : node[field] for field,series in journalSeries.items()},
+                    assets,
+                    [node['Positions'][asset] for asset in assets],
+                    [node['Weights'].get(asset,np.nan) for asset in assets],
+                    node['Performance'],
+                    node['CustomData'])
+
+    def readColumns(self,columns):
+        assets = list(columns['Assets'])
+        performanceKeys = list(columns['PerformanceKeys'])
+
+        for row,value in enumerate(columns['Date']):
+            # Only assets held on the date are part of its snapshot
+            held = ~np.isnan(columns['Positions'][row])
+            self.appendRow(
+                pd.Timestamp(int(value)),
+                {series : columns[field][row] for field,series in journalSeries.items()},
+                [asset for asset,isHeld in zip(assets,held) if isHeld],
+                columns['Positions'][row][held],
+                columns['Weights'][row][held],
+                dict(zip(performanceKeys,columns['Performance'][row].tolist())),
+                json.loads(columns['CustomData'][row]))
+
+    def readNPZ(self):
+        with open(self.path,'rb') as fd:
+            while True:
+                header = fd.read(8)
+                if len(header) < 8:
+                    break
+                size = struct.unpack('<Q',header)[0]
+                with np.load(io.BytesIO(fd.read(size))) as batch:
+                    self.readColumns({key : batch[key] for key in batch.files})
+
+    def readParquet(self):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise Exception('ERROR: pyarrow is required for the parquet journal format')
+
+        for partPath in getJournalPartPaths(self.path):
+            self.readParquetFile(pq.ParquetFile(partPath))
+
+    def readParquetFile(self,parquetFile):
+        for i in range(parquetFile.num_row_groups):
+            table = parquetFile.read_row_group(i)
+            performanceKeys = [name.split('.',1)[1] for name in table.column_names if name.startswith('Performance.')]
+            assetLists = table.column('Assets').to_pylist()
+
+            columns = {
+                'Date'            : table.column('Date').to_numpy().astype('datetime64[ns]').view(np.int64),
+                'Assets'          : assetLists[0],
+                'Positions'       : np.array(table.column('Positions').to_pylist(),dtype=np.float64).reshape(len(assetLists),-1),
+                'Weights'         : np.array(table.column('Weights').to_pylist(),dtype=np.float64).reshape(len(assetLists),-1),
+                'PerformanceKeys' : performanceKeys,
+                'Performance'     : np.column_stack([table.column(f'Performance.{key}').to_numpy() for key in performanceKeys]),
+                'CustomData'      : table.column('CustomData').to_pylist()
+            }
+            for field in journalSeries:
+                columns[field] = table.column(field).to_numpy()
+
+            self.readColumns(columns)
+
+    # Get Methods
+    def getHistoricalNAV(self):
+        return self.history.getSeriesFrame('NAV','Historical NAV')
+
+    def getHistoricalPositions(self):
+        return self.history.getMatrixFrame('Positions')
+
+    def getHistoricalWeights(self):
+        return self.history.getMatrixFrame('Weights')
+
+    def getHistoricalTCosts(self):
+        return self.history.getSeriesFrame('TCosts','Cumulative Transaction Costs')
+
+    def getHistoricalSlippageCosts(self):
+        return self.history.getSeriesFrame('SlippageCosts','Cumulative Slippage Costs')
+
+    def getHistoricalBorrowCosts(self):
+        return self.history.getSeriesFrame('BorrowCosts','Daily Borrow Costs')
+
+    def getHistoricalCash(self):
+        return self.history.getSeriesFrame('Cash','Historical Cash Account')
+
+    def getPerformanceStatistics(self,historical=False):
+        perfStats = pd.DataFrame.from_dict(self.performanceStatistics,orient='index')
+
+        if historical == False:
+            return perfStats.iloc[[-1]]
+        else:
+            return perfStats
+
+    def getCustomData(self):
+        return self.customData
+
+def readJournal(path):
+    return JournalReader(path)
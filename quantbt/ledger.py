@@ -0,0 +1,160 @@
+import numpy as np
+import pandas as pd
+
+# Append-only trade ledger
+# Every fill is one row of parallel typed columns: date (int64 nanoseconds, NaT when the trade
+# has no date), asset id (the asset's column in the portfolio universe), signed quantity, price,
+# fixed transaction cost and slippage cost. Columns are growable arrays with doubling capacity and
+# a rebalance is recorded as one block, so recording stays cheap at millions of fills and queries
+# and aggregations run over the arrays. Asset names are resolved from the universe when queried.
+#
+# Like HistoryStore, a forked ledger shares the fills of a base ledger and only holds its own
+# fills after the fork; the base must not be recorded to once forked.
+ledgerColumns = {
+    'Date'         : np.int64,
+    'AssetId'      : np.int32,
+    'Quantity'     : np.float64,
+    'Price'        : np.float64,
+    'FixedCost'    : np.float64,
+    'SlippageCost' : np.float64
+}
+
+noDate = np.iinfo(np.int64).min
+
+class TradeLedger:
+    def __init__(self,capacity=256):
+        self.base = None
+        self.baseRows = 0
+
+        self.numRows = 0
+        self.capacity = capacity
+        self.tz = None
+        self.columns = {name : np.empty(capacity,dtype=dtype) for name,dtype in ledgerColumns.items()}
+
+    def __len__(self):
+        return self.baseRows + self.numRows
+
+    def fork(self):
+        if self.numRows == 0 and self.base is not None:
+            base,baseRows = self.base,self.baseRows
+        else:
+            base,baseRows = self,len(self)
+
+        forked = TradeLedger(capacity=4)
+        forked.base = base
+        forked.baseRows = baseRows
+        forked.tz = self.tz
+        return forked
+
+    def grow(self,numRows):
+        newCapacity = self.capacity
+        while newCapacity < numRows:
+            newCapacity *= 2
+
+        for name,values in self.columns.items():
+            grown = np.empty(newCapacity,dtype=values.dtype)
+            grown[:self.numRows] = values[:self.numRows]
+            self.columns[name] = grown
+
+        self.capacity = newCapacity
+
+    def record(self,date,assetIds,quantities,prices,fixedCosts=0.0,slippageCosts=0.0):
+        # Appends the fills of one date, scalars are broadcast over the fills
+        assetIds = np.atleast_1d(assetIds)
+        numFills = len(assetIds)
+        if numFills == 0:
+            return
+
+        if self.numRows + numFills > self.capacity:
+            self.grow(self.numRows + numFills)
+
+        if date is None:
+            timestamp = noDate
+        else:
+            timestamp = pd.Timestamp(date)
+            if self.tz is None:
+                self.tz = timestamp.tz
+            timestamp = timestamp.value
+
+        rows = slice(self.numRows,self.numRows + numFills)
+        self.columns['Date'][rows] = timestamp
+        self.columns['AssetId'][rows] = assetIds
+        self.columns['Quantity'][rows] = quantities
+        self.columns['Price'][rows] = prices
+        self.columns['FixedCost'][rows] = fixedCosts
+        self.columns['SlippageCost'][rows] = slippageCosts
+        self.numRows += numFills
+
+    def getColumn(self,name):
+        if self.base is None:
+            return self.columns[name][:self.numRows]
+        return np.concatenate([self.base.getColumn(name)[:self.baseRows],self.columns[name][:self.numRows]])
+
+    def getColumns(self,startDate=None,endDate=None):
+        # All columns, optionally only the fills dated between startDate and endDate (inclusive)
+        columns = {name : self.getColumn(name) for name in ledgerColumns}
+        if startDate is None and endDate is None:
+            return columns
+
+        dates = columns['Date']
+        mask = dates != noDate
+        if startDate is not None:
+            mask &= dates >= pd.Timestamp(startDate).value
+        if endDate is not None:
+            mask &= dates <= pd.Timestamp(endDate).value
+        return {name : values[mask] for name,values in columns.items()}
+
+    def toDateIndex(self,dates):
+        index = pd.DatetimeIndex(dates.view('datetime64[ns]'))
+        if self.tz is not None:
+            index = index.tz_localize('UTC').tz_convert(self.tz)
+        return index
+
+    def toFrame(self,assets,startDate=None,endDate=None):
+        columns = self.getColumns(startDate,endDate)
+        return pd.DataFrame({
+            'Date'          : self.toDateIndex(columns['Date']),
+            'Asset'         : np.array(assets,dtype=object)[columns['AssetId']] if len(columns['AssetId']) > 0 else np.array([],dtype=object),
+            'Quantity'      : columns['Quantity'],
+            'Price'         : columns['Price'],
+            'Trade Value'   : np.abs(columns['Quantity']) * columns['Price'],
+            'Fixed Cost'    : columns['FixedCost'],
+            'Slippage Cost' : columns['SlippageCost']
+        })
+
+    def getTradedValueByDate(self,startDate=None,endDate=None):
+        # Gross traded value per date, undated fills are left out
+        columns = self.getColumns(startDate,endDate)
+        dated = columns['Date'] != noDate
+        dates,inverse = np.unique(columns['Date'][dated],return_inverse=True)
+        tradedValue = np.bincount(inverse,weights=(np.abs(columns['Quantity']) * columns['Price'])[dated],minlength=len(dates))
+        return pd.Series(tradedValue,index=self.toDateIndex(dates),name='Traded Value')
+
+    def getTurnover(self,nav,startDate=None,endDate=None,fundingDates=None):
+        # One-way turnover per date, half the gross traded value over the NAV of the date
+        # nav is a Series (or single column DataFrame) indexed by date, as getHistoricalNAV
+        # Dates in fundingDates (int64 nanoseconds) only fund the portfolio and are 0, as in the Turnover statistic
+        if isinstance(nav,pd.DataFrame):
+            nav = nav.iloc[:,0]
+        tradedValue = self.getTradedValueByDate(startDate,endDate)
+        turnover = 0.5 * tradedValue / nav.reindex(tradedValue.index).to_numpy()
+        if fundingDates is not None:
+            turnover[np.isin(tradedValue.index.as_unit('ns').asi8,fundingDates)] = 0.0
+        return turnover.rename('Turnover')
+
+    def getCostsByAsset(self,assets,startDate=None,endDate=None):
+        # Fills, traded value and costs aggregated per asset
+        columns = self.getColumns(startDate,endDate)
+        assetIds = columns['AssetId']
+        numAssets = len(assets)
+
+        tradedValue = np.abs(columns['Quantity']) * columns['Price']
+        costs = pd.DataFrame({
+            'Fills'          : np.bincount(assetIds,minlength=numAssets),
+            'Traded Value'   : np.bincount(assetIds,weights=tradedValue,minlength=numAssets),
+            'Fixed Costs'    : np.bincount(assetIds,weights=columns['FixedCost'],minlength=numAssets),
+            'Slippage Costs' : np.bincount(assetIds,weights=columns['SlippageCost'],minlength=numAssets)
+        },index=pd.Index(list(assets),name='Asset'))
+        costs['Total Costs'] = costs['Fixed Costs'] + costs['Slippage Costs']
+
+        return costs[costs['Fills'] > 0]
@@ -0,0 +1,88 @@
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+import pandas as pd
+
+# Runs many I/O bound loads (file parses, vendor downloads) on at most maxWorkers threads at a time
+# tasks maps a key to a zero argument callable. Each task is retried up to retries times on an
+# exception or when an attempt runs longer than timeout seconds, measured from when the attempt
+# starts on a thread. A timed out attempt is abandoned: its thread is left to finish in the
+# background and no longer counts towards maxWorkers, so queued tasks and retries start on
+# other threads instead of waiting behind it.
+# Returns [results,errors], two dictionaries keyed like tasks.
+def loadConcurrently(tasks,maxWorkers=8,retries=2,timeout=None,retryDelay=0.5):
+    results = dict()
+    errors = dict()
+    attempts = {key : 0 for key in tasks}
+    pending = deque(tasks.keys())
+    running = dict()
+    starts = dict()
+
+    # Every attempt, abandoned ones included, may need a thread of its own
+    executor = ThreadPoolExecutor(max_workers=maxWorkers + len(tasks) * (retries + 1))
+
+    def runAttempt(attempt,task):
+        starts[attempt] = time.monotonic()
+        return task()
+
+    def retryOrFail(key,error):
+        if attempts[key] <= retries:
+            time.sleep(retryDelay * attempts[key])
+            pending.append(key)
+        else:
+            errors[key] = error
+
+    try:
+        while len(pending) > 0 or len(running) > 0:
+            while len(pending) > 0 and len(running) < maxWorkers:
+                key = pending.popleft()
+                attempts[key] += 1
+                attempt = (key,attempts[key])
+                running[executor.submit(runAttempt,attempt,tasks[key])] = attempt
+
+            # Wake up in time to notice the oldest started attempt timing out; an attempt
+            # starting while we wait cannot time out before timeout seconds from now
+            waitFor = None
+            if timeout is not None:
+                started = [starts[attempt] for attempt in running.values() if attempt in starts]
+                waitFor = max(0.0,min(started) + timeout - time.monotonic()) if len(started) > 0 else timeout
+
+            done,_ = wait(list(running.keys()),timeout=waitFor,return_when=FIRST_COMPLETED)
+
+            for future in done:
+                key,_ = running.pop(future)
+                try:
+                    results[key] = future.result()
+                except Exception as error:
+                    retryOrFail(key,error)
+
+            if timeout is not None:
+                now = time.monotonic()
+                for future,attempt in list(running.items()):
+                    start = starts.get(attempt)
+                    if start is not None and not future.done() and now - start >= timeout:
+                        running.pop(future)
+                        retryOrFail(attempt[0],TimeoutError(f'Loading {attempt[0]} timed out after {timeout}s'))
+    finally:
+        # Do not block on abandoned attempts
+        executor.shutdown(wait=False,cancel_futures=True)
+
+    return [results,errors]
+
+def alignPanel(frames):
+    # One concatenation of all sources into a (dates x symbols) panel on the union of their dates
+    # Single column sources become one symbol column, wider sources keep (symbol, field) columns
+    if len(frames) == 0:
+        return pd.DataFrame(dtype=np.float64)
+
+    singleColumn = all(isinstance(frame,pd.Series) or frame.shape[1] == 1 for frame in frames.values())
+
+    if singleColumn:
+        columns = [frame if isinstance(frame,pd.Series) else frame.iloc[:,0] for frame in frames.values()]
+        panel = pd.concat(columns,axis=1,keys=list(frames.keys()),sort=True)
+    else:
+        panel = pd.concat(list(frames.values()),axis=1,keys=list(frames.keys()),sort=True)
+
+    return panel
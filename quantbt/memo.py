@@ -0,0 +1,306 @@
+import os
+import uuid
+import types
+import pickle
+import hashlib
+import inspect
+import functools
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Content addressed memoization of signal and weight computations
+# A memoized function is keyed by a hash of its code and of the content of its arguments (price
+# arrays, frames or slices of them, parameters), so the same signal computed on the same prices
+# with the same parameters is only computed once, across parameter sets, runs and processes.
+# Results are kept in an in-memory LRU bounded in bytes, backed by a folder of pickled results.
+# Every result is written to a temporary file and renamed into place, so process pool workers
+# sharing the folder never read a partial result; two workers computing the same key at the same
+# time simply write the same result twice.
+#
+# Cached results are shared by every caller: arrays are returned read-only and frames must not be
+# modified in place. The hash covers the function's own code but not the globals or closures it
+# reads, bump version when those change.
+
+def updateHash(hasher,value):
+    if isinstance(value,pd.DataFrame):
+        hasher.update(b'DataFrame')
+        updateHash(hasher,value.index)
+        updateHash(hasher,value.columns)
+        for dtype in value.dtypes:
+            hasher.update(str(dtype).encode())
+        updateHash(hasher,value.to_numpy())
+    elif isinstance(value,pd.Series):
+        hasher.update(b'Series')
+        updateHash(hasher,value.name)
+        updateHash(hasher,value.index)
+        updateHash(hasher,value.to_numpy())
+    elif isinstance(value,pd.DatetimeIndex):
+        hasher.update(f'DatetimeIndex{value.tz}'.encode())
+        updateHash(hasher,value.as_unit('ns').asi8)
+    elif isinstance(value,pd.Index):
+        hasher.update(type(value).__name__.encode())
+        updateHash(hasher,value.to_numpy())
+    elif isinstance(value,np.ndarray):
+        if value.dtype == object:
+            hasher.update(pickle.dumps(value,protocol=pickle.HIGHEST_PROTOCOL))
+        else:
+            hasher.update(f'ndarray{value.dtype.str}{value.shape}'.encode())
+            hasher.update(np.ascontiguousarray(value).data)
+    elif isinstance(value,np.generic):
+        updateHash(hasher,value.item())
+    elif value is None or isinstance(value,(bool,int,float,complex,str,bytes)):
+        hasher.update(f'{type(value).__name__}:{value!r};'.encode())
+    elif isinstance(value,(list,tuple)):
+        hasher.update(f'{type(value).__name__}{len(value)}'.encode())
+        for item in value:
+            updateHash(hasher,item)
+    elif isinstance(value,(dict,set,frozenset)):
+        # Unordered, every item is hashed on its own and the item hashes are sorted
+        items = value.items() if isinstance(value,dict) else value
+        hasher.update(f'{type(value).__name__}{len(value)}'.encode())
+        for itemHash in sorted(hashValue(item) for item in items):
+            hasher.update(itemHash.encode())
+    elif isinstance(value,types.CodeType):
+        updateCodeHash(hasher,value)
+    elif callable(value) and hasattr(value,'__qualname__'):
+        hasher.update(f'{getattr(value,"__module__","")}.{value.__qualname__}'.encode())
+    else:
+        hasher.update(pickle.dumps(value,protocol=pickle.HIGHEST_PROTOCOL))
+
+def updateCodeHash(hasher,code):
+    # Byte code and constants, nested functions included; object addresses never enter the hash
+    hasher.update(code.co_code)
+    for constant in code.co_consts:
+        if isinstance(constant,types.CodeType):
+            updateCodeHash(hasher,constant)
+        else:
+            updateHash(hasher,constant)
+    hasher.update(' '.join(code.co_names).encode())
+
+def hashValue(value):
+    hasher = hashlib.blake2b(digest_size=20)
+    updateHash(hasher,value)
+    return hasher.hexdigest()
+
+def objectSize(value):
+    # Approximate memory held by a result, in bytes
+    if isinstance(value,np.ndarray):
+        return value.nbytes
+    elif isinstance(value,pd.DataFrame):
+        return int(value.memory_usage(index=True).sum())
+    elif isinstance(value,pd.Series):
+        return int(value.memory_usage(index=True))
+    elif isinstance(value,(list,tuple)):
+        return 64 + sum(objectSize(item) for item in value)
+    elif isinstance(value,dict):
+        return 64 + sum(objectSize(key) + objectSize(item) for key,item in value.items())
+    else:
+        return 64
+
+def freezeResult(value):
+    if isinstance(value,np.ndarray):
+        value.flags.writeable = False
+    elif isinstance(value,(list,tuple)):
+        for item in value:
+            freezeResult(item)
+    return value
+
+class MemoCache:
+    def __init__(self,cacheFolder=os.path.join(os.getcwd(),'data','memo'),maxBytes=512 * 2**20):
+        # cacheFolder None keeps results in memory only
+        self.cacheFolder = cacheFolder
+        self.maxBytes = maxBytes
+
+        self.entries = OrderedDict()
+        self.sizes = dict()
+        self.numBytes = 0
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.diskHits = 0
+        self.misses = 0
+
+    # Workers receive the settings of the cache, not its in-memory results
+    def __getstate__(self):
+        return {'cacheFolder' : self.cacheFolder,'maxBytes' : self.maxBytes}
+
+    def __setstate__(self,state):
+        self.__init__(**state)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self,key):
+        return key in self.entries or (self.cacheFolder is not None and os.path.exists(self.getPath(key)))
+
+    def getCacheFolder(self):
+        return self.cacheFolder
+
+    def getPath(self,key):
+        return os.path.join(self.cacheFolder,key[:2],key + '.pkl')
+
+    # In-memory LRU
+    def remember(self,key,value,size):
+        if size > self.maxBytes:
+            return
+
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return
+
+            self.entries[key] = value
+            self.sizes[key] = size
+            self.numBytes += size
+
+            # Least recently used results go first
+            while self.numBytes > self.maxBytes:
+                evicted,_ = self.entries.popitem(last=False)
+                self.numBytes -= self.sizes.pop(evicted)
+
+    def lookup(self,key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return [True,self.entries[key]]
+
+        if self.cacheFolder is not None:
+            try:
+                with open(self.getPath(key),'rb') as fd:
+                    value = freezeResult(pickle.load(fd))
+            except (OSError,EOFError,pickle.UnpicklingError):
+                pass
+            else:
+                self.diskHits += 1
+                self.remember(key,value,objectSize(value))
+                return [True,value]
+
+        self.misses += 1
+        return [False,None]
+
+    def store(self,key,value):
+        value = freezeResult(value)
+
+        if self.cacheFolder is not None:
+            path = self.getPath(key)
+            os.makedirs(os.path.dirname(path),exist_ok=True)
+
+            # Unique temporary name per writer, the rename is atomic
+            tempPath = f'{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp'
+            with open(tempPath,'wb') as fd:
+                pickle.dump(value,fd,protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tempPath,path)
+
+        self.remember(key,value,objectSize(value))
+        return value
+
+    def clear(self,disk=False):
+        # Forget the in-memory results, and the stored ones with disk=True
+        with self.lock:
+            self.entries.clear()
+            self.sizes.clear()
+            self.numBytes = 0
+
+        if disk and self.cacheFolder is not None and os.path.exists(self.cacheFolder):
+            for folder,_,fileNames in os.walk(self.cacheFolder):
+                for fileName in fileNames:
+                    if fileName.endswith('.pkl'):
+                        os.remove(os.path.join(folder,fileName))
+
+    def prune(self,maxDiskBytes):
+        # Deletes the least recently written results until the folder holds at most maxDiskBytes
+        if self.cacheFolder is None or not os.path.exists(self.cacheFolder):
+            return
+
+        stored = []
+        for folder,_,fileNames in os.walk(self.cacheFolder):
+            for fileName in fileNames:
+                if fileName.endswith('.pkl'):
+                    path = os.path.join(folder,fileName)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    stored.append((stat.st_mtime,stat.st_size,path))
+
+        numBytes = sum(size for _,size,_ in stored)
+        for _,size,path in sorted(stored):
+            if numBytes <= maxDiskBytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            numBytes -= size
+
+    def getStatistics(self):
+        return {
+            'Entries'     : len(self.entries),
+            'Bytes'       : self.numBytes,
+            'Hits'        : self.hits,
+            'Disk Hits'   : self.diskHits,
+            'Misses'      : self.misses
+        }
+
+# Cache of functions memoized without one of their own, created on first use in every process
+defaultMemoCache = None
+
+def getDefaultMemoCache():
+    global defaultMemoCache
+    if defaultMemoCache is None:
+        defaultMemoCache = MemoCache()
+    return defaultMemoCache
+
+def setDefaultMemoCache(cache):
+    # e.g. from a process pool initializer, so workers share a cache folder of your choice
+    global defaultMemoCache
+    defaultMemoCache = cache
+
+# Decorator, used bare or with options
+#   @memoize
+#   def computeCrossoverSignal(prices,fastWindow=50,slowWindow=200): ...
+#
+#   @memoize(cache=MemoCache('signals'),version=2,ignore=['verbose'])
+#   cache   : MemoCache to use, the default cache when None
+#   version : part of the key, change it to invalidate results after changing what the function reads
+#   ignore  : names of arguments left out of the key
+def memoize(function=None,cache=None,version=None,ignore=()):
+    if function is None:
+        return lambda function: memoize(function,cache,version,ignore)
+
+    signature = inspect.signature(function)
+
+    functionHasher = hashlib.blake2b(digest_size=20)
+    updateHash(functionHasher,function)
+    updateHash(functionHasher,version)
+    if hasattr(function,'__code__'):
+        updateCodeHash(functionHasher,function.__code__)
+
+    def getKey(*args,**kwargs):
+        bound = signature.bind(*args,**kwargs)
+        bound.apply_defaults()
+
+        hasher = functionHasher.copy()
+        for name,value in bound.arguments.items():
+            if name not in ignore:
+                hasher.update(name.encode())
+                updateHash(hasher,value)
+        return hasher.hexdigest()
+
+    @functools.wraps(function)
+    def memoized(*args,**kwargs):
+        memoCache = cache if cache is not None else getDefaultMemoCache()
+        key = getKey(*args,**kwargs)
+
+        found,value = memoCache.lookup(key)
+        if found:
+            return value
+        return memoCache.store(key,function(*args,**kwargs))
+
+    memoized.getKey = getKey
+    memoized.getCache = lambda: cache if cache is not None else getDefaultMemoCache()
+    return memoized
@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+
+# Downsampled plotting of long histories
+# A line plot cannot show more points than it has pixels, so long NAV and weight histories are
+# reduced to about the pixel width of the figure before they reach matplotlib. Both reductions
+# keep the first and last points and preserve the visual extremes of every line:
+#   - 'minmax' keeps the minimum and maximum of every bucket of consecutive points
+#   - 'lttb' keeps one point per bucket, the one spanning the largest triangle with its
+#     neighbours (Largest Triangle Three Buckets, Steinarsson 2013)
+# Figures are drawn with the pandas plotting backend, so matplotlib is only imported on first use.
+
+downsamplingMethods = ['minmax','lttb','none']
+
+# Matplotlib's default figure resolution, in dots per inch
+plotDPI = 100
+
+def minMaxDownsample(values,buckets):
+    # Row indices of the minimum and maximum of every bucket of consecutive points of one line
+    values = np.asarray(values,dtype=np.float64)
+    numPoints = len(values)
+    if numPoints <= 2 * buckets:
+        return np.arange(numPoints)
+
+    # Equal sized buckets, the last one padded with NaN
+    bucketSize = -(-numPoints // buckets)
+    padded = np.full(buckets * bucketSize,np.nan)
+    padded[:numPoints] = values
+    padded = padded.reshape(buckets,bucketSize)
+
+    # Buckets that are all NaN (gaps in the line) have no extremes
+    valid = ~np.isnan(padded).all(axis=1)
+    offsets = np.arange(buckets) * bucketSize
+    minima = (np.argmin(np.where(np.isnan(padded),np.inf,padded),axis=1) + offsets)[valid]
+    maxima = (np.argmax(np.where(np.isnan(padded),-np.inf,padded),axis=1) + offsets)[valid]
+
+    return np.unique(np.concatenate([[0,numPoints - 1],minima,maxima]))
+
+def lttbDownsample(x,y,threshold):
+    # Row indices of the Largest Triangle Three Buckets reduction of one line to threshold points
+    x = np.asarray(x,dtype=np.float64)
+    y = np.asarray(y,dtype=np.float64)
+    numPoints = len(y)
+    if threshold >= numPoints or threshold < 3:
+        return np.arange(numPoints)
+
+    # The first and last points are kept, the rest is split into threshold - 2 buckets
+    edges = np.linspace(1,numPoints - 1,threshold - 1).astype(np.int64)
+    selected = np.empty(threshold,dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = numPoints - 1
+
+    previous = 0
+    for b in range(threshold - 2):
+        start,end = edges[b],edges[b + 1]
+
+        # Average point of the next bucket (the last point for the final bucket)
+        if b + 2 < len(edges):
+            nextX = x[end:edges[b + 2]].mean()
+            nextY = np.nanmean(y[end:edges[b + 2]]) if not np.isnan(y[end:edges[b + 2]]).all() else y[previous]
+        else:
+            nextX,nextY = x[-1],y[-1]
+
+        areas = np.abs((x[previous] - nextX) * (y[start:end] - y[previous]) - (x[previous] - x[start:end]) * (nextY - y[previous]))
+        areas = np.where(np.isnan(areas),-1.0,areas)
+
+        previous = start + int(np.argmax(areas))
+        selected[b + 1] = previous
+
+    return selected
+
+def downsampleIndex(x,values,points,method='minmax'):
+    # Row indices of about points rows of one line
+    if method == 'none' or points is None or len(values) <= points:
+        return np.arange(len(values))
+    elif method == 'minmax':
+        return minMaxDownsample(values,max(1,points // 2))
+    elif method == 'lttb':
+        return lttbDownsample(x,values,points)
+    else:
+        raise Exception(f'ERROR: Choose from {",".join(downsamplingMethods)}')
+
+def topWeights(weights,assets,top=10):
+    # Keeps the top assets by average absolute weight and sums the rest into an Other column
+    weights = np.asarray(weights,dtype=np.float64)
+    if top is None or weights.shape[1] <= top:
+        return [weights,list(assets)]
+
+    with np.errstate(invalid='ignore'):
+        held = ~np.isnan(weights).all(axis=0)
+        meanWeights = np.where(held,np.nanmean(np.abs(np.where(held,weights,0.0)),axis=0),-1.0)
+    order = np.argsort(-meanWeights,kind='stable')
+    kept,rest = np.sort(order[:top]),order[top:]
+
+    other = np.nansum(weights[:,rest],axis=1)
+    other[np.isnan(weights[:,rest]).all(axis=1)] = np.nan
+    return [np.column_stack([weights[:,kept],other]),[assets[i] for i in kept] + ['Other']]
+
+def plotHistory(dates,values,columns,title,points=None,method='minmax',figsize=(7.5,5)):
+    # Line plot of every column of a (dates x columns) array, each line downsampled on its own to
+    # the figure's pixel width by default
+    values = np.asarray(values,dtype=np.float64).reshape(len(values),-1)
+    if points is None:
+        points = int(figsize[0] * plotDPI)
+
+    x = pd.DatetimeIndex(dates).asi8
+    ax = None
+    for j,column in enumerate(columns):
+        index = downsampleIndex(x,values[:,j],points,method)
+        line = pd.Series(values[index,j],index=dates[index],name=column)
+        if ax is None:
+            # A DataFrame plot always opens a new figure
+            ax = line.to_frame().plot(figsize=figsize,title=title,legend=len(columns) > 1)
+        else:
+            ax = line.plot(ax=ax,legend=True)
+    return ax
@@ -1,30 +1,29 @@
 import os
-import sys
+import copy
 import time
 import json
-import math
-import copy
-import base64
-import getpass
-import warnings
-import requests
-import logging
+import weakref
+from collections import ChainMap
 
 import numpy as np
 import pandas as pd
-from datetime import datetime
 
 from .analytics import *
-
-def flattenDictionary(nestedDict):
-    listofDict = []
-
-    for key,value in nestedDict.items():
-        flatDict = nestedDict[key]
-        flatDict['Dates'] = key
-        listofDict.append(flatDict.copy())
-
-    return listofDict
+from .history import *
+from .journal import *
+from .instrumentation import *
+from .schedule import *
+from .costs import *
+from .checkpoint import *
+from .ledger import *
+from .catalog import *
+
+# Splits a dictionary into two ChainMaps that share its current entries and write to their own layer
+def forkMapping(mapping):
+    shared = mapping.maps if isinstance(mapping,ChainMap) else [mapping]
+    if len(shared) > 1 and len(shared[0]) == 0:
+        shared = shared[1:]
+    return [ChainMap(dict(),*shared),ChainMap(dict(),*shared)]
 
 def createFolder(directory):
     try:
@@ -37,15 +36,29 @@ def createFolder(directory):
 class Portfolio:
     def __init__(self,positions,cash,name='',datadump=False,backtestFolderName=os.getcwd()):
         
+        # Asset universe, every per-asset quantity is held as an array aligned to it
+        self.assets = []
+        self.assetIndex = dict()
+        self.positionArray = np.zeros(0)
+        self.heldMask = np.zeros(0,dtype=bool)
+        self.fixedTransactionCostArray = np.zeros(0)
+        self.dailyBorrowRateArray = np.zeros(0)
+
         # Portfolio Parameters
         self.name = name
+        self.fixedTransactionCosts = dict()
+        self.borrowCosts = dict()
         self.positions = positions
         self.cash = cash
         self.datadump = datadump
-        self.fixedTransactionCosts = dict()
-        self.borrowCosts = dict()
+        self.datadumpFormat = 'json'
+        self.journalFlushInterval = 250
+        self.journal = None
+        self.book = None
         self.annualManagementFee = 0.0
         self.slippageModel = ''
+        self.slippageEngine = None
+        self.ownsSlippageEngine = False
         self.impactParams = dict()
         self.unwindUndefinedAssetWeights = True
         self.transactionCosts = 0.0
@@ -53,25 +66,186 @@ class Portfolio:
         self.LastRebalanceDate = 'N/A'
         self.FirstRebalanceDate = 'N/A'
         self.performanceStatistics = dict()
+        self.performanceAccumulator = PerformanceAccumulator()
+        self.statisticsFrequency = 1
+        self.rebalanceSchedule = None
+
+        # Periodic state checkpoints, every k sign offs (None to disable)
+        self.checkpointFrequency = None
+        self.checkpointPath = None
+
+        # Opt-in hot path timings, None when disabled
+        self.instrumentation = None
 
         # Custom Data to serialize
         self.customData = dict()
 
+        # Fills of every trade
+        self.tradeLedger = TradeLedger()
+
         # Time Series Data
-        self.historicalNAV = dict()
-        self.historicalPositions = dict()
-        self.historicalWeights = dict()
-        self.historicalTCosts = dict()
-        self.historicalSlippageCosts = dict()
-        self.historicalBorrowCosts = dict()
-        self.historicalCash = dict()
+        self.history = HistoryStore(
+            ['NAV','TCosts','SlippageCosts','BorrowCosts','Cash'],
+            ['Positions','Weights'])
 
         # Utils        
         self.timestamp = ''.join(str(time.time()).split('.'))
         self.backtestFolderName = backtestFolderName + '/BackTestResults/' + self.timestamp + '-' + self.name
 
-        # Create folder to store backtest results
-        createFolder(self.backtestFolderName)
+        # The results folder is only created when something is written to it (data dumps, journal, checkpoints)
+
+    @classmethod
+    def fromCheckpoint(cls,path):
+        # Restores a portfolio saved by saveCheckpoint, ready to sign off the dates after getLastSignOffDate
+        portfolio = cls({},0.0)
+        restoreCheckpoint(portfolio,path)
+        return portfolio
+
+    def fork(self,name=None):
+        # Copy of the portfolio as at its latest sign off, to branch what-if scenarios from
+        # The history, performance statistics and custom data so far are shared with the parent
+        # rather than copied; only the live state (positions, cash, costs, running statistics) is.
+        # Parent and fork then diverge independently.
+        forked = copy.copy(self)
+        forked.name = name if name is not None else self.name
+
+        # Live state
+        forked.assets = list(self.assets)
+        forked.assetIndex = dict(self.assetIndex)
+        forked.positionArray = self.positionArray.copy()
+        forked.heldMask = self.heldMask.copy()
+        forked.fixedTransactionCostArray = self.fixedTransactionCostArray.copy()
+        forked.dailyBorrowRateArray = self.dailyBorrowRateArray.copy()
+        forked.fixedTransactionCosts = dict(self.fixedTransactionCosts)
+        forked.borrowCosts = dict(self.borrowCosts)
+        forked.impactParams = dict(self.impactParams)
+        forked.slippageEngine = copy.copy(self.slippageEngine)
+        forked.performanceAccumulator = copy.copy(self.performanceAccumulator)
+
+        # Shared history and trades, the parent moves onto forks of its own so the shared rows stay fixed
+        forked.history = self.history.fork()
+        if forked.history.base is self.history:
+            self.history = self.history.fork()
+        forked.tradeLedger = self.tradeLedger.fork()
+        if forked.tradeLedger.base is self.tradeLedger:
+            self.tradeLedger = self.tradeLedger.fork()
+        self.performanceStatistics,forked.performanceStatistics = forkMapping(self.performanceStatistics)
+        self.customData,forked.customData = forkMapping(self.customData)
+
+        # Results of the fork go to a folder of its own
+        forked.journal = None
+        forked.book = None
+        forked.checkpointPath = None
+        forked.timestamp = ''.join(str(time.time()).split('.'))
+        forked.backtestFolderName = os.path.dirname(self.backtestFolderName) + '/' + forked.timestamp + '-' + forked.name
+
+        return forked
+
+    # Dictionary views of the time series data, kept for compatibility
+    @property
+    def historicalNAV(self):
+        return self.history.getSeriesView('NAV')
+
+    @property
+    def historicalPositions(self):
+        return self.history.getMatrixView('Positions')
+
+    @property
+    def historicalWeights(self):
+        return self.history.getMatrixView('Weights')
+
+    @property
+    def historicalTCosts(self):
+        return self.history.getSeriesView('TCosts')
+
+    @property
+    def historicalSlippageCosts(self):
+        return self.history.getSeriesView('SlippageCosts')
+
+    @property
+    def historicalBorrowCosts(self):
+        return self.history.getSeriesView('BorrowCosts')
+
+    @property
+    def historicalCash(self):
+        return self.history.getSeriesView('Cash')
+
+    # Dictionary of the position array, kept for compatibility
+    # Assets in the universe but never traded are not part of the portfolio
+    # Every read builds a new dictionary: changing it does not change the portfolio, assign
+    # positions (or buy and sell) instead, and avoid reading it in loops over assets
+    @property
+    def positions(self):
+        return {self.assets[i] : float(self.positionArray[i]) for i in np.flatnonzero(self.heldMask)}
+
+    @positions.setter
+    def positions(self,positions):
+        self.addAssets(list(positions.keys()))
+        self.positionArray[:] = 0.0
+        self.heldMask[:] = False
+
+        for asset,position in positions.items():
+            self.positionArray[self.assetIndex[asset]] = position
+            self.heldMask[self.assetIndex[asset]] = True
+
+    # Instrumentation methods
+    def profile(self,name):
+        return profile(self.instrumentation,name)
+
+    def enableInstrumentation(self,instrumentation=None):
+        # Pass an existing Instrumentation to aggregate several portfolios and data handlers
+        self.instrumentation = instrumentation if instrumentation is not None else Instrumentation()
+        return self.instrumentation
+
+    def disableInstrumentation(self):
+        self.instrumentation = None
+
+    def getInstrumentation(self):
+        return self.instrumentation
+
+    def getInstrumentationSummary(self):
+        if self.instrumentation is None:
+            raise Exception('ERROR: Instrumentation is not enabled')
+        return self.instrumentation.getSummary()
+
+    # Asset universe methods
+    def addAssets(self,assets):
+        newAssets = [asset for asset in dict.fromkeys(assets) if asset not in self.assetIndex]
+
+        if len(newAssets) > 0:
+            for asset in newAssets:
+                self.assetIndex[asset] = len(self.assets)
+                self.assets.append(asset)
+
+            self.positionArray = np.concatenate([self.positionArray,np.zeros(len(newAssets))])
+            self.heldMask = np.concatenate([self.heldMask,np.zeros(len(newAssets),dtype=bool)])
+            self.updateCostArrays()
+
+    def updateCostArrays(self):
+        self.fixedTransactionCostArray = np.array([self.getFixedTransactionCosts(asset) for asset in self.assets],dtype=np.float64)
+        self.dailyBorrowRateArray = (1 + np.array([self.getBorrowCost(asset) for asset in self.assets],dtype=np.float64)) ** (1/260) - 1
+
+    def getPriceVector(self,lastPriceMap):
+        # Price rows given as arrays must already be aligned to the asset universe
+        if isinstance(lastPriceMap,np.ndarray):
+            return lastPriceMap
+        else:
+            return np.array([lastPriceMap[asset] if self.heldMask[i] else lastPriceMap.get(asset,np.nan) for i,asset in enumerate(self.assets)],dtype=np.float64)
+
+    def getTargetVector(self,targetWeights):
+        # Target weights given as arrays are aligned to the asset universe, NaN meaning not in the target
+        if isinstance(targetWeights,np.ndarray):
+            return targetWeights.astype(np.float64)
+        else:
+            self.addAssets(list(targetWeights.keys()))
+            target = np.full(len(self.assets),np.nan)
+            for asset,weight in targetWeights.items():
+                target[self.assetIndex[asset]] = weight
+            return target
+
+    def getPositionValues(self,prices):
+        # Mark to market, assets outside the portfolio contribute nothing whatever their price
+        return np.where(self.heldMask,self.positionArray * prices,0.0)
 
     # Get Methods
     def getPortfolioName(self):
@@ -84,7 +258,16 @@ class Portfolio:
         return self.positions
 
     def getAssetPosition(self,asset):
-        return self.positions[asset]
+        if asset in self.assetIndex and self.heldMask[self.assetIndex[asset]]:
+            return float(self.positionArray[self.assetIndex[asset]])
+        else:
+            raise KeyError(asset)
+
+    def getAssetUniverse(self):
+        return self.assets
+
+    def getPositionArray(self):
+        return self.positionArray
     
     def getCash(self):
         return self.cash
@@ -93,7 +276,7 @@ class Portfolio:
         return self.transactionCosts
     
     def getAssetsInPortfolio(self):
-        return list(self.positions.keys())
+        return [self.assets[i] for i in np.flatnonzero(self.heldMask)]
 
     def getFixedTransactionCosts(self,asset):
         if asset not in self.fixedTransactionCosts.keys():
@@ -134,30 +317,55 @@ class Portfolio:
     def getImpactParams(self):
         return self.impactParams
 
+    def getDatadumpFormat(self):
+        return self.datadumpFormat
+
+    def getJournal(self):
+        return self.journal
+
     def getCustomData(self):
         return self.customData
 
+    def getTradeLedger(self):
+        return self.tradeLedger
+
+    def getTrades(self,startDate=None,endDate=None):
+        return self.tradeLedger.toFrame(self.assets,startDate,endDate)
+
+    def getTradeCosts(self,startDate=None,endDate=None):
+        return self.tradeLedger.getCostsByAsset(self.assets,startDate,endDate)
+
+    def getTurnover(self,startDate=None,endDate=None,includeFunding=False):
+        # Like the Turnover statistic, trades made from an empty portfolio fund it and are not turnover
+        # includeFunding=True counts them as well
+        fundingDates = None
+        if includeFunding == False:
+            historyDates = self.history.getDates()
+            grossLeverage = grossLeverageSeries(self.history.getMatrix('Weights'))
+            tradeDates = self.tradeLedger.getTradedValueByDate(startDate,endDate).index.as_unit('ns').asi8
+            previousRow = np.searchsorted(historyDates,tradeDates,side='left') - 1
+            funding = previousRow < 0
+            funding[~funding] = grossLeverage[previousRow[~funding]] == 0
+            fundingDates = tradeDates[funding]
+        return self.tradeLedger.getTurnover(self.getHistoricalNAV(),startDate,endDate,fundingDates)
+
     def getCustomDataByDate(self,date):
-        if date in list(self.customData.keys()):
+        if date in self.customData:
             return self.customData[date]
         else:
             return dict()
     
-    def getWeights(self,lastPriceMap):
-        weights = {}
-        currentNAV = self.getNAV(lastPriceMap)
+    def getWeightArray(self,lastPriceMap):
+        positionValues = self.getPositionValues(self.getPriceVector(lastPriceMap))
+        return positionValues / (positionValues.sum() + self.getCash())
 
-        for asset in self.getPositions():
-            price = lastPriceMap[asset]
-            weights[asset] = price * self.getAssetPosition(asset) / currentNAV
-        
-        return weights
+    def getWeights(self,lastPriceMap):
+        weights = self.getWeightArray(lastPriceMap)
+        return {self.assets[i] : float(weights[i]) for i in np.flatnonzero(self.heldMask)}
     
     def getHistoricalWeights(self,formatOut='DataFrame'):
         if formatOut.lower() == 'dataframe':
-            flatDictionary = flattenDictionary(self.historicalWeights)
-            temp = pd.DataFrame.from_dict(flatDictionary).set_index('Dates')
-            return temp
+            return self.history.getMatrixFrame('Weights')
         
         elif formatOut.lower() == 'dictionary':
             return self.historicalWeights
@@ -166,11 +374,8 @@ class Portfolio:
             raise Exception('ERROR: Invalid Historical Weight Output Format')
 
     def getNAV(self,lastPriceMap):
-        positionValue = float(0.0)
-
         # Mark to market all assets
-        for asset in self.getPositions():
-            positionValue += lastPriceMap[asset] * self.getAssetPosition(asset)
+        positionValue = float(self.getPositionValues(self.getPriceVector(lastPriceMap)).sum())
         
         # Add cash account
         value = positionValue + self.getCash()
@@ -179,9 +384,7 @@ class Portfolio:
 
     def getHistoricalNAV(self,formatOut='DataFrame'):
         if formatOut.lower() == 'dataframe':
-            temp = pd.DataFrame(self.historicalNAV,index=[0],).T
-            temp.columns = ['Historical NAV']
-            return temp
+            return self.history.getSeriesFrame('NAV','Historical NAV')
         elif formatOut.lower() == 'dictionary':
             return self.historicalNAV
         else:
@@ -189,9 +392,7 @@ class Portfolio:
 
     def getHistoricalPositions(self,formatOut='DataFrame'):
         if formatOut.lower() == 'dataframe':
-            flatDictionary = flattenDictionary(self.historicalPositions)
-            temp = pd.DataFrame.from_dict(flatDictionary).set_index('Dates')
-            return temp
+            return self.history.getMatrixFrame('Positions')
         
         elif formatOut.lower() == 'dictionary':
             return self.historicalPositions
@@ -201,9 +402,7 @@ class Portfolio:
     
     def getHistoricalTCosts(self,formatOut='DataFrame'):
         if formatOut.lower() == 'dataframe':
-            temp = pd.DataFrame(self.historicalTCosts,index=[0],).T
-            temp.columns = ['Cumulative Transaction Costs']
-            return temp
+            return self.history.getSeriesFrame('TCosts','Cumulative Transaction Costs')
         elif formatOut.lower() == 'dictionary':
             return self.historicalTCosts
         else:
@@ -211,9 +410,7 @@ class Portfolio:
 
     def getHistoricalSlippageCosts(self,formatOut='DataFrame'):
         if formatOut.lower() == 'dataframe':
-            temp = pd.DataFrame(self.historicalSlippageCosts,index=[0],).T
-            temp.columns = ['Cumulative Slippage Costs']
-            return temp
+            return self.history.getSeriesFrame('SlippageCosts','Cumulative Slippage Costs')
         elif formatOut.lower() == 'dictionary':
             return self.historicalSlippageCosts
         else:
@@ -221,9 +418,7 @@ class Portfolio:
 
     def getHistoricalBorrowCosts(self,formatOut='DataFrame'):
         if formatOut.lower() == 'dataframe':
-            temp = pd.DataFrame(self.historicalBorrowCosts,index=[0],).T
-            temp.columns = [ 'Daily Borrow Costs']
-            return temp
+            return self.history.getSeriesFrame('BorrowCosts','Daily Borrow Costs')
         elif formatOut.lower() == 'dictionary':
             return self.historicalBorrowCosts
         else:
@@ -231,15 +426,39 @@ class Portfolio:
     
     def getHistoricalCash(self,formatOut='DataFrame'):
         if formatOut.lower() == 'dataframe':
-            temp = pd.DataFrame(self.historicalCash,index=[0],).T
-            temp.columns = ['Historical Cash Account']
-            return temp
+            return self.history.getSeriesFrame('Cash','Historical Cash Account')
         elif formatOut.lower() == 'dictionary':
             return self.historicalCash
         else:
             raise Exception('ERROR: Invalid Historical Cash Account Output Format')
     
+    def getStatisticsFrequency(self):
+        return self.statisticsFrequency
+
+    def getCheckpointFrequency(self):
+        return self.checkpointFrequency
+
+    def getCheckpointPath(self):
+        # Defaults to a single, overwritten checkpoint file in the backtest results folder
+        return self.checkpointPath if self.checkpointPath is not None else self.getBacktestFolderName() + '/checkpoint.npz'
+
+    def getLastSignOffDate(self):
+        return self.performanceAccumulator.lastDate
+
+    def getRebalanceSchedule(self):
+        return self.rebalanceSchedule
+
+    def isRebalanceDate(self,date):
+        if self.rebalanceSchedule is None:
+            raise Exception('ERROR: No rebalance schedule set')
+        return date in self.rebalanceSchedule
+
     def getPerformanceStatistics(self,historical=False):
+        # Statistics as at the latest sign off are always available, whatever the frequency
+        lastDate = self.performanceAccumulator.lastDate
+        if lastDate is not None and lastDate not in self.performanceStatistics:
+            self.performanceStatistics[lastDate] = self.getAccumulatedStatistics()
+
         perfStats = pd.DataFrame.from_dict(self.performanceStatistics,orient='index')
         
         if historical == False:
@@ -247,6 +466,18 @@ class Portfolio:
         else:
             return perfStats
 
+    def getAccumulatedStatistics(self):
+        # Turnover and gross leverage are folded in from the weight history in blocks, only when statistics are read
+        accumulator = self.performanceAccumulator
+        if accumulator.leverageCount < accumulator.count:
+            start,stop = accumulator.leverageCount,accumulator.count
+            accumulator.updateTrading(self.history.getMatrixRows('Weights',start,stop),self.history.getMatrixRows('Positions',start,stop))
+        return accumulator.getStatistics()
+
+    def getRollingPerformance(self,window=None):
+        # Expanding (window=None) or rolling statistics over the NAV history, {statistic : (dates x 1)}
+        return rollingPerformance(self.getHistoricalNAV(),window)
+
     # Set Methods
     def setCash(self,cash):
         if isinstance(cash,float):
@@ -257,32 +488,71 @@ class Portfolio:
     def setFixedTransactionCosts(self,fixedTransactionCosts):
         if isinstance(fixedTransactionCosts,dict):
             self.fixedTransactionCosts = fixedTransactionCosts
+            self.updateCostArrays()
         else:
             raise Exception('ERROR: Transaction costs must be a dictionary of asset names and costs')
     
     def setBorrowCosts(self,fixedBorrowCosts):
         if isinstance(fixedBorrowCosts,dict):
             self.borrowCosts = fixedBorrowCosts
+            self.updateCostArrays()
         else:
             raise Exception('ERROR: Borrow costs must be a dictionary of asset names and annualized costs')
     
     def setSlippageModel(self,slippageModel):
-        validSlippageModels = ['squarerootimpact']
+        # A model name from slippageModels, using the impact parameters, or a SlippageModel object
+        # A SlippageModel object keeps its own parameters, setImpactParams never changes them
+        self.slippageEngine = createSlippageModel(slippageModel,self.impactParams)
+        self.slippageModel = self.slippageEngine.name
+        self.ownsSlippageEngine = not isinstance(slippageModel,SlippageModel)
 
-        if slippageModel in validSlippageModels:
-            self.slippageModel = slippageModel
-        else:
-            raise Exception(f'ERROR: Choose from {",".join(validSlippageModels)}')
-    
     def setImpactParams(self,impactParams):
         if isinstance(impactParams,dict):
             self.impactParams = impactParams
+            if self.ownsSlippageEngine:
+                self.slippageEngine.setParams(impactParams)
         else:
             raise Exception('ERROR: Impact Parameters must be a dictionary')
     
     def setAnnualManagementFee(self,annualManagementFee):
         self.annualManagementFee = annualManagementFee
 
+    def setDatadumpFormat(self,datadumpFormat,flushInterval=250):
+        # 'json' writes one file per day, the other formats batch days into a single journal file
+        validDatadumpFormats = ['json'] + list(journalFormats.keys())
+
+        if datadumpFormat in validDatadumpFormats:
+            self.datadumpFormat = datadumpFormat
+            self.journalFlushInterval = flushInterval
+        else:
+            raise Exception(f'ERROR: Choose from {",".join(validDatadumpFormats)}')
+
+    def setAssetUniverse(self,assets):
+        # Fixes the asset to index mapping used by array price rows and target weights
+        # Assets already known keep their index, new ones are appended in the given order
+        self.addAssets(list(assets))
+
+    def setStatisticsFrequency(self,statisticsFrequency):
+        # Record performance statistics every k sign offs, or only at the end of the backtest
+        if statisticsFrequency == 'end' or (isinstance(statisticsFrequency,int) and statisticsFrequency > 0):
+            self.statisticsFrequency = statisticsFrequency
+        else:
+            raise Exception('ERROR: Statistics frequency must be a positive integer or \'end\'')
+
+    def setCheckpointFrequency(self,checkpointFrequency,checkpointPath=None):
+        # Write a checkpoint every k sign offs, None to disable
+        if checkpointFrequency is None or (isinstance(checkpointFrequency,int) and checkpointFrequency > 0):
+            self.checkpointFrequency = checkpointFrequency
+            self.checkpointPath = checkpointPath
+        else:
+            raise Exception('ERROR: Checkpoint frequency must be a positive integer or None')
+
+    def setRebalanceSchedule(self,rebalanceSchedule):
+        if isinstance(rebalanceSchedule,RebalanceSchedule):
+            self.rebalanceSchedule = rebalanceSchedule
+        else:
+            raise Exception('ERROR: Rebalance schedule must be a RebalanceSchedule object')
+
     def setFirstRebalanceDate(self,date):
         if isinstance(date,pd.Timestamp):
             self.FirstRebalanceDate = date
@@ -311,112 +581,179 @@ class Portfolio:
         self.slippageCosts = slippageCosts
         
     # Analytics methods
-    def plotNAV(self):
-        return getNAVPlot(self)
+    def plotNAV(self,points=None,method='minmax'):
+        return getNAVPlot(self,points,method)
 
-    def plotWeights(self):
-        return getWeightsPlot(self)
+    def plotWeights(self,top=10,points=None,method='minmax'):
+        return getWeightsPlot(self,top,points,method)
 
     # Portfolio Object Methods
-    def buy(self,asset,quantity,lastPriceMap):
-        if asset in self.getAssetsInPortfolio():
-            self.positions[asset] += quantity
-            if self.getAssetPosition(asset) < 0:
+    def getAssetPrice(self,asset,lastPriceMap):
+        if isinstance(lastPriceMap,np.ndarray):
+            return lastPriceMap[self.assetIndex[asset]]
+        else:
+            return lastPriceMap[asset]
+
+    def buy(self,asset,quantity,lastPriceMap,date=None):
+        self.addAssets([asset])
+        i = self.assetIndex[asset]
+        self.tradeLedger.record(date,i,quantity,self.getAssetPrice(asset,lastPriceMap))
+
+        if self.heldMask[i]:
+            self.positionArray[i] += quantity
+            if self.positionArray[i] < 0:
                 # Adjust cash account if asset still has an overall short position
-                self.setCash(self.getCash() + (-1 * self.getAssetPosition(asset) * lastPriceMap[asset]))
+                self.setCash(self.getCash() + (-1 * self.positionArray[i] * self.getAssetPrice(asset,lastPriceMap)))
         else:
-            self.positions[asset] = quantity
+            self.positionArray[i] = quantity
+            self.heldMask[i] = True
     
-    def sell(self,asset,quantity,lastPriceMap):
-        if asset in self.getAssetsInPortfolio():
-            self.positions[asset] -= quantity
-            if self.getAssetPosition(asset) < 0:
+    def sell(self,asset,quantity,lastPriceMap,date=None):
+        self.addAssets([asset])
+        i = self.assetIndex[asset]
+        self.tradeLedger.record(date,i,-1 * quantity,self.getAssetPrice(asset,lastPriceMap))
+
+        if self.heldMask[i]:
+            self.positionArray[i] -= quantity
+            if self.positionArray[i] < 0:
                 # Adjust cash account if asset still has an overall short position
-                self.setCash(self.getCash() + (-1 * self.getAssetPosition(asset) * lastPriceMap[asset]))
+                self.setCash(self.getCash() + (-1 * self.positionArray[i] * self.getAssetPrice(asset,lastPriceMap)))
         else:
-            self.positions[asset] = -1 * quantity
-            self.setCash(self.getCash() + (quantity * lastPriceMap[asset]))
+            self.positionArray[i] = -1 * quantity
+            self.heldMask[i] = True
+            self.setCash(self.getCash() + (quantity * self.getAssetPrice(asset,lastPriceMap)))
     
     def calcDailyBorrowCost(self,lastPriceMap):
-        # Initialize Zero Costs
-        borrowCostCollector = 0.0
-        
-        # Check if portfolio positions are empty
-        if len(self.positions) > 0:
-            for asset,position in self.positions.items():
-                # Only short positions incur borrow costs (annualized)
-                if position < 0 :
-                    borrowCostCollector += abs(position * lastPriceMap[asset] * ((1 + self.getBorrowCost(asset)) ** (1/260) - 1))
-
-        return borrowCostCollector
+        # Only short positions incur borrow costs (annualized)
+        prices = self.getPriceVector(lastPriceMap)
+        isShort = self.heldMask & (self.positionArray < 0)
+
+        return float(np.abs(self.positionArray[isShort] * prices[isShort] * self.dailyBorrowRateArray[isShort]).sum())
     
+    @instrumented('signOff')
     def signOff(self,date,lastPriceMap):
         # Add annual management fees
-        managementFee = self.getNAV(lastPriceMap) * ((1 + self.getAnnualManagementFee()) ** (1/260) - 1)
+        with self.profile('signOff.fees'):
+            prices = self.getPriceVector(lastPriceMap)
+            positionValues = self.getPositionValues(prices)
+            managementFee = (float(positionValues.sum()) + self.getCash()) * ((1 + self.getAnnualManagementFee()) ** (1/260) - 1)
         
         # TODO: Compute net interest in cash account
         # interestCash = self.getCash() * overnightLIBOR * (1/252)
 
         # Add Borrow Costs
-        borrowCosts = self.calcDailyBorrowCost(lastPriceMap)
+        with self.profile('signOff.borrowCosts'):
+            borrowCosts = self.calcDailyBorrowCost(prices)
 
         self.setCash(self.getCash() - managementFee - borrowCosts)
 
-        # Historical daily states
-        self.historicalPositions[date] = copy.deepcopy(self.getPositions())
-        self.historicalNAV[date] = float(copy.deepcopy(self.getNAV(lastPriceMap)))
-        self.historicalWeights[date] = copy.deepcopy(self.getWeights(lastPriceMap))
-        self.historicalTCosts[date] = float(copy.deepcopy(self.getTransactionCosts()))
-        self.historicalSlippageCosts[date] = float(copy.deepcopy(self.getSlippageCosts()))
-        self.historicalBorrowCosts[date] = float(copy.deepcopy(borrowCosts))
-        self.historicalCash[date] = float(copy.deepcopy(self.getCash()))
-
-        # Compute Performance Statistics
-        self.performanceStatistics[date] = performanceSummary(
-            self.historicalNAV,
-            self.historicalWeights,
-            self.historicalPositions,
-            self.historicalTCosts,
-            self.historicalSlippageCosts)
+        # Historical daily states, snapshotted into the columnar history store
+        # History columns follow the asset universe, assets outside the portfolio are NaN
+        with self.profile('signOff.history'):
+            currentNAV = float(positionValues.sum()) + self.getCash()
+            weights = positionValues / currentNAV
+
+            if len(self.history.assets) < len(self.assets):
+                self.history.addAssets(self.assets[len(self.history.assets):])
+
+            self.history.append(
+                date,
+                {
+                    'NAV'           : currentNAV,
+                    'TCosts'        : self.getTransactionCosts(),
+                    'SlippageCosts' : self.getSlippageCosts(),
+                    'BorrowCosts'   : borrowCosts,
+                    'Cash'          : self.getCash()
+                },
+                slice(0,len(self.assets)),
+                {
+                    'Positions'     : np.where(self.heldMask,self.positionArray,np.nan),
+                    'Weights'       : np.where(self.heldMask,weights,np.nan)
+                })
+
+        # Update running performance statistics in constant time
+        with self.profile('signOff.performance'):
+            self.performanceAccumulator.update(date,currentNAV,self.getTransactionCosts())
+
+            if self.statisticsFrequency != 'end' and self.performanceAccumulator.count % self.statisticsFrequency == 0:
+                self.performanceStatistics[date] = self.getAccumulatedStatistics()
 
         # Serialize Data
         if self.datadump == True:
-            dataDump = self.getBacktestFolderName() + '/' + date.strftime('%Y-%m-%d') + '.json'
-
-            dailyNode = [{
-                'Date'                 : date.strftime('%Y-%m-%d'),
-                'NAV'                  : self.historicalNAV[date],
-                'Cash'                 : self.getCash(),
-                'FirstRebalanceDate'   : self.getFirstRebalanceDate(),
-                'LastRebalanceDate'    : self.getLastRebalanceDate(),
-                'TransactionCosts'     : self.getTransactionCosts(),
-                'FixedTransactionCosts': self.getAllFixedTransactionCosts(),
-                'DailyBorrowCost'      : self.historicalBorrowCosts[date],
-                'SlippageModel'        : self.getSlippageModel(),
-                'Positions'            : self.getPositions(),
-                'Weights'              : self.getWeights(lastPriceMap),
-                'Performance'          : self.performanceStatistics[date],
-                'CustomData'           : self.getCustomDataByDate(date)
-            }]
-
-            # TODO: Fix date serialization instead of string defaults
-            with open(dataDump,'w') as fd:
-                fd.write(json.dumps(dailyNode, indent=2, default=str))
+            with self.profile('signOff.serialization'):
+                # Statistics are only accumulated again on days the frequency did not already store them
+                performance = self.performanceStatistics.get(date)
+                if performance is None:
+                    performance = self.getAccumulatedStatistics()
+
+                dailyNode = {
+                    'Date'                 : date,
+                    'NAV'                  : currentNAV,
+                    'Cash'                 : self.getCash(),
+                    'FirstRebalanceDate'   : self.getFirstRebalanceDate(),
+                    'LastRebalanceDate'    : self.getLastRebalanceDate(),
+                    'TransactionCosts'     : self.getTransactionCosts(),
+                    'SlippageCosts'        : self.getSlippageCosts(),
+                    'FixedTransactionCosts': self.getAllFixedTransactionCosts(),
+                    'DailyBorrowCost'      : borrowCosts,
+                    'SlippageModel'        : self.getSlippageModel(),
+                    'Positions'            : self.getPositions(),
+                    'Weights'              : {self.assets[i] : float(weights[i]) for i in np.flatnonzero(self.heldMask)},
+                    'Performance'          : performance,
+                    'CustomData'           : self.getCustomDataByDate(date)
+                }
+
+                createFolder(self.getBacktestFolderName())
+                if self.datadumpFormat == 'json':
+                    dataDump = self.getBacktestFolderName() + '/' + date.strftime('%Y-%m-%d') + '.json'
+                    dailyNode['Date'] = date.strftime('%Y-%m-%d')
+
+                    with open(dataDump,'w') as fd:
+                        fd.write(json.dumps([dailyNode], indent=2, cls=JournalEncoder))
+                else:
+                    if self.journal is None:
+                        self.openJournal()
+                    self.journal.record(dailyNode)
+
+        if self.checkpointFrequency is not None and self.performanceAccumulator.count % self.checkpointFrequency == 0:
+            with self.profile('signOff.checkpoint'):
+                self.saveCheckpoint()
+
+    def saveCheckpoint(self,path=None):
+        saveCheckpoint(self,path if path is not None else self.getCheckpointPath())
+
+    def saveToCatalog(self,catalog=None,params=None):
+        # Indexes the run in a results catalog, by default the one of the BackTestResults folder
+        if catalog is None:
+            catalog = ResultsCatalog(os.path.dirname(self.backtestFolderName))
+        return catalog.record(self,params)
+
+    def openJournal(self,state=None):
+        # state is the journal state of a checkpoint, for runs resumed from it
+        journalPath = self.getBacktestFolderName() + '/' + journalFormats[self.datadumpFormat]
+        self.journal = BacktestJournal(journalPath,self.datadumpFormat,self.journalFlushInterval,state)
+
+        # Make sure buffered days reach the file even if closeJournal is never called
+        weakref.finalize(self,self.journal.close)
+
+    def flushJournal(self):
+        if self.journal is not None:
+            self.journal.flush()
+
+    def closeJournal(self):
+        if self.journal is not None:
+            self.journal.close()
     
     # Default rebalance function
+    # Target weights are a dictionary of asset weights, or an array aligned to the asset universe
+    @instrumented('rebalance')
     def rebalance(self,targetWeights,lastPriceMap,date):
-        # Current NAV is the market to market using latest positions, current close prices and cash account
-        currentNAV = self.getNAV(lastPriceMap)
+        target = self.getTargetVector(targetWeights)
+        prices = self.getPriceVector(lastPriceMap)
+        inTarget = ~np.isnan(target)
 
-        # Clean up the cash account at every rebalance
-        # This assumes we buy lesser units when transaction costs are factored in rather than having residual cash balances
-        self.setCash(0.0)
-
-        # Initialize Slippage Costs
-        slippageCosts = 0.0
-
-        # Initialized Fixed Transaction Costs
-        tCosts = 0.0
+        # Current NAV is the market to market using latest positions, current close prices and cash account
+        currentNAV = self.getNAV(prices)
 
         # Save the most recent rebalance date
         self.LastRebalanceDate = date
@@ -426,103 +763,46 @@ class Portfolio:
             self.setFirstRebalanceDate(date)
         
         # Define the treatment of undefined assets which are previously in the portfolio
+        # Unwind assets not in target weights dictionary (unwinds are not charged costs)
         if self.unwindUndefinedAssetWeights == True:
-            for asset in self.getAssetsInPortfolio():
-                # Unwind assets not in target weights dictionary
-                if (asset in list(targetWeights.keys())) == False:
-
-                    if self.getAssetPosition(asset) > 0:
-                        self.sell(asset,self.getAssetPosition(asset),lastPriceMap[asset])
-                    else:
-                        self.buy(asset,-1*self.getAssetPosition(asset),lastPriceMap[asset])
-
-                    if len(self.fixedTransactionCosts) > 0:
-                        tCosts = abs(self.getAssetPosition(asset) * lastPriceMap[asset] * self.getFixedTransactionCosts(asset))
-                    
-                    if self.getSlippageModel() == 'squarerootimpact':
-                        impactParams = self.getImpactParams()
-                        ADV = impactParams[asset]['ADV']
-                        vol = impactParams[asset]['Volatility']
-                        spreadCost = impactParams[asset]['BidAskSpread']
-                        scalingFactor = impactParams[asset]['ScalingFactor']
-
-                        slippage = spreadCost + scalingFactor*(1/math.sqrt(252))*vol*math.sqrt(abs(self.getAssetPosition(asset))/ADV)
-
-                        slippageCosts = abs(self.getAssetPosition(asset)) * lastPriceMap[asset] * slippage
-
-                        # Account for slippage in cash account
-                        self.setCash(self.getCash() - slippageCosts)
-
-                        # Add to cumulative transaction costs
-                        self.setSlippageCosts(self.getSlippageCosts + slippageCosts)
-
-        # Loop through all target trade intentions
-        for asset in targetWeights:
-            singleAssetTargetUnits = targetWeights[asset] * currentNAV / lastPriceMap[asset]
-
-            if asset in self.getPositions():
-                unitsToTrade = singleAssetTargetUnits - self.getAssetPosition(asset)
-            else:
-                unitsToTrade = singleAssetTargetUnits
-
-            # Note: Sell/Buy function only accept POSITIVE quantities, the sign is handled in the methods
-            if unitsToTrade >= 0:
-                self.buy(asset,unitsToTrade,lastPriceMap)
-            
-            else:
-                self.sell(asset,-1*unitsToTrade,lastPriceMap)
+            unwound = np.flatnonzero(self.heldMask & ~inTarget & (self.positionArray != 0))
+            self.tradeLedger.record(date,unwound,-1 * self.positionArray[unwound],prices[unwound])
+            self.positionArray[self.heldMask & ~inTarget] = 0.0
 
-            # Account for fixed transaction costs
-            if len(self.fixedTransactionCosts) > 0:
+        # All target trade intentions at once
+        with self.profile('rebalance.trades'):
+            targetUnits = np.where(inTarget,target * currentNAV / prices,self.positionArray)
+            unitsToTrade = np.where(inTarget,targetUnits - self.positionArray,0.0)
 
-                tCosts = abs(unitsToTrade) * lastPriceMap[asset] * self.getFixedTransactionCosts(asset)
+            # Updated in place, the arrays may be rows of a PortfolioBook matrix
+            self.positionArray[:] = targetUnits
+            self.heldMask |= inTarget
 
-                # Deduct transaction costs from cash account
-                self.setCash(self.getCash() - tCosts)
+            tradeValue = np.abs(unitsToTrade[inTarget]) * prices[inTarget]
 
-                # Add to cumulative transaction costs
-                self.setTransactionCosts(self.getTransactionCosts() + tCosts)
+        with self.profile('rebalance.costs'):
+            # Account for fixed transaction costs
+            traded = np.flatnonzero(inTarget)
+            fixedCosts = tradeValue * self.fixedTransactionCostArray[inTarget]
+            tCosts = float(fixedCosts.sum())
 
             # Account for slippage costs
-            if self.getSlippageModel() == 'squarerootimpact':
-                impactParams = self.getImpactParams()
-                ADV = impactParams[asset]['ADV']
-                vol = impactParams[asset]['Volatility']
-                spreadCost = impactParams[asset]['BidAskSpread']
-                scalingFactor = impactParams[asset]['ScalingFactor']
-
+            slippage = np.zeros(len(traded))
+            if self.slippageEngine is not None:
                 # Do not account for the impact of funding portfolio in slippage
-                if date == self.getFirstRebalanceDate():
-                    slippage = 0.0
-                else:
-                    slippage = spreadCost + scalingFactor*(1/math.sqrt(252))*vol*math.sqrt(abs(self.getAssetPosition(asset))/ADV)
-                
-                slippageCosts = abs(unitsToTrade) * lastPriceMap[asset] * slippage
-
-                # Deduct slippage from cash account
-                self.setCash(self.getCash() - slippageCosts)
-
-                # Add to cumulative slippage costs
-                self.setSlippageCosts(self.getSlippageCosts() + slippageCosts)
-
-        # Account for leverage in the portfolio
-        # Check long positions and how much cash we need to borrow against
-        longPositions = sum([targetWeights[asset] if targetWeights[asset] > 0 else 0 for asset in targetWeights])
-
-        excessCash = (1.0 - longPositions) * currentNAV
-
-        # Adjust cash account
-        self.setCash(self.getCash() + excessCash)
-
+                if date != self.getFirstRebalanceDate():
+                    slippage = self.slippageEngine.getCosts(self.assets,date,traded,tradeValue,unitsToTrade[traded],self.positionArray[traded])
+            slippageCosts = float(slippage.sum())
 
+        with self.profile('rebalance.ledger'):
+            filled = unitsToTrade[traded] != 0
+            self.tradeLedger.record(date,traded[filled],unitsToTrade[traded][filled],prices[traded][filled],fixedCosts[filled],slippage[filled])
 
+        # Add to cumulative transaction and slippage costs
+        self.setTransactionCosts(self.getTransactionCosts() + tCosts)
+        self.setSlippageCosts(self.getSlippageCosts() + slippageCosts)
 
-
-
-            
-
-
-
-        
-
-        
\ No newline at end of file
+        # Clean up the cash account at every rebalance
+        # This assumes we buy lesser units when transaction costs are factored in rather than having residual cash balances
+        # Short sale proceeds plus the unallocated (or borrowed) fraction of NAV are left in cash, net of costs
+        self.setCash(float((1.0 - target[inTarget].sum()) * currentNAV - tCosts - slippageCosts))
@@ -0,0 +1,109 @@
+import math
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .analytics import *
+
+# Bootstrap and Monte Carlo analytics on a backtest NAV series
+# Daily returns of the NAV are resampled into a (paths x dates) matrix, turned back into NAV
+# paths and summarized column-wise with pathPerformanceSummary, one batch of paths at a time.
+# Every batch draws from its own child of one SeedSequence, so a given seed gives the same
+# distribution whatever the number of processes.
+
+resamplingMethods = ['block','iid','normal']
+
+def blockBootstrapReturns(returns,numPaths,blockSize,rng):
+    # Moving block bootstrap: paths are built from randomly placed blocks of consecutive returns
+    numDates = len(returns)
+    blockSize = max(1,min(blockSize,numDates))
+    numBlocks = math.ceil(numDates / blockSize)
+
+    starts = rng.integers(0,numDates - blockSize + 1,size=(numPaths,numBlocks))
+    index = (starts[:,:,None] + np.arange(blockSize)).reshape(numPaths,numBlocks * blockSize)[:,:numDates]
+    return returns[index]
+
+def monteCarloReturns(returns,numPaths,rng):
+    # Gaussian returns with the sample mean and standard deviation of the history
+    return rng.normal(returns.mean(),returns.std(ddof=1),size=(numPaths,len(returns)))
+
+def resampleReturns(returns,numPaths,method,blockSize,rng):
+    if method == 'block':
+        return blockBootstrapReturns(returns,numPaths,blockSize,rng)
+    elif method == 'iid':
+        return blockBootstrapReturns(returns,numPaths,1,rng)
+    elif method == 'normal':
+        return monteCarloReturns(returns,numPaths,rng)
+    else:
+        raise Exception(f'ERROR: Choose from {",".join(resamplingMethods)}')
+
+def returnsToNAV(returnPaths,startNAV):
+    navPaths = np.empty((returnPaths.shape[0],returnPaths.shape[1] + 1))
+    navPaths[:,0] = startNAV
+    navPaths[:,1:] = startNAV * np.cumprod(1 + returnPaths,axis=1)
+    return navPaths
+
+def runResamplingBatch(returns,dates,startNAV,numPaths,method,blockSize,seed):
+    rng = np.random.default_rng(seed)
+    navPaths = returnsToNAV(resampleReturns(returns,numPaths,method,blockSize,rng),startNAV)
+    return pathPerformanceSummary(navPaths,dates)
+
+def navToArray(nav):
+    # Accepts a NAV Series, a single column NAV DataFrame (as getHistoricalNAV) or a {date : nav} dictionary
+    if isinstance(nav,pd.DataFrame):
+        nav = nav.iloc[:,0]
+    elif isinstance(nav,dict) or not isinstance(nav,pd.Series):
+        nav = pd.Series(dict(nav))
+    return nav.index,nav.to_numpy(dtype=np.float64)
+
+def resampleStatistics(nav,numPaths=10_000,method='block',blockSize=20,batchSize=1_000,processes=None,seed=0):
+    # Distribution of the performance statistics over resampled paths, one row per path
+    # processes > 1 (or None for all cores) spreads the batches over a process pool
+    dates,values = navToArray(nav)
+    returns = np.diff(values) / values[:-1]
+
+    if len(returns) < 2:
+        raise Exception('ERROR: Resampling needs at least three NAV observations')
+    if method not in resamplingMethods:
+        raise Exception(f'ERROR: Choose from {",".join(resamplingMethods)}')
+    if numPaths < 1:
+        raise Exception('ERROR: Number of paths must be at least 1')
+    if batchSize < 1:
+        raise Exception('ERROR: Batch size must be at least 1')
+    if blockSize < 1:
+        raise Exception('ERROR: Block size must be at least 1')
+
+    batchSizes = [min(batchSize,numPaths - start) for start in range(0,numPaths,batchSize)]
+    seeds = np.random.SeedSequence(seed).spawn(len(batchSizes))
+    batchArgs = [(returns,dates,values[0],size,method,blockSize,batchSeed) for size,batchSeed in zip(batchSizes,seeds)]
+
+    if processes == 1:
+        batches = [runResamplingBatch(*args) for args in batchArgs]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            batches = list(pool.map(runResamplingBatch,*zip(*batchArgs)))
+
+    distribution = pd.DataFrame({name : np.concatenate([batch[name] for batch in batches]) for name in batches[0]})
+    distribution.index.name = 'Path'
+    return distribution
+
+def confidenceIntervals(distribution,confidence=0.95,nav=None):
+    # Mean, median and two sided percentile interval of every statistic
+    # Given the original NAV, the point estimates of performanceSummary are shown alongside
+    lower,upper = (1 - confidence) / 2,1 - (1 - confidence) / 2
+
+    intervals = pd.DataFrame({
+        'Mean'                      : distribution.mean(),
+        'Median'                    : distribution.median(),
+        f'Lower {lower:.1%}'        : distribution.quantile(lower),
+        f'Upper {upper:.1%}'        : distribution.quantile(upper)
+    })
+
+    if nav is not None:
+        dates,values = navToArray(nav)
+        pointEstimates = pathPerformanceSummary(values[None,:],dates)
+        intervals.insert(0,'Point Estimate',pd.Series({name : value[0] for name,value in pointEstimates.items()}))
+
+    intervals.index.name = 'Statistic'
+    return intervals
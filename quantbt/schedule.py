@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+
+# Named calendar rules, each equivalent to checking date == offset.rollforward(date)
+scheduleOffsets = {
+    'daily'      : lambda weekday: pd.offsets.Day(),
+    'weekly'     : lambda weekday: pd.offsets.Week(weekday=weekday),
+    'monthend'   : lambda weekday: pd.offsets.MonthEnd(),
+    'bmonthend'  : lambda weekday: pd.offsets.BMonthEnd(),
+    'quarterend' : lambda weekday: pd.offsets.QuarterEnd(),
+    'bquarterend': lambda weekday: pd.offsets.BQuarterEnd(),
+    'yearend'    : lambda weekday: pd.offsets.YearEnd(),
+    'byearend'   : lambda weekday: pd.offsets.BYearEnd()
+}
+
+# Rebalance calendar precomputed once over a date index
+# The rule is evaluated for every date up front into a boolean mask, date membership checks
+# in the backtest loop are then set lookups instead of offset arithmetic
+#
+# rule can be
+#   - a name from scheduleOffsets, 'weekly' rebalances on the given weekday (0 = Monday)
+#   - 'every' : every N bars, counted from the first bar after the warmup
+#   - 'periodend' : last available bar of each pandas period of frequency freq ('W','M','Q',...),
+#     unlike the calendar rules this never misses a period whose last day is not a trading day
+#   - a pandas DateOffset
+#   - a callable taking the DatetimeIndex and returning a boolean mask
+#   - a list of rebalance dates
+# The first warmup bars are never rebalance dates, e.g. to wait for signal history
+class RebalanceSchedule:
+    def __init__(self,dates,rule='bmonthend',every=1,weekday=4,freq='M',warmup=0):
+        self.dates = pd.DatetimeIndex(dates)
+        self.rule = rule
+        self.every = every
+        self.weekday = weekday
+        self.freq = freq
+        self.warmup = warmup
+
+        self.mask = self.computeMask()
+        self.mask[:warmup] = False
+
+        self.index = np.flatnonzero(self.mask)
+        self.rebalanceDates = frozenset(self.dates[self.index])
+
+    def computeMask(self):
+        rule = self.rule
+        numDates = len(self.dates)
+
+        if isinstance(rule,str):
+            rule = rule.lower()
+
+            if rule == 'every':
+                if self.every < 1:
+                    raise Exception('ERROR: Rebalance interval must be at least one bar')
+                mask = np.zeros(numDates,dtype=bool)
+                mask[self.warmup::self.every] = True
+                return mask
+
+            elif rule == 'periodend':
+                # A bar is the last of its period when the next bar falls in another period
+                if numDates == 0:
+                    return np.zeros(0,dtype=bool)
+                periods = self.dates.tz_localize(None).to_period(self.freq).asi8
+                return np.append(periods[1:] != periods[:-1],True)
+
+            elif rule in scheduleOffsets:
+                return self.offsetMask(scheduleOffsets[rule](self.weekday))
+
+            else:
+                raise Exception(f'ERROR: Invalid rebalance rule {self.rule}')
+
+        elif isinstance(rule,pd.DateOffset):
+            return self.offsetMask(rule)
+
+        elif callable(rule):
+            mask = np.asarray(rule(self.dates),dtype=bool)
+            if mask.shape != (numDates,):
+                raise Exception('ERROR: Custom rebalance rule must return one flag per date')
+            return mask.copy()
+
+        else:
+            return self.dates.isin(pd.DatetimeIndex(rule))
+
+    def offsetMask(self,offset):
+        # Offsets are only evaluated once per distinct calendar day
+        days = self.dates.normalize()
+        uniqueDays = days.unique()
+        onOffset = np.array([offset.is_on_offset(day) for day in uniqueDays],dtype=bool)
+        return onOffset[uniqueDays.get_indexer(days)]
+
+    def getDates(self):
+        return self.dates[self.index]
+
+    def getIndex(self):
+        return self.index
+
+    def getMask(self,dates=None):
+        if dates is None or self.dates.equals(pd.DatetimeIndex(dates)):
+            return self.mask
+        # Align to another date index, dates outside the schedule are not rebalance dates
+        return pd.DatetimeIndex(dates).isin(self.getDates())
+
+    def isRebalanceDate(self,date):
+        return date in self.rebalanceDates
+
+    def isRebalanceIndex(self,i):
+        return bool(self.mask[i])
+
+    def __contains__(self,date):
+        return date in self.rebalanceDates
+
+    def __len__(self):
+        return len(self.index)
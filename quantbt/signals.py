@@ -0,0 +1,264 @@
+import numpy as np
+import pandas as pd
+
+# Streaming signal operators
+# Each operator is updated once per bar with a price row (an array aligned to its assets, or a
+# {asset : price} dictionary) and keeps its state in ring buffers, so an update costs O(assets)
+# whatever the window. compute() runs the same operator over a whole (dates x assets) history
+# in one vectorized pass for research.
+#
+# Windows count bars, like prices.tail(window) in the example notebooks. Values are NaN until
+# the window is full, and while the window holds a NaN price.
+
+# Fixed length window of rows over which the oldest row is overwritten first
+class RingBuffer:
+    def __init__(self,window,numAssets):
+        self.window = window
+        self.data = np.full((window,numAssets),np.nan)
+        self.head = 0
+        self.count = 0
+
+    def push(self,row):
+        # Returns the row falling out of the window, None while the buffer is filling up
+        evicted = self.data[self.head].copy() if self.count == self.window else None
+        self.data[self.head] = row
+        self.head = (self.head + 1) % self.window
+        self.count = min(self.count + 1,self.window)
+        return evicted
+
+    def isFull(self):
+        return self.count == self.window
+
+    def oldest(self):
+        return self.data[self.head] if self.isFull() else self.data[0]
+
+    def newest(self):
+        return self.data[(self.head - 1) % self.window]
+
+    def values(self):
+        return self.data if self.isFull() else self.data[:self.count]
+
+# Running sum over a ring buffer, tracking NaNs separately so they drop out with the window
+class RollingSum:
+    # Rebuild the running sums from the buffer every so often to stop rounding drift
+    refreshInterval = 1024
+
+    def __init__(self,window,numAssets):
+        self.buffer = RingBuffer(window,numAssets)
+        self.total = np.zeros(numAssets)
+        self.totalSquares = np.zeros(numAssets)
+        self.nanCount = np.zeros(numAssets,dtype=np.int64)
+        self.updates = 0
+
+    def push(self,row):
+        isNaN = np.isnan(row)
+        clean = np.where(isNaN,0.0,row)
+
+        evicted = self.buffer.push(row)
+        self.total += clean
+        self.totalSquares += clean * clean
+        self.nanCount += isNaN
+
+        if evicted is not None:
+            evictedNaN = np.isnan(evicted)
+            evictedClean = np.where(evictedNaN,0.0,evicted)
+            self.total -= evictedClean
+            self.totalSquares -= evictedClean * evictedClean
+            self.nanCount -= evictedNaN
+
+        self.updates += 1
+        if self.updates % self.refreshInterval == 0:
+            values = np.nan_to_num(self.buffer.values())
+            self.total = values.sum(axis=0)
+            self.totalSquares = (values * values).sum(axis=0)
+
+    def isFull(self):
+        return self.buffer.isFull()
+
+    def isValid(self):
+        return self.buffer.isFull() & (self.nanCount == 0)
+
+def rollingWindowSums(values,window):
+    # Sums of each trailing window via cumulative sums, NaN where the window is short or holds a NaN
+    isNaN = np.isnan(values)
+    clean = np.where(isNaN,0.0,values)
+    padding = np.zeros((1,values.shape[1]))
+
+    cumulative = np.concatenate([padding,np.cumsum(clean,axis=0)])
+    cumulativeSquares = np.concatenate([padding,np.cumsum(clean * clean,axis=0)])
+    cumulativeNaN = np.concatenate([padding,np.cumsum(isNaN,axis=0)])
+
+    total = np.full(values.shape,np.nan)
+    totalSquares = np.full(values.shape,np.nan)
+    if len(values) >= window:
+        total[window-1:] = cumulative[window:] - cumulative[:-window]
+        totalSquares[window-1:] = cumulativeSquares[window:] - cumulativeSquares[:-window]
+        hasNaN = (cumulativeNaN[window:] - cumulativeNaN[:-window]) > 0
+        total[window-1:][hasNaN] = np.nan
+        totalSquares[window-1:][hasNaN] = np.nan
+
+    return total,totalSquares
+
+class StreamingSignal:
+    def __init__(self,assets):
+        self.assets = list(assets)
+        self.numAssets = len(self.assets)
+        self.value = np.full(self.numAssets,np.nan)
+
+    def getPriceVector(self,prices):
+        if isinstance(prices,np.ndarray):
+            return prices.astype(np.float64,copy=False)
+        else:
+            return np.array([prices.get(asset,np.nan) for asset in self.assets],dtype=np.float64)
+
+    def getValue(self):
+        return self.value
+
+    def toDict(self):
+        return dict(zip(self.assets,self.value.tolist()))
+
+    def update(self,prices):
+        self.value = self.step(self.getPriceVector(prices))
+        return self.value
+
+    def compute(self,prices):
+        # Whole history in one pass, from a fresh state; returns the same type as given
+        values = prices.to_numpy(dtype=np.float64) if isinstance(prices,pd.DataFrame) else np.asarray(prices,dtype=np.float64)
+        result = self.computeArray(values)
+
+        if isinstance(prices,pd.DataFrame):
+            return pd.DataFrame(result,index=prices.index,columns=prices.columns)
+        return result
+
+    def computeArray(self,values):
+        # Fallback for operators without a closed form: replay the streaming update on a fresh copy
+        fresh = self.fresh()
+        return np.array([fresh.update(row).copy() for row in values]).reshape(values.shape)
+
+class RollingMean(StreamingSignal):
+    def __init__(self,assets,window):
+        super().__init__(assets)
+        self.window = window
+        self.sums = RollingSum(window,self.numAssets)
+
+    def fresh(self):
+        return RollingMean(self.assets,self.window)
+
+    def step(self,prices):
+        self.sums.push(prices)
+        return np.where(self.sums.isValid(),self.sums.total / self.window,np.nan)
+
+    def computeArray(self,values):
+        total,_ = rollingWindowSums(values,self.window)
+        return total / self.window
+
+# Sample standard deviation of simple returns over the last window bars (window - 1 returns),
+# as prices.tail(window).pct_change(1).std(ddof=ddof)
+class RollingReturnStd(StreamingSignal):
+    def __init__(self,assets,window,ddof=1):
+        super().__init__(assets)
+        self.window = window
+        self.ddof = ddof
+        self.lastPrices = None
+        self.sums = RollingSum(window - 1,self.numAssets)
+
+    def fresh(self):
+        return RollingReturnStd(self.assets,self.window,self.ddof)
+
+    def varianceFromSums(self,total,totalSquares):
+        count = self.window - 1
+        variance = (totalSquares - total * total / count) / (count - self.ddof)
+        return np.sqrt(np.maximum(variance,0.0))
+
+    def step(self,prices):
+        if self.lastPrices is None:
+            self.lastPrices = prices.copy()
+            return np.full(self.numAssets,np.nan)
+
+        returns = prices / self.lastPrices - 1
+        self.lastPrices = prices.copy()
+        self.sums.push(returns)
+
+        return np.where(self.sums.isValid(),self.varianceFromSums(self.sums.total,self.sums.totalSquares),np.nan)
+
+    def computeArray(self,values):
+        returns = np.full(values.shape,np.nan)
+        returns[1:] = values[1:] / values[:-1] - 1
+
+        result = np.full(values.shape,np.nan)
+        total,totalSquares = rollingWindowSums(returns[1:],self.window - 1)
+        result[1:] = self.varianceFromSums(total,totalSquares)
+        return result
+
+# Return over the last window bars, as prices.tail(window).iloc[-1] / prices.tail(window).iloc[0] - 1
+class MomentumRatio(StreamingSignal):
+    def __init__(self,assets,window):
+        super().__init__(assets)
+        self.window = window
+        self.buffer = RingBuffer(window,self.numAssets)
+
+    def fresh(self):
+        return MomentumRatio(self.assets,self.window)
+
+    def step(self,prices):
+        self.buffer.push(prices)
+        if not self.buffer.isFull():
+            return np.full(self.numAssets,np.nan)
+        return prices / self.buffer.oldest() - 1
+
+    def computeArray(self,values):
+        result = np.full(values.shape,np.nan)
+        if len(values) >= self.window:
+            result[self.window-1:] = values[self.window-1:] / values[:len(values)-self.window+1] - 1
+        return result
+
+# Exponentially weighted moving average, as prices.ewm(alpha=alpha,adjust=False,ignore_na=True).mean()
+# Either alpha or span (alpha = 2 / (span + 1)) must be given; NaN prices leave the average unchanged
+class EWMA(StreamingSignal):
+    def __init__(self,assets,span=None,alpha=None):
+        super().__init__(assets)
+        if alpha is None and span is None:
+            raise Exception('ERROR: EWMA needs either a span or an alpha')
+        self.span = span
+        self.alpha = alpha if alpha is not None else 2 / (span + 1)
+
+    def fresh(self):
+        return EWMA(self.assets,span=self.span,alpha=self.alpha)
+
+    def step(self,prices):
+        isNaN = np.isnan(prices)
+        blended = np.where(np.isnan(self.value),prices,self.alpha * prices + (1 - self.alpha) * self.value)
+        return np.where(isNaN,self.value,blended)
+
+    def computeArray(self,values):
+        # The recursion is inherently sequential, so run it row by row over whole asset vectors
+        result = np.empty(values.shape)
+        value = np.full(values.shape[1],np.nan)
+        for i,row in enumerate(values):
+            blended = np.where(np.isnan(value),row,self.alpha * row + (1 - self.alpha) * value)
+            value = np.where(np.isnan(row),value,blended)
+            result[i] = value
+        return result
+
+# 1.0 when the fast moving average is above the slow one, 0.0 otherwise (short = -1.0 for long/short)
+class Crossover(StreamingSignal):
+    def __init__(self,assets,fastWindow,slowWindow,short=0.0):
+        super().__init__(assets)
+        self.fastWindow = fastWindow
+        self.slowWindow = slowWindow
+        self.short = short
+        self.fast = RollingMean(assets,fastWindow)
+        self.slow = RollingMean(assets,slowWindow)
+
+    def fresh(self):
+        return Crossover(self.assets,self.fastWindow,self.slowWindow,self.short)
+
+    def signalFromMeans(self,fast,slow):
+        signal = np.where(fast > slow,1.0,self.short)
+        return np.where(np.isnan(fast) | np.isnan(slow),np.nan,signal)
+
+    def step(self,prices):
+        return self.signalFromMeans(self.fast.step(prices),self.slow.step(prices))
+
+    def computeArray(self,values):
+        return self.signalFromMeans(self.fast.computeArray(values),self.slow.computeArray(values))
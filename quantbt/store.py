@@ -0,0 +1,203 @@
+import os
+import json
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+# Binary, memory-mappable copy of a CSV price panel
+# A store version is a folder holding a raw float64 (dates x symbols) matrix, the date index
+# as int64 nanoseconds and a meta file with the symbol list and the source CSV stamp. Rows are
+# kept in date order, the rows of a CSV that is not sorted by date are sorted on conversion.
+# The store folder keeps its versions side by side, named after the CSV stamp, and a pointer
+# file naming the current one. A conversion is built in a temporary folder of its own, renamed
+# into a version and published by atomically replacing the pointer, so concurrent conversions
+# never clash and readers always find a complete store. The previous version is kept for
+# readers that read the pointer just before it was replaced.
+storePointer = 'current.json'
+
+def getCSVStamp(csvPath):
+    stat = os.stat(csvPath)
+    return {'size' : stat.st_size,'mtime' : stat.st_mtime_ns}
+
+def getStoreVersion(storePath):
+    # Name of the current version of a store, None when there is none
+    try:
+        with open(os.path.join(storePath,storePointer)) as fd:
+            return json.load(fd)['version']
+    except (OSError,ValueError,KeyError):
+        return None
+
+def publishStoreVersion(storePath,version):
+    fd,tempPath = tempfile.mkstemp(prefix='.pointer-',dir=storePath)
+    with os.fdopen(fd,'w') as pointer:
+        json.dump({'version' : version},pointer)
+    os.chmod(tempPath,0o644)
+    os.replace(tempPath,os.path.join(storePath,storePointer))
+
+def buildStoreVersion(csvPath,tempPath,stamp,chunkSize):
+    # Parse the CSV once, in row chunks, appending each chunk to the binary files
+    symbols = None
+    numRows = 0
+    lastDate = None
+    isSorted = True
+
+    with open(os.path.join(tempPath,'values.f64'),'wb') as valuesFile, open(os.path.join(tempPath,'dates.i8'),'wb') as datesFile:
+        for chunk in pd.read_csv(csvPath,index_col=[0],chunksize=chunkSize):
+            if symbols is None:
+                symbols = [str(symbol) for symbol in chunk.columns]
+
+            dates = pd.DatetimeIndex(pd.to_datetime(chunk.index)).as_unit('ns')
+            if dates.tz is not None:
+                dates = dates.tz_convert(None)
+
+            # Row order is only checked here, an unsorted CSV is sorted once it is fully written
+            if len(dates) > 0:
+                isSorted = isSorted and (lastDate is None or dates.asi8[0] >= lastDate) and bool((np.diff(dates.asi8) >= 0).all())
+                lastDate = dates.asi8[-1]
+
+            datesFile.write(np.ascontiguousarray(dates.asi8,dtype=np.int64).tobytes())
+            valuesFile.write(np.ascontiguousarray(chunk.to_numpy(dtype=np.float64)).tobytes())
+            numRows += len(chunk)
+
+    if not isSorted and len(symbols) > 0:
+        sortStoreRows(tempPath,numRows,len(symbols),chunkSize)
+
+    meta = {
+        'symbols' : symbols if symbols is not None else [],
+        'rows'    : numRows,
+        'source'  : stamp
+    }
+    with open(os.path.join(tempPath,'meta.json'),'w') as fd:
+        json.dump(meta,fd)
+
+def sortStoreRows(tempPath,numRows,numSymbols,chunkSize):
+    # Stable sort of the rows by date, so equal dates keep their CSV order
+    # Values are copied in row chunks, only the date index is held in memory
+    datesPath = os.path.join(tempPath,'dates.i8')
+    valuesPath = os.path.join(tempPath,'values.f64')
+    dates = np.fromfile(datesPath,dtype=np.int64)
+    order = np.argsort(dates,kind='stable')
+
+    values = np.memmap(valuesPath,dtype=np.float64,mode='r',shape=(numRows,numSymbols))
+    with open(valuesPath + '.sorted','wb') as valuesFile:
+        for start in range(0,numRows,chunkSize):
+            valuesFile.write(np.ascontiguousarray(values[order[start:start + chunkSize]]).tobytes())
+    del values
+
+    os.replace(valuesPath + '.sorted',valuesPath)
+    dates[order].tofile(datesPath)
+
+def convertCSVToStore(csvPath,storePath,chunkSize=100_000):
+    stamp = getCSVStamp(csvPath)
+    version = f'v-{stamp["size"]}-{stamp["mtime"]}'
+
+    os.makedirs(storePath,exist_ok=True)
+    previous = getStoreVersion(storePath)
+    tempPath = tempfile.mkdtemp(prefix='.tmp-',dir=storePath)
+    os.chmod(tempPath,0o755)
+
+    try:
+        buildStoreVersion(csvPath,tempPath,stamp,chunkSize)
+
+        # Another process converting the same CSV may have published this version already
+        try:
+            os.replace(tempPath,os.path.join(storePath,version))
+        except OSError:
+            if not os.path.exists(os.path.join(storePath,version,'meta.json')):
+                raise
+    finally:
+        shutil.rmtree(tempPath,ignore_errors=True)
+
+    publishStoreVersion(storePath,version)
+
+    # Older versions and the files of unversioned stores go, ignoring files still mapped elsewhere
+    for name in os.listdir(storePath):
+        path = os.path.join(storePath,name)
+        if name.startswith('v-') and name not in [version,previous]:
+            shutil.rmtree(path,ignore_errors=True)
+        elif name in ['meta.json','values.f64','dates.i8']:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+class MemoryMappedPriceStore:
+    def __init__(self,storePath):
+        self.storePath = storePath
+
+        # A version replaced and removed since the pointer was read is looked up again
+        for attempt in range(3):
+            self.versionPath = os.path.join(storePath,getStoreVersion(storePath) or '')
+            try:
+                with open(os.path.join(self.versionPath,'meta.json')) as fd:
+                    self.meta = json.load(fd)
+                break
+            except FileNotFoundError:
+                if attempt == 2:
+                    raise Exception(f'ERROR: No price store in {storePath}')
+
+        self.symbols = self.meta['symbols']
+        self.symbolIndex = {symbol : i for i,symbol in enumerate(self.symbols)}
+        numRows = self.meta['rows']
+
+        if numRows > 0 and len(self.symbols) > 0:
+            self.dates = np.memmap(os.path.join(self.versionPath,'dates.i8'),dtype=np.int64,mode='r',shape=(numRows,))
+            self.values = np.memmap(os.path.join(self.versionPath,'values.f64'),dtype=np.float64,mode='r',shape=(numRows,len(self.symbols)))
+        else:
+            self.dates = np.empty(0,dtype=np.int64)
+            self.values = np.empty((0,len(self.symbols)))
+
+    @staticmethod
+    def isCurrent(storePath,csvPath):
+        version = getStoreVersion(storePath)
+        if version is None:
+            return False
+
+        try:
+            with open(os.path.join(storePath,version,'meta.json')) as fd:
+                return json.load(fd)['source'] == getCSVStamp(csvPath)
+        except FileNotFoundError:
+            return False
+
+    def getSymbols(self):
+        return self.symbols
+
+    def getRowSlice(self,startDate=None,endDate=None):
+        # Dates are sorted when the store is built, so date ranges are resolved by binary search without parsing
+        start = 0 if startDate is None else np.searchsorted(self.dates,pd.Timestamp(startDate).value,side='left')
+        end = len(self.dates) if endDate is None else np.searchsorted(self.dates,pd.Timestamp(endDate).value,side='right')
+        return slice(start,end)
+
+    def getColumnIndex(self,columns=None):
+        if columns is None:
+            return slice(None)
+        return [self.symbolIndex[str(column)] for column in columns]
+
+    def getDateIndex(self,rows):
+        return pd.DatetimeIndex(np.asarray(self.dates[rows]).view('datetime64[ns]'))
+
+    def getFrame(self,columns=None,startDate=None,endDate=None):
+        rows = self.getRowSlice(startDate,endDate)
+        columnIndex = self.getColumnIndex(columns)
+
+        # Selecting all columns keeps the frame a view of the memory map
+        values = self.values[rows,columnIndex]
+        symbols = self.symbols if columns is None else [self.symbols[i] for i in columnIndex]
+
+        return pd.DataFrame(values,index=self.getDateIndex(rows),columns=symbols,copy=False)
+
+    def iterRows(self,columns=None,startDate=None,endDate=None,chunkSize=10_000):
+        # Lazily yields (date, {symbol : price}) pairs, reading the map one chunk at a time
+        rows = self.getRowSlice(startDate,endDate)
+        columnIndex = self.getColumnIndex(columns)
+        symbols = self.symbols if columns is None else [self.symbols[i] for i in columnIndex]
+
+        for chunkStart in range(rows.start,rows.stop,chunkSize):
+            chunkRows = slice(chunkStart,min(chunkStart + chunkSize,rows.stop))
+            dates = self.getDateIndex(chunkRows)
+            values = np.asarray(self.values[chunkRows,columnIndex])
+
+            for date,row in zip(dates,values.tolist()):
+                yield date,dict(zip(symbols,row))
@@ -0,0 +1,260 @@
+import os
+import json
+import time
+import asyncio
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from .book import *
+
+# Event driven runs of Portfolio objects on bars as they arrive
+# A bar source is any async iterator of (date, prices) pairs, prices being a {asset : price}
+# dictionary or an array aligned to the portfolios' asset universe. The runner reads the source
+# into a bounded queue; when the portfolios fall behind the queue fills up and the source is no
+# longer read, so a producer putting bars into a QueueBarSource waits (backpressure) and the
+# delay between a bar arriving and its sign off stays bounded by the queue size.
+#
+# On every bar the runner updates the streaming signals, asks the strategy for target weights of
+# each portfolio due a rebalance, rebalances and signs off. Several portfolios (or a
+# PortfolioBook) share one feed, and bars on or before the latest sign off of the portfolios are
+# skipped, so portfolios resumed from a checkpoint carry on from the next new bar.
+
+# In-process stand-in for a live feed, bars are put by the producer and read by the runner
+class QueueBarSource:
+    def __init__(self,maxsize=64):
+        self.queue = asyncio.Queue(maxsize)
+
+    async def put(self,date,prices):
+        # Waits while the queue is full
+        await self.queue.put((date,prices))
+
+    async def close(self):
+        await self.queue.put(None)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        bar = await self.queue.get()
+        if bar is None:
+            raise StopAsyncIteration
+        return bar
+
+# Replays a (dates x assets) price DataFrame or a {date : {asset : price}} dictionary as a feed
+class ReplayBarSource:
+    def __init__(self,prices):
+        if isinstance(prices,pd.DataFrame):
+            self.bars = ((date,row) for date,row in zip(prices.index,prices.to_numpy(dtype=np.float64)))
+        else:
+            self.bars = iter(prices.items())
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self.bars)
+        except StopIteration:
+            raise StopAsyncIteration
+
+# Follows a bar file as it is appended to, like tail -f
+#   .csv   a Date column followed by one price column per asset
+#   .jsonl one {"Date" : ..., asset : price, ...} object per line
+# Only complete lines are read. With follow=False the source ends at the end of the file,
+# otherwise it polls every pollInterval seconds until close() or idleTimeout seconds without data.
+class FileTailSource:
+    def __init__(self,path,follow=True,pollInterval=0.5,idleTimeout=None):
+        self.path = path
+        self.follow = follow
+        self.pollInterval = pollInterval
+        self.idleTimeout = idleTimeout
+        self.closed = False
+
+        self.position = 0
+        self.partial = ''
+        self.header = None
+        self.pending = deque()
+
+        extension = os.path.splitext(path)[1].lower()
+        if extension not in ['.csv','.jsonl']:
+            raise Exception('ERROR: Bar files must be .csv or .jsonl')
+        self.format = extension[1:]
+
+    def close(self):
+        self.closed = True
+
+    def parseLine(self,line):
+        if self.format == 'jsonl':
+            node = json.loads(line)
+            date = pd.Timestamp(node.pop('Date'))
+            return (date,{asset : float(price) for asset,price in node.get('Prices',node).items()})
+
+        fields = line.split(',')
+        if self.header is None:
+            self.header = fields
+            return None
+        prices = {asset : float(price) for asset,price in zip(self.header[1:],fields[1:]) if price != ''}
+        return (pd.Timestamp(fields[0]),prices)
+
+    def readLines(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path,'r') as fd:
+            fd.seek(self.position)
+            text = fd.read()
+            self.position = fd.tell()
+
+        lines = (self.partial + text).split('\n')
+        self.partial = lines.pop()
+        for line in lines:
+            line = line.strip()
+            if line != '':
+                bar = self.parseLine(line)
+                if bar is not None:
+                    self.pending.append(bar)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        idleSince = time.monotonic()
+        while len(self.pending) == 0:
+            if self.closed:
+                raise StopAsyncIteration
+
+            self.readLines()
+            if len(self.pending) > 0:
+                break
+
+            if not self.follow or (self.idleTimeout is not None and time.monotonic() - idleSince >= self.idleTimeout):
+                raise StopAsyncIteration
+            await asyncio.sleep(self.pollInterval)
+
+        return self.pending.popleft()
+
+# Runs portfolios on a bar source
+#   portfolios : a Portfolio, a list of them or a PortfolioBook
+#   strategy   : strategy(portfolio,date,prices,signals) -> target weights, or None to not trade;
+#                called on the portfolio's rebalance dates (every bar without a rebalance schedule)
+#   signals    : {name : StreamingSignal}, updated with every bar before the strategy is called
+#   queueSize  : bars buffered between the source and the portfolios
+#   maxLatency : seconds from arrival to sign off above which a bar is counted as late
+class StreamingRunner:
+    def __init__(self,portfolios,source,strategy,signals=None,queueSize=64,maxLatency=None,latencyWindow=10_000):
+        self.book = portfolios if isinstance(portfolios,PortfolioBook) else None
+        if self.book is not None:
+            self.portfolios = self.book.portfolios
+        elif isinstance(portfolios,(list,tuple)):
+            self.portfolios = list(portfolios)
+        else:
+            self.portfolios = [portfolios]
+
+        self.source = source
+        self.strategy = strategy
+        self.signals = signals if signals is not None else dict()
+        self.queueSize = queueSize
+        self.maxLatency = maxLatency
+
+        # Resume after the latest bar any of the portfolios has signed off
+        signedOff = [portfolio.getLastSignOffDate() for portfolio in self.portfolios if portfolio.getLastSignOffDate() is not None]
+        self.lastDate = max(signedOff) if len(signedOff) > 0 else None
+
+        # Latency of the latest latencyWindow bars, arrival to sign off and processing alone
+        self.latencies = deque(maxlen=latencyWindow)
+        self.processingTimes = deque(maxlen=latencyWindow)
+        self.barsProcessed = 0
+        self.barsSkipped = 0
+        self.lateBars = 0
+        self.queueHighWater = 0
+        self.sourceError = None
+
+    def processBar(self,date,prices):
+        for signal in self.signals.values():
+            signal.update(prices)
+
+        for portfolio in self.portfolios:
+            if portfolio.rebalanceSchedule is None or portfolio.isRebalanceDate(date):
+                targetWeights = self.strategy(portfolio,date,prices,self.signals)
+                if targetWeights is not None:
+                    portfolio.rebalance(targetWeights,prices,date)
+
+        if self.book is not None:
+            self.book.signOff(date,prices)
+        else:
+            for portfolio in self.portfolios:
+                portfolio.signOff(date,prices)
+
+    async def produce(self,queue):
+        # A failing source ends the run, its error is raised once the queued bars are processed
+        try:
+            async for date,prices in self.source:
+                await queue.put((date,prices,time.monotonic()))
+                self.queueHighWater = max(self.queueHighWater,queue.qsize())
+        except Exception as error:
+            self.sourceError = error
+        await queue.put(None)
+
+    async def consume(self,queue):
+        while True:
+            bar = await queue.get()
+            if bar is None:
+                return
+            date,prices,arrival = bar
+
+            if self.lastDate is not None and date <= self.lastDate:
+                self.barsSkipped += 1
+                continue
+
+            start = time.monotonic()
+            self.processBar(date,prices)
+            end = time.monotonic()
+
+            self.lastDate = date
+            self.barsProcessed += 1
+            self.processingTimes.append(end - start)
+            self.latencies.append(end - arrival)
+            if self.maxLatency is not None and end - arrival > self.maxLatency:
+                self.lateBars += 1
+
+            # Let the producer and other tasks run between bars
+            await asyncio.sleep(0)
+
+    async def run(self):
+        queue = asyncio.Queue(self.queueSize)
+        producer = asyncio.create_task(self.produce(queue))
+        try:
+            await self.consume(queue)
+        finally:
+            if not producer.done():
+                producer.cancel()
+            await asyncio.gather(producer,return_exceptions=True)
+
+        if self.book is not None:
+            self.book.flush()
+        if self.sourceError is not None:
+            raise self.sourceError
+        return self
+
+    def getLatencyStatistics(self):
+        latencies = np.array(self.latencies)
+        processingTimes = np.array(self.processingTimes)
+        hasBars = len(latencies) > 0
+
+        return {
+            'Bars Processed'          : self.barsProcessed,
+            'Bars Skipped'            : self.barsSkipped,
+            'Late Bars'               : self.lateBars,
+            'Queue High Water'        : self.queueHighWater,
+            'Mean Latency'            : float(latencies.mean()) if hasBars else np.nan,
+            'Median Latency'          : float(np.median(latencies)) if hasBars else np.nan,
+            '99th Percentile Latency' : float(np.percentile(latencies,99)) if hasBars else np.nan,
+            'Max Latency'             : float(latencies.max()) if hasBars else np.nan,
+            'Mean Processing Time'    : float(processingTimes.mean()) if hasBars else np.nan
+        }
+
+# Blocking helper for scripts, runs the portfolios until the source ends
+def runStreaming(portfolios,source,strategy,signals=None,queueSize=64,maxLatency=None):
+    runner = StreamingRunner(portfolios,source,strategy,signals,queueSize,maxLatency)
+    return asyncio.run(runner.run())
@@ -0,0 +1,96 @@
+import os
+import shutil
+import itertools
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+# Price panel shared by all backtests of a sweep, set up once per worker process
+sweepPrices = None
+
+def parameterGrid(grid):
+    # Dictionary of parameter lists is expanded in key order, last key varying fastest
+    if isinstance(grid,dict):
+        names = list(grid.keys())
+        return [dict(zip(names,values)) for values in itertools.product(*[grid[name] for name in names])]
+    else:
+        return [dict(params) for params in grid]
+
+def initSweepWorker(pricesPath,index,columns):
+    # Workers map the price matrix read-only from disk instead of receiving a pickled copy
+    global sweepPrices
+    values = np.load(pricesPath,mmap_mode='r')
+    sweepPrices = pd.DataFrame(values,index=index,columns=columns,copy=False)
+
+def runSweepTask(strategy,runId,params):
+    port = strategy(sweepPrices,**params)
+
+    stats = port.getPerformanceStatistics(historical=False).iloc[0].to_dict()
+    nav = port.getHistoricalNAV().iloc[:,0]
+
+    return runId,stats,nav.index.to_numpy(),nav.to_numpy(copy=True)
+
+def reportProgress(progress,done,total):
+    if callable(progress):
+        progress(done,total)
+    elif progress == True:
+        print(f'Sweep progress: {done}/{total}',end='\r' if done < total else '\n')
+
+# Run one backtest per parameter set in a process pool
+# The strategy is called as strategy(prices,**params) and must return a Portfolio-like object;
+# it has to be picklable (defined at module level) to be sent to the workers
+# Given a ResultsCatalog, every run is also recorded in it with its parameters, statistics and NAV
+def parameterSweep(strategy,grid,prices,processes=None,progress=True,catalog=None,name='Sweep'):
+    global sweepPrices
+
+    paramSets = parameterGrid(grid)
+    total = len(paramSets)
+    results = dict()
+
+    if processes == 1:
+        sweepPrices = prices
+        try:
+            for runId,params in enumerate(paramSets):
+                results[runId] = runSweepTask(strategy,runId,params)
+                reportProgress(progress,len(results),total)
+        finally:
+            sweepPrices = None
+    else:
+        tempFolder = tempfile.mkdtemp(prefix='quantbt-sweep-')
+        pricesPath = os.path.join(tempFolder,'prices.npy')
+
+        try:
+            np.save(pricesPath,prices.to_numpy(dtype=np.float64))
+
+            with ProcessPoolExecutor(
+                max_workers=processes,
+                initializer=initSweepWorker,
+                initargs=(pricesPath,prices.index,prices.columns)) as pool:
+
+                futures = [pool.submit(runSweepTask,strategy,runId,params) for runId,params in enumerate(paramSets)]
+
+                for future in as_completed(futures):
+                    runId,stats,dates,nav = future.result()
+                    results[runId] = (runId,stats,dates,nav)
+                    reportProgress(progress,len(results),total)
+        finally:
+            shutil.rmtree(tempFolder,ignore_errors=True)
+
+    # Deterministic output in parameter grid order, whatever the completion order
+    summary = []
+    navs = dict()
+    for runId in range(total):
+        _,stats,dates,nav = results[runId]
+        summary.append({**paramSets[runId],**stats})
+        navs[runId] = pd.Series(nav,index=dates)
+
+        if catalog is not None:
+            catalog.recordRun(name,paramSets[runId],stats,navs[runId].rename('NAV'))
+
+    summary = pd.DataFrame(summary,index=pd.RangeIndex(total,name='Run'))
+    navs = pd.DataFrame(navs)
+    navs.columns.name = 'Run'
+
+    return [summary,navs]
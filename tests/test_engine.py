@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+
+from quantbt import *
+
+numDates = 300
+assets = ['a','b','c','d','e']
+
+def makePanel(seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range('2015-01-01',periods=numDates)
+    prices = pd.DataFrame(100 * np.exp(np.cumsum(rng.normal(0,0.01,(numDates,len(assets))),axis=0)),index=dates,columns=assets)
+
+    # Long short targets every 21 days, asset e only enters halfway and is then unwound
+    weights = pd.DataFrame(np.nan,index=dates,columns=assets)
+    for i in range(0,numDates,21):
+        target = rng.normal(0,0.3,len(assets))
+        if i < numDates // 2:
+            target[-1] = np.nan
+        elif i > 3 * numDates // 4:
+            target[-2:] = np.nan
+        weights.iloc[i] = target
+    return [prices,weights]
+
+def configure(portfolio):
+    portfolio.setFixedTransactionCosts({asset : 0.0005 * (i + 1) for i,asset in enumerate(assets)})
+    portfolio.setBorrowCosts({asset : 0.01 * (i + 1) for i,asset in enumerate(assets)})
+    portfolio.setAnnualManagementFee(0.01)
+    portfolio.setImpactParams({'Bps' : {asset : 2.0 + i for i,asset in enumerate(assets)}})
+    portfolio.setSlippageModel('fixedbps')
+
+def test_vectorized_portfolio_matches_event_driven_portfolio(tmp_path):
+    prices,weights = makePanel()
+
+    vectorized = VectorizedPortfolio({},1e6,name='vectorized')
+    configure(vectorized)
+    vectorized.run(prices,weights)
+
+    portfolio = Portfolio({},1e6,name='event',backtestFolderName=str(tmp_path))
+    configure(portfolio)
+    for date,row in prices.iterrows():
+        lastPriceMap = row.to_dict()
+        target = weights.loc[date].dropna()
+        if len(target) > 0:
+            portfolio.rebalance(target.to_dict(),lastPriceMap,date)
+        portfolio.signOff(date,lastPriceMap)
+
+    nav = portfolio.getHistoricalNAV().iloc[:,0].to_numpy()
+    assert np.allclose(vectorized.getHistoricalNAV().iloc[:,0].to_numpy(),nav,rtol=0,atol=1e-9 * nav.max())
+    assert np.allclose(vectorized.getHistoricalCash().iloc[:,0].to_numpy(),portfolio.getHistoricalCash().iloc[:,0].to_numpy(),rtol=0,atol=1e-9 * nav.max())
+
+    for vectorizedCosts,costs in [
+        [vectorized.getHistoricalTCosts(),portfolio.getHistoricalTCosts()],
+        [vectorized.getHistoricalSlippageCosts(),portfolio.getHistoricalSlippageCosts()],
+        [vectorized.getHistoricalBorrowCosts(),portfolio.getHistoricalBorrowCosts()]]:
+        assert np.allclose(vectorizedCosts.iloc[:,0].to_numpy(),costs.iloc[:,0].to_numpy(),rtol=1e-9,atol=1e-9)
+    assert portfolio.getHistoricalSlippageCosts().iloc[-1,0] > 0
+
+    historicalWeights = portfolio.getHistoricalWeights().reindex(columns=assets).fillna(0.0).to_numpy()
+    assert np.allclose(np.nan_to_num(vectorized.getHistoricalWeights().to_numpy()),historicalWeights,rtol=0,atol=1e-12)
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+
+from quantbt import *
+
+def runPortfolio(numDates,numAssets,seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range('2000-01-03',periods=numDates + 50)
+    prices = 100 * np.exp(np.cumsum(rng.normal(0,0.01,(numDates + 50,numAssets)),axis=0))
+
+    portfolio = Portfolio({},1e6,name='base')
+    portfolio.setAssetUniverse(range(numAssets))
+    for i in range(numDates):
+        if i % 21 == 0:
+            portfolio.rebalance(np.full(numAssets,1 / numAssets),prices[i],dates[i])
+        portfolio.signOff(dates[i],prices[i])
+    portfolio.getAccumulatedStatistics()
+    return [portfolio,dates,prices]
+
+def countSharedRowsRead(store):
+    # Rows read from the shared base of a forked HistoryStore
+    counter = {'rows' : 0}
+    base = store.base
+    getMatrixRows = base.getMatrixRows
+
+    def countingGetMatrixRows(name,start,stop):
+        counter['rows'] += max(stop - start,0)
+        return getMatrixRows(name,start,stop)
+
+    base.getMatrixRows = countingGetMatrixRows
+    return counter
+
+def test_fork_sign_off_does_not_read_shared_history():
+    for numDates in [200,2000]:
+        parent,dates,prices = runPortfolio(numDates,20)
+        forked = parent.fork('fork')
+        forkedRows = countSharedRowsRead(forked.history)
+        parentRows = countSharedRowsRead(parent.history)
+
+        for portfolio in [forked,parent]:
+            for i in range(numDates,numDates + 30):
+                portfolio.signOff(dates[i],prices[i])
+                portfolio.getAccumulatedStatistics()
+
+        assert forkedRows['rows'] == 0
+        assert parentRows['rows'] == 0
+
+def test_fork_statistics_match_unforked_run():
+    parent,dates,prices = runPortfolio(300,10)
+    forked = parent.fork('fork')
+    reference,_,_ = runPortfolio(300,10)
+
+    for i in range(300,330):
+        for portfolio in [forked,reference]:
+            if i == 310:
+                portfolio.rebalance(np.full(10,0.05),prices[i],dates[i])
+            portfolio.signOff(dates[i],prices[i])
+
+    forkedStats = forked.getPerformanceStatistics().iloc[0]
+    referenceStats = reference.getPerformanceStatistics().iloc[0]
+    assert np.allclose(forkedStats.to_numpy(dtype=np.float64),referenceStats.to_numpy(dtype=np.float64),equal_nan=True)
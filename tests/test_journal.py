@@ -0,0 +1,78 @@
+import io
+import struct
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from quantbt import *
+
+numDates = 200
+checkpointDate = 100
+crashDate = 160
+
+def makeMarket():
+    rng = np.random.default_rng(1)
+    dates = pd.bdate_range('2020-01-01',periods=numDates)
+    prices = 100 * np.exp(np.cumsum(rng.normal(0,0.01,(numDates,3)),axis=0))
+    return [dates,prices]
+
+def makePortfolio(folder,datadumpFormat):
+    portfolio = Portfolio({},1e6,name='journal',datadump=True,backtestFolderName=str(folder))
+    portfolio.setAssetUniverse(['a','b','c'])
+    portfolio.setDatadumpFormat(datadumpFormat,flushInterval=25)
+    return portfolio
+
+def step(portfolio,dates,prices,i):
+    if i % 20 == 0:
+        portfolio.rebalance(np.array([0.3,0.3,0.4]),prices[i],dates[i])
+    portfolio.signOff(dates[i],prices[i])
+
+def countJournalRecords(path,datadumpFormat):
+    # Records in the files, JournalReader would fold duplicated dates into one row
+    if datadumpFormat == 'jsonl':
+        with open(path) as fd:
+            return sum(1 for line in fd if line.strip() != '')
+    elif datadumpFormat == 'npz':
+        numRecords = 0
+        with open(path,'rb') as fd:
+            while len(header := fd.read(8)) == 8:
+                with np.load(io.BytesIO(fd.read(struct.unpack('<Q',header)[0]))) as batch:
+                    numRecords += len(batch['Date'])
+        return numRecords
+    else:
+        import pyarrow.parquet as pq
+        return sum(pq.ParquetFile(partPath).metadata.num_rows for partPath in getJournalPartPaths(path))
+
+@pytest.mark.parametrize('datadumpFormat',['jsonl','npz','parquet'])
+def test_resumed_journal_matches_uninterrupted_run(tmp_path,datadumpFormat):
+    if datadumpFormat == 'parquet':
+        pytest.importorskip('pyarrow')
+    dates,prices = makeMarket()
+
+    reference = makePortfolio(tmp_path / 'reference',datadumpFormat)
+    for i in range(numDates):
+        step(reference,dates,prices,i)
+    reference.closeJournal()
+
+    # Checkpoint at checkpointDate, then days up to crashDate reach the journal before the run dies
+    crashed = makePortfolio(tmp_path / 'crashed',datadumpFormat)
+    checkpointPath = str(tmp_path / 'checkpoint.npz')
+    for i in range(crashDate):
+        step(crashed,dates,prices,i)
+        if i == checkpointDate - 1:
+            crashed.saveCheckpoint(checkpointPath)
+    crashed.closeJournal()
+
+    resumed = Portfolio.fromCheckpoint(checkpointPath)
+    for i in range(checkpointDate,numDates):
+        step(resumed,dates,prices,i)
+    resumed.closeJournal()
+
+    expected = readJournal(reference.getJournal().getPath())
+    journal = readJournal(resumed.getJournal().getPath())
+    assert countJournalRecords(resumed.getJournal().getPath(),datadumpFormat) == numDates
+    assert len(journal.getHistoricalNAV()) == numDates
+    assert journal.getHistoricalNAV().index.is_unique
+    assert np.allclose(journal.getHistoricalNAV().to_numpy(),expected.getHistoricalNAV().to_numpy())
+    assert np.allclose(journal.getHistoricalPositions().to_numpy(),expected.getHistoricalPositions().to_numpy(),equal_nan=True)